@@ -0,0 +1,285 @@
+"""Рассылка изменений выдачи подписчикам бота"""
+from __future__ import annotations
+import asyncio
+import html
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from app.parsers.rate_limit import TokenBucket
+from app.services.executor import get_scrape_executor
+from app.services.store import get_listing_store
+from app.services.watch import WatchDiff, poll
+
+logger = logging.getLogger(__name__)
+
+# Как часто опрашивать запросы с подписчиками (секунды)
+SUBSCRIPTION_POLL_INTERVAL = float(os.getenv("SUBSCRIPTION_POLL_INTERVAL", 300))
+# Сколько запросов опрашивать одновременно
+SUBSCRIPTION_POLL_CONCURRENCY = int(os.getenv("SUBSCRIPTION_POLL_CONCURRENCY", 2))
+# Лимиты Telegram: ~30 сообщений в секунду всего, 1 в секунду в личный чат, 20 в минуту в группу
+ALERT_GLOBAL_RATE = float(os.getenv("ALERT_GLOBAL_RATE", 25))
+ALERT_CHAT_INTERVAL = float(os.getenv("ALERT_CHAT_INTERVAL", 1.0))
+ALERT_GROUP_INTERVAL = float(os.getenv("ALERT_GROUP_INTERVAL", 3.0))
+ALERT_SENDERS = int(os.getenv("ALERT_SENDERS", 3))
+# Объявлений в одном сообщении
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", 10))
+
+# Scope снимков watch для подписок, отдельный от /api/watch
+ALERTS_SCOPE = "alerts"
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Сколько символов URL подписки показывать в заголовке сообщения
+ALERT_URL_LIMIT = 500
+
+
+def _price(value: int) -> str:
+    return f"{value:,} ₸".replace(",", " ")
+
+
+def _listing_line(item: Dict, link: bool = True) -> str:
+    title = html.escape(str(item.get("title", ""))[:80])
+    if link:
+        title = f"<a href=\"{html.escape(item.get('url', ''), quote=True)}\">{title}</a>"
+    line = f"• {title} — {_price(item['price'])}"
+    if item.get("old_price") is not None:
+        line += f" (было {_price(item['old_price'])})"
+    return line
+
+
+def _length(text: str) -> int:
+    # Telegram считает длину в единицах UTF-16 (эмодзи - две)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def format_diff(diff: WatchDiff, url: str) -> List[str]:
+    """Сообщения об изменениях выдачи: до ALERT_BATCH_SIZE объявлений в сообщении.
+
+    Сообщения собираются построчно: если строка не помещается в лимит
+    Telegram, она начинает новое сообщение. Обрезать готовую HTML-разметку
+    нельзя - разрез внутри тега Telegram отклоняет.
+    """
+    sections = [
+        ("🆕 Новые объявления", diff.new),
+        ("💱 Изменилась цена", diff.price_changed),
+        ("🗑 Сняты с публикации", diff.removed),
+    ]
+    shown_url = url if len(url) <= ALERT_URL_LIMIT else url[:ALERT_URL_LIMIT] + "…"
+    header = f"🔔 Изменения по подписке\n{html.escape(shown_url)}"
+    messages: List[str] = []
+    for title, items in sections:
+        if not items:
+            continue
+        head = f"{header}\n\n<b>{title}</b> ({len(items)}):"
+        text, count = head, 0
+        for item in items:
+            line = _listing_line(item)
+            if _length(head) + 1 + _length(line) > TELEGRAM_MESSAGE_LIMIT:
+                # Ссылка слишком длинная даже для отдельного сообщения
+                line = _listing_line(item, link=False)
+            if count == ALERT_BATCH_SIZE or _length(text) + 1 + _length(line) > TELEGRAM_MESSAGE_LIMIT:
+                messages.append(text)
+                text, count = head, 0
+            text += "\n" + line
+            count += 1
+        messages.append(text)
+    return messages
+
+
+class AlertSender:
+    """Очередь исходящих сообщений с лимитами Telegram.
+
+    У каждого чата своя очередь и минимальный интервал между сообщениями,
+    общий token bucket держит суммарную скорость. Чаты обслуживаются по
+    очереди, так что один большой получатель не задерживает остальных.
+    """
+
+    def __init__(self, bot, workers: int = ALERT_SENDERS):
+        self.bot = bot
+        self.workers = workers
+        self._bucket = TokenBucket(rate=ALERT_GLOBAL_RATE, burst=max(1, int(ALERT_GLOBAL_RATE)))
+        self._pending: Dict[int, Deque[str]] = {}
+        self._scheduled: set = set()
+        self._sending: set = set()
+        self._next_allowed: Dict[int, float] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, chat_id: int, text: str) -> None:
+        self._pending.setdefault(chat_id, deque()).append(text)
+        self._schedule(chat_id)
+
+    def _interval(self, chat_id: int) -> float:
+        # У групп и каналов отрицательный id и более строгий лимит
+        return ALERT_GROUP_INTERVAL if chat_id < 0 else ALERT_CHAT_INTERVAL
+
+    def _schedule(self, chat_id: int, delay: Optional[float] = None) -> None:
+        # Чат, которому сейчас идет отправка, воркер перепланирует сам
+        if chat_id in self._scheduled or chat_id in self._sending:
+            return
+        self._scheduled.add(chat_id)
+        if delay is None:
+            delay = max(0.0, self._next_allowed.get(chat_id, 0.0) - time.monotonic())
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            self._scheduled.discard(chat_id)
+            queue = self._pending.get(chat_id)
+            if not queue:
+                continue
+            self._sending.add(chat_id)
+            try:
+                delay = await self._send(chat_id, queue)
+            finally:
+                self._sending.discard(chat_id)
+            if queue:
+                self._schedule(chat_id, delay)
+            else:
+                self._pending.pop(chat_id, None)
+
+    async def _send(self, chat_id: int, queue: Deque[str]) -> Optional[float]:
+        """Отправляет первое сообщение чата; возвращает паузу, если Telegram ее потребовал"""
+        text = queue.popleft()
+        await self._bucket.acquire_async()
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id, text=text, parse_mode="HTML", disable_web_page_preview=True
+            )
+            self.sent += 1
+        except RetryAfter as e:
+            # Telegram просит подождать: возвращаем сообщение в начало очереди чата
+            queue.appendleft(text)
+            self.retried += 1
+            retry_after = e.retry_after
+            return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+        except (Forbidden, BadRequest) as e:
+            self.failed += 1
+            if isinstance(e, BadRequest) and "chat not found" not in str(e).lower():
+                logger.warning(f"Уведомление в чат {chat_id} отклонено: {e}")
+            else:
+                # Бот заблокирован или чат удален: подписки больше не нужны
+                logger.warning(f"Чат {chat_id} недоступен ({e}), подписки сняты")
+                queue.clear()
+                await get_scrape_executor().run(get_listing_store().unsubscribe, chat_id)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Не удалось отправить уведомление в чат {chat_id}: {e}")
+        finally:
+            self._next_allowed[chat_id] = time.monotonic() + self._interval(chat_id)
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": sum(len(queue) for queue in self._pending.values()),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+class SubscriptionScheduler:
+    """Периодически опрашивает каждый запрос с подписчиками один раз и рассылает изменения"""
+
+    def __init__(self, bot, interval: float = SUBSCRIPTION_POLL_INTERVAL,
+                 concurrency: int = SUBSCRIPTION_POLL_CONCURRENCY):
+        self.interval = interval
+        self.sender = AlertSender(bot)
+        self._limit = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._background: set = set()
+
+    def start(self) -> None:
+        self.sender.start()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Подписки: опрос каждые {self.interval:.0f}с")
+
+    async def stop(self) -> None:
+        # Плановый цикл и внеочередные опросы (prime) завершаются до остановки отправителя
+        tasks = list(self._background)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.sender.stop()
+
+    def prime(self, query: str, url: str) -> None:
+        """Опрашивает запрос сразу, не дожидаясь планового опроса (для нового - запоминает выдачу)"""
+        task = asyncio.create_task(self._poll_query(query, url))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка опроса подписок: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> None:
+        store = get_listing_store()
+        queries = await get_scrape_executor().run(store.subscribed_queries)
+        await asyncio.gather(*(self._poll_query(q["query"], q["url"]) for q in queries))
+
+    async def _poll_query(self, query: str, url: str) -> None:
+        async with self._limit:
+            try:
+                diff = await poll(url, scope=ALERTS_SCOPE)
+            except Exception as e:
+                logger.warning(f"Опрос подписки {url} не удался: {e}")
+                return
+        # Первый опрос только запоминает текущую выдачу
+        if diff.initial or not diff.changed:
+            return
+        messages = format_diff(diff, url)
+        chats = await get_scrape_executor().run(get_listing_store().subscribers, query)
+        for chat_id in chats:
+            for text in messages:
+                self.sender.enqueue(chat_id, text)
+        logger.info(f"Подписка {url}: {len(messages)} сообщений для {len(chats)} чатов")
+
+
+_scheduler: Optional[SubscriptionScheduler] = None
+
+
+def get_alerts() -> Optional[SubscriptionScheduler]:
+    return _scheduler
+
+
+def start_alerts(bot) -> SubscriptionScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SubscriptionScheduler(bot)
+        _scheduler.start()
+    return _scheduler
+
+
+async def stop_alerts() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
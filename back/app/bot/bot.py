@@ -9,6 +9,8 @@ from app.bot.handlers import (
     help_command,
     run_command,
     parse_command,
+    subscribe_command,
+    unsubscribe_command,
     cities_command,
     dev_command,
     app_command,
@@ -41,6 +43,8 @@ def create_bot_application() -> Application:
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("run", run_command))
     application.add_handler(CommandHandler("parse", parse_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(CommandHandler("cities", cities_command))
     application.add_handler(CommandHandler("dev", dev_command))
     application.add_handler(CommandHandler("app", app_command))  # Алиас для /run
@@ -2,7 +2,12 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import ContextTypes
-from app.parsers.krisha_parser import KrishaParser
+from telegram.helpers import escape_markdown
+from app.bot.alerts import get_alerts
+from app.services.executor import get_scrape_executor
+from app.services.jobs import DONE, SCRAPE, Job, JobQueueFullError, job_manager
+from app.services.store import get_listing_store
+from app.services.watch import watch_query
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +24,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /help \- Помощь
 /run \- Запустить Mini App
 /parse \<url\> \- Спарсить страницу krisha\.kz
+/subscribe \<url\> \- Уведомления о новых объявлениях
+/unsubscribe \- Отменить подписки
 /cities \- Список доступных городов
 /dev \- Информация об авторе
 
@@ -105,6 +112,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /parse \<url\> \- Парсинг страницы krisha\.kz
   Пример: `/parse https://krisha.kz/arenda/kvartiry/almaty/`
   
+/subscribe \<url\> \- Подписка на новые объявления и изменения цен
+/unsubscribe \[url\] \- Отменить подписку \(без ссылки \- все\)
 /cities \- Показать список доступных городов
 /dev \- Информация об авторе
 
@@ -164,13 +173,33 @@ async def parse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    # Отправляем сообщение о начале парсинга
+    # Парсинг идет фоновым заданием, сообщение обновится по его завершении
     status_msg = await update.message.reply_text("⏳ Парсинг страницы\.\.\.")
     
     try:
-        parser = KrishaParser(verify_ssl=True)
-        items = parser.parse_url(url)
+        job = job_manager.submit(SCRAPE, url, verify_ssl=True, priority=1)
+    except JobQueueFullError as e:
+        logger.warning(f"Очередь заданий переполнена: {e}")
+        await status_msg.edit_text("❌ Слишком много запросов, попробуй позже")
+        return
+    
+    web_app_url = context.bot_data.get('web_app_url', 'https://your-frontend-url.com')
+    
+    async def on_done(job: Job):
+        await _send_parse_result(status_msg, job, web_app_url)
+    
+    job_manager.add_done_callback(job, on_done)
+
+async def _send_parse_result(status_msg, job: Job, web_app_url: str):
+    """Отправляет результат задания /parse в сообщение о статусе"""
+    try:
+        if job.status != DONE:
+            logger.error(f"Ошибка парсинга: {job.error or job.status}")
+            # Текст исключения - обычный текст, без разметки: в нем точки, скобки, дефисы
+            await status_msg.edit_text(f"❌ Ошибка при парсинге: {job.error or 'задание отменено'}")
+            return
         
+        items = job.items
         if not items:
             await status_msg.edit_text("❌ Объявления не найдены")
             return
@@ -181,12 +210,13 @@ async def parse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Показываем первые 5 объявлений
         for i, item in enumerate(items[:5], 1):
             price = f"{item['price']:,} ₸".replace(",", " ")
-            result_text += f"*{i}\. {item['title'][:50]}*\.\.\.\n"
-            result_text += f"💰 {price}\n"
-            result_text += f"📍 {item['location']}\n"
+            result_text += f"*{i}\. {escape_markdown(item['title'][:50], version=2)}*\.\.\.\n"
+            result_text += f"💰 {escape_markdown(price, version=2)}\n"
+            result_text += f"📍 {escape_markdown(item['location'], version=2)}\n"
             if item.get('district') and item['district'] != 'Не указано':
-                result_text += f"🏘️ {item['district']}\n"
-            result_text += f"[Открыть]({item['url']})\n\n"
+                result_text += f"🏘️ {escape_markdown(item['district'], version=2)}\n"
+            url = escape_markdown(item['url'], version=2, entity_type='text_link')
+            result_text += f"[Открыть]({url})\n\n"
         
         if len(items) > 5:
             result_text += f"\.\.\. и еще *{len(items) - 5}* объявлений"
@@ -196,7 +226,7 @@ async def parse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Кнопка для открытия Mini App
         keyboard = [[InlineKeyboardButton(
             "🚀 Открыть Mini App",
-            web_app=WebAppInfo(url=context.bot_data.get('web_app_url', 'https://your-frontend-url.com'))
+            web_app=WebAppInfo(url=web_app_url)
         )]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -208,11 +238,60 @@ async def parse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
     except Exception as e:
-        logger.error(f"Ошибка парсинга: {e}")
-        await status_msg.edit_text(
-            f"❌ Ошибка при парсинге: {str(e)}",
+        logger.error(f"Ошибка отправки результата парсинга: {e}")
+        # Сообщение о статусе не должно остаться на "⏳"
+        try:
+            await status_msg.edit_text("❌ Не удалось показать результат парсинга")
+        except Exception as edit_error:
+            logger.error(f"Не удалось обновить сообщение о статусе: {edit_error}")
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /subscribe - уведомления о новых объявлениях по ссылке"""
+    if not context.args:
+        await update.message.reply_text(
+            "❌ Укажи URL поиска krisha\.kz\n"
+            "Пример: `/subscribe https://krisha.kz/arenda/kvartiry/almaty/`",
+            parse_mode='MarkdownV2'
+        )
+        return
+    
+    url = ' '.join(context.args)
+    
+    if 'krisha.kz' not in url:
+        await update.message.reply_text(
+            "❌ Поддерживаются только ссылки с krisha\.kz",
             parse_mode='MarkdownV2'
         )
+        return
+    
+    query = watch_query(url)
+    created = await get_scrape_executor().run(
+        get_listing_store().subscribe, update.effective_chat.id, query, url
+    )
+    if not created:
+        await update.message.reply_text("ℹ️ Ты уже подписан на этот поиск")
+        return
+    
+    alerts = get_alerts()
+    if alerts is not None:
+        alerts.prime(query, url)
+    
+    await update.message.reply_text(
+        "🔔 Подписка оформлена\! Пришлю новые объявления, изменения цен и снятые объявления\.\n"
+        "Отписаться: /unsubscribe",
+        parse_mode='MarkdownV2'
+    )
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /unsubscribe [url] - без ссылки снимает все подписки чата"""
+    chat_id = update.effective_chat.id
+    query = watch_query(' '.join(context.args)) if context.args else None
+    removed = await get_scrape_executor().run(get_listing_store().unsubscribe, chat_id, query)
+    
+    if removed:
+        await update.message.reply_text(f"🔕 Подписок отменено: {removed}")
+    else:
+        await update.message.reply_text("ℹ️ Активных подписок не найдено")
 
 async def cities_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /cities"""
@@ -25,11 +25,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from app.routers import parser, locations, maps
+from app.routers import parser, locations, maps, analytics, jobs, watch
 
 app.include_router(parser.router, prefix="/api/parser", tags=["parser"])
 app.include_router(locations.router, prefix="/api/locations", tags=["locations"])
 app.include_router(maps.router, prefix="/api/maps", tags=["maps"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(watch.router, prefix="/api/watch", tags=["watch"])
 
 # Инициализация бота при старте приложения (опционально, для вебхуков)
 bot_application = None
@@ -41,6 +44,10 @@ async def startup_event():
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     
     logger.info("Запуск приложения...")
+
+    # Очистка каталога карт по квотам объема и возраста
+    from app.services.map_cache import start_map_gc
+    start_map_gc()
     
     if token:
         logger.info(f"Токен бота найден: {token[:10]}...")
@@ -56,6 +63,10 @@ async def startup_event():
             bot_info = await bot_application.bot.get_me()
             logger.info(f"Бот: @{bot_info.username} ({bot_info.first_name})")
             
+            # Плановый опрос подписок и рассылка изменений
+            from app.bot.alerts import start_alerts
+            start_alerts(bot_application.bot)
+            
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации бота: {e}", exc_info=True)
     else:
@@ -65,13 +76,28 @@ async def startup_event():
 async def shutdown_event():
     """Остановка при завершении приложения"""
     global bot_application
+    from app.parsers.http_client import close_async_clients
+    from app.services.executor import shutdown_scrape_executor
+    from app.services.geocoder import close_geocoder
+    from app.services.jobs import job_manager
+    from app.services.map_cache import stop_map_gc
+    from app.services.store import close_listing_store
+    # Сначала потребители общих ресурсов: опросы подписок и бот ходят в исполнитель и хранилище
     if bot_application:
         try:
+            from app.bot.alerts import stop_alerts
+            await stop_alerts()
             await bot_application.stop()
             await bot_application.shutdown()
             logging.info("Telegram бот остановлен")
         except Exception as e:
             logging.error(f"Ошибка остановки бота: {e}")
+    await stop_map_gc()
+    await job_manager.shutdown()
+    await close_async_clients()
+    shutdown_scrape_executor()
+    close_listing_store()
+    close_geocoder()
 
 @app.post("/api/bot/webhook")
 async def webhook(request: Request):
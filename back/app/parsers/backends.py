@@ -0,0 +1,222 @@
+"""HTML-бэкенды для парсеров: selectolax (lexbor), lxml и html.parser"""
+from __future__ import annotations
+import importlib.util
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+import soupsieve
+from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, Tag
+
+logger = logging.getLogger("krisha_parser")
+
+# Порядок выбора в режиме auto: от быстрого к запасному
+AUTO_ORDER = ("selectolax", "lxml", "html.parser")
+
+# Текст внутри этих тегов не входит в get_text() у bs4
+_NON_TEXT_TAGS = frozenset({"script", "style", "template", "rt", "rp"})
+
+
+class HTMLBackend(ABC):
+    """Разбор документа и обход узлов для одного HTML-парсера.
+
+    walk() обходит потомков узла в порядке документа и сообщает их объекту
+    scan: текстовые строки добавляются в scan.strings (как у
+    get_text(" ", strip=True)), элементы проходят через scan.match(), а после
+    обхода их поддерева вызывается scan.close().
+    """
+    name = 'base'
+
+    @abstractmethod
+    def parse(self, html: bytes):
+        ...
+
+    @abstractmethod
+    def select(self, node, selector: str) -> list:
+        ...
+
+    @abstractmethod
+    def find_parent(self, node, names: Iterable[str]):
+        ...
+
+    @abstractmethod
+    def parent(self, node):
+        """Родительский узел или None"""
+
+    @abstractmethod
+    def node_id(self, node) -> int:
+        """Идентификатор элемента, постоянный в пределах документа"""
+
+    @abstractmethod
+    def get_attr(self, node, name: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def walk(self, node, scan) -> None:
+        ...
+
+
+class SoupBackend(HTMLBackend):
+    """BeautifulSoup с выбранным tree builder (html.parser или lxml)"""
+
+    def __init__(self, features: str):
+        self.name = features
+        self.features = features
+        self._compiled: Dict[str, soupsieve.SoupSieve] = {}
+
+    def parse(self, html: bytes):
+        return BeautifulSoup(html, self.features)
+
+    def select(self, node, selector: str) -> list:
+        # Селектор разбирается soupsieve один раз на процесс
+        compiled = self._compiled.get(selector)
+        if compiled is None:
+            compiled = self._compiled[selector] = soupsieve.compile(selector)
+        return compiled.select(node)
+
+    def find_parent(self, node, names: Iterable[str]):
+        return node.find_parent(list(names))
+
+    def parent(self, node):
+        return node.parent
+
+    def node_id(self, node) -> int:
+        # Дерево bs4 - обычные объекты Python, узел существует все время жизни документа
+        return id(node)
+
+    def get_attr(self, node, name: str) -> Optional[str]:
+        value = node.get(name)
+        if isinstance(value, list):
+            return " ".join(value)
+        return value
+
+    def walk(self, node, scan) -> None:
+        strings = scan.strings
+        for child in node.children:
+            child_type = type(child)
+            if child_type is NavigableString or child_type is CData:
+                text = child.strip()
+                if text:
+                    strings.append(text)
+                continue
+            if child_type is not Tag:
+                continue
+            matched = None
+            if scan.pending:
+                attrs = child.attrs
+                matched = scan.match(child.name, attrs, attrs.get('class') or ())
+            start = len(strings)
+            self.walk(child, scan)
+            if matched:
+                scan.close(matched, start)
+
+
+class LexborBackend(HTMLBackend):
+    """selectolax поверх lexbor: самый быстрый разбор, CSS на стороне C"""
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser_cls = LexborHTMLParser
+
+    def parse(self, html: bytes):
+        return self._parser_cls(html)
+
+    def select(self, node, selector: str) -> list:
+        # lexbor возвращает элемент по разу на каждый совпавший селектор списка
+        seen = set()
+        result = []
+        for el in node.css(selector):
+            if el.mem_id not in seen:
+                seen.add(el.mem_id)
+                result.append(el)
+        return result
+
+    def find_parent(self, node, names: Iterable[str]):
+        names = set(names)
+        parent = node.parent
+        while parent is not None and parent.tag not in names:
+            parent = parent.parent
+        return parent
+
+    def parent(self, node):
+        return node.parent
+
+    def node_id(self, node) -> int:
+        # Обертки Node создаются на каждое обращение, адрес узла lexbor постоянен
+        return node.mem_id
+
+    def get_attr(self, node, name: str) -> Optional[str]:
+        attrs = node.attributes
+        if name not in attrs:
+            return None
+        return attrs[name] or ""
+
+    def walk(self, node, scan) -> None:
+        strings = scan.strings
+        child = node.child
+        while child is not None:
+            tag = child.tag
+            if tag == "-text":
+                if node.tag not in _NON_TEXT_TAGS:
+                    text = child.text_content.strip()
+                    if text:
+                        strings.append(text)
+            elif tag[0] not in "-!":
+                matched = None
+                if scan.pending:
+                    # Атрибуты без значения приводим к "" как в bs4
+                    attrs: Dict[str, str] = {k: v or "" for k, v in child.attributes.items()}
+                    matched = scan.match(tag, attrs, attrs.get("class", "").split())
+                start = len(strings)
+                self.walk(child, scan)
+                if matched:
+                    scan.close(matched, start)
+            child = child.next
+
+
+def _available(name: str) -> bool:
+    if name == "selectolax":
+        return importlib.util.find_spec("selectolax") is not None
+    if name == "lxml":
+        return importlib.util.find_spec("lxml") is not None
+    return name == "html.parser"
+
+
+def _create(name: str) -> HTMLBackend:
+    if name == "selectolax":
+        return LexborBackend()
+    return SoupBackend(name)
+
+
+_backends: Dict[str, HTMLBackend] = {}
+
+
+def get_backend(name: Optional[str] = None) -> HTMLBackend:
+    """Бэкенд по имени или из KRISHA_HTML_BACKEND (auto - первый доступный).
+
+    Если запрошенный бэкенд не установлен, используется html.parser.
+    """
+    name = (name or os.getenv("KRISHA_HTML_BACKEND", "auto")).strip().lower()
+    candidates: List[str] = list(AUTO_ORDER) if name == "auto" else [name, "html.parser"]
+    for candidate in candidates:
+        if candidate in _backends:
+            return _backends[candidate]
+        if not _available(candidate):
+            continue
+        try:
+            backend = _create(candidate)
+        except Exception as e:
+            logger.warning(f"HTML-бэкенд {candidate} недоступен: {e}")
+            continue
+        _backends[candidate] = backend
+        if candidate != name and name != "auto":
+            logger.warning(f"HTML-бэкенд {name} недоступен, используется {candidate}")
+        return backend
+    raise ValueError(f"Неизвестный HTML-бэкенд: {name}")
+
+
+def available_backends() -> List[str]:
+    return [name for name in AUTO_ORDER if _available(name)]
@@ -0,0 +1,61 @@
+"""Дедупликация объявлений по номеру krisha.kz"""
+from __future__ import annotations
+import re
+from typing import Dict, Iterable, List, Optional
+
+LISTING_ID_RE = re.compile(r'/a/show/(\d+)')
+
+
+def listing_id(url: str) -> Optional[str]:
+    """Номер объявления krisha.kz из ссылки /a/show/<id>"""
+    m = LISTING_ID_RE.search(url or '')
+    return m.group(1) if m else None
+
+
+def listing_key(item: Dict) -> Optional[str]:
+    """Ключ объявления: номер krisha.kz, если он есть в ссылке, иначе сама ссылка"""
+    url = item.get("url")
+    if not url or url == "N/A":
+        return None
+    lid = listing_id(url)
+    return f"krisha:{lid}" if lid else url
+
+
+class DedupIndex:
+    """Множество уже встреченных объявлений.
+
+    Одно объявление krisha.kz попадает в выдачу несколько раз: вложенные
+    карточки одной страницы, платные/"горячие" карточки на разных страницах,
+    пересекающиеся запросы. Индекс пропускает только первое появление ключа,
+    объявления без ключа пропускаются всегда.
+    """
+
+    def __init__(self):
+        self._seen: set = set()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._seen
+
+    def add(self, item: Dict) -> bool:
+        """True, если объявление встретилось впервые"""
+        key = listing_key(item)
+        if key is None:
+            return True
+        if key in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(key)
+        return True
+
+    def filter(self, items: Iterable[Dict]) -> List[Dict]:
+        """Объявления, встретившиеся впервые, в исходном порядке"""
+        return [item for item in items if self.add(item)]
+
+
+def dedupe(items: Iterable[Dict]) -> List[Dict]:
+    """Список объявлений без повторов (первое появление остается)"""
+    return DedupIndex().filter(items)
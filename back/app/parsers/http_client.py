@@ -0,0 +1,158 @@
+"""Асинхронный HTTP-клиент с общим пулом соединений для парсеров"""
+from __future__ import annotations
+import asyncio
+import importlib.util
+import logging
+import os
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from app.parsers.rate_limit import get_limiter
+
+logger = logging.getLogger("krisha_parser")
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:115.0) Gecko/20100101 Firefox/115.0",
+]
+
+# Та же политика повторов, что и у Retry в requests-сессии
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_BACKOFF_MAX = 120.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRY_AFTER_STATUSES = frozenset({413, 429, 503})
+
+# HTTP/2 доступен только при установленном пакете h2
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+MAX_CONNECTIONS = int(os.getenv("KRISHA_MAX_CONNECTIONS", 50))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("KRISHA_MAX_CONNECTIONS_PER_HOST", 8))
+KEEPALIVE_EXPIRY = float(os.getenv("KRISHA_KEEPALIVE_EXPIRY", 30))
+
+_clients: Dict[bool, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+_host_slots: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+
+
+def random_headers() -> Dict[str, str]:
+    return {"User-Agent": random.choice(USER_AGENTS)}
+
+
+def get_async_client(verify_ssl: bool = True) -> httpx.AsyncClient:
+    """Общий для процесса клиент (отдельный для verify_ssl=False)"""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(verify_ssl)
+    if entry is not None:
+        client, client_loop = entry
+        if client_loop is loop and not client.is_closed:
+            return client
+    client = httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        verify=verify_ssl,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+    _clients[verify_ssl] = (client, loop)
+    logger.info(f"HTTP-клиент создан (http2={HTTP2_ENABLED}, verify_ssl={verify_ssl})")
+    return client
+
+
+def _host_slot(host: str) -> asyncio.Semaphore:
+    """Ограничение одновременных соединений к одному хосту"""
+    key = (id(asyncio.get_running_loop()), host)
+    slot = _host_slots.get(key)
+    if slot is None:
+        slot = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+        _host_slots[key] = slot
+    return slot
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff(attempt: int) -> float:
+    # Как в urllib3: первый повтор без паузы, затем factor * 2^(n-1)
+    if attempt <= 1:
+        return 0.0
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_FACTOR * (2 ** (attempt - 1)))
+
+
+async def fetch(
+    url: str,
+    verify_ssl: bool = True,
+    timeout: float = 15,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Response:
+    """GET с повторами на 429/5xx и сетевых ошибках, бросает исключение при неудаче"""
+    client = get_async_client(verify_ssl)
+    host = urlparse(url).netloc
+    limiter = get_limiter(host)
+    attempt = 0
+    while True:
+        attempt += 1
+        await limiter.acquire_async()
+        try:
+            async with _host_slot(host):
+                response = await client.get(url, headers=headers or random_headers(), timeout=timeout)
+        except httpx.TransportError as e:
+            if attempt > RETRY_TOTAL:
+                raise
+            delay = _backoff(attempt)
+            logger.debug(f"Повтор {attempt} для {url} после ошибки {e!r}, пауза {delay:.1f}с")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code == 429:
+            # Пауза по Retry-After ложится на общий лимитер, а не на этот запрос
+            limiter.on_throttled(_retry_after(response))
+            if attempt <= RETRY_TOTAL:
+                continue
+        elif response.status_code < 400:
+            limiter.on_success()
+
+        if response.status_code in RETRY_STATUSES and attempt <= RETRY_TOTAL:
+            delay = None
+            if response.status_code in RETRY_AFTER_STATUSES:
+                delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(attempt)
+            logger.debug(f"Повтор {attempt} для {url} (HTTP {response.status_code}), пауза {delay:.1f}с")
+            await asyncio.sleep(min(delay, RETRY_BACKOFF_MAX))
+            continue
+
+        if response.status_code == 304:
+            # Ответ на условный запрос: тела нет, решение за вызывающим
+            return response
+        response.raise_for_status()
+        return response
+
+
+async def close_async_clients() -> None:
+    """Закрывает общие клиенты (вызывается при остановке приложения)"""
+    for client, _ in list(_clients.values()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Ошибка закрытия HTTP-клиента: {e}")
+    _clients.clear()
+    _host_slots.clear()
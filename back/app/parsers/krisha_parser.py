@@ -1,24 +1,29 @@
 from __future__ import annotations
 import logging
 import random
-import time
-from typing import Optional, List, Dict
-from urllib.parse import urlparse, urljoin
+import threading
+from typing import Callable, Optional, List, Dict, Tuple
+from urllib.parse import urlparse, urljoin, parse_qsl, urlencode, urlunparse
 import requests
-from bs4 import BeautifulSoup
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import re
+import sys
 from datetime import datetime
 
+from app.parsers import http_client
+from app.parsers.backends import HTMLBackend, get_backend
+from app.parsers.dedup import DedupIndex, listing_key
+from app.parsers.http_client import USER_AGENTS
+from app.parsers.rate_limit import get_limiter
+from app.parsers.validators import FetchResult, PageValidators, page_validators
+
 logger = logging.getLogger("krisha_parser")
 logger.setLevel(logging.INFO)
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15",
-    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:115.0) Gecko/20100101 Firefox/115.0",
-]
+# Общие для процесса сессии requests, чтобы переиспользовать TCP/TLS соединения
+_sessions: Dict[bool, requests.Session] = {}
+_sessions_lock = threading.Lock()
 
 KZ_CITIES = [
     'Алматы', 'Алмата', 'Астана', 'Нур-Султан', 'Шымкент', 'Караганда', 
@@ -27,11 +32,50 @@ KZ_CITIES = [
     'Талдыкорган', 'Кокшетау', 'Уральск'
 ]
 
+# Скомпилированные регулярные выражения горячего пути (компилируются при импорте)
+PRICE_RE = re.compile(r'(?P<num>\d{1,3}(?:[ \u00A0,]\d{3})*|\d+)\s*(?P<cur>₸|тг|тенге)?', re.IGNORECASE)
+AREA_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*м²', re.IGNORECASE)
+AREA_ELEMENT_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*м²')
+ROOMS_RE = re.compile(r'(\d+)[-\s]*(?:комн|комнат|к\.)', re.IGNORECASE)
+PAGE_PARAM_RE = re.compile(r'[?&]page=(\d+)')
+# Страница объявления: координаты из встроенного JSON, этажность, год
+LAT_RE = re.compile(r'"lat"\s*:\s*"?(-?\d{1,3}\.\d+)')
+LON_RE = re.compile(r'"lon"\s*:\s*"?(-?\d{1,3}\.\d+)')
+FLOOR_RE = re.compile(r'(\d+)\s*(?:из|/)\s*(\d+)')
+YEAR_RE = re.compile(r'(1[89]\d{2}|20\d{2})')
+NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
+# CSS-селекторы уровня страницы; бэкенды компилируют их один раз
+CARD_SELECTOR = (
+    ".a-card, .a-card__inc, .card--listing, .a-search-list-item, "
+    "article.a-card, div.a-card, [class*='card'], [class*='listing-item']"
+)
+LISTING_LINK_SELECTOR = 'a[href*="/prodazha/"], a[href*="/arenda/"]'
+PAGINATION_SELECTOR = 'a[href*="page="], [data-page]'
+DETAIL_TITLE_SELECTOR = '.offer__advert-title h1, h1'
+DETAIL_PRICE_SELECTOR = '.offer__price, [class*="offer__price"]'
+DETAIL_LOCATION_SELECTOR = '.offer__location, [class*="offer__location"]'
+DETAIL_DESCRIPTION_SELECTOR = '.offer__description .text, .js-description, .offer__description'
+DETAIL_INFO_SELECTOR = '.offer__info-item, .offer__parameters dl'
+DETAIL_INFO_TITLE_SELECTOR = '.offer__info-title, dt'
+DETAIL_INFO_VALUE_SELECTOR = '.offer__advert-short-info, dd'
+DETAIL_PHOTO_SELECTOR = '[data-photo-url], .gallery__main img[src], meta[property="og:image"]'
+# Сколько фотографий объявления сохранять
+DETAIL_MAX_PHOTOS = 20
+
+# Параметры страницы объявления: data-name или заголовок -> поле
+DETAIL_FIELDS = {
+    'flat.floor': 'floor', 'этаж': 'floor',
+    'house.year': 'year_built', 'год постройки': 'year_built',
+    'flat.building': 'building_type', 'тип дома': 'building_type',
+    'live.square': 'area', 'площадь, м²': 'area', 'площадь': 'area',
+    'map.complex': 'complex', 'жилой комплекс': 'complex',
+}
+
 def parse_price(text: str) -> int:
     """Извлекает цену из текста"""
-    pattern = re.compile(r'(?P<num>\d{1,3}(?:[ \u00A0,]\d{3})*|\d+)\s*(?P<cur>₸|тг|тенге)?', re.IGNORECASE)
     candidates = []
-    for m in pattern.finditer(text):
+    for m in PRICE_RE.finditer(text):
         raw = m.group('num').replace(' ', '').replace('\u00A0', '').replace(',', '')
         if not raw.isdigit():
             continue
@@ -57,24 +101,194 @@ def detect_city(text: str) -> str:
             return c
     return "Не указано"
 
+DISTRICT_KEYWORDS = ['район', 'р-н', 'мкр', 'микрорайон']
+
+def detect_district(text: str) -> Optional[str]:
+    """Часть адреса через запятую с ключевым словом района или None"""
+    text_lower = text.lower()
+    for keyword in DISTRICT_KEYWORDS:
+        if keyword in text_lower:
+            for part in text.split(','):
+                if keyword in part.lower():
+                    return part.strip()
+    return None
+
 def now_str() -> str:
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+class _TextScan:
+    """Сборщик текста поддерева для HTMLBackend.walk без поиска полей"""
+    pending = ()
+
+    def __init__(self):
+        self.strings: List[str] = []
+
+def node_text(node, backend: HTMLBackend) -> str:
+    """Текст узла как get_text(" ", strip=True)"""
+    scan = _TextScan()
+    backend.walk(node, scan)
+    return " ".join(scan.strings)
+
+def find_last_page(doc, backend: HTMLBackend) -> int:
+    """Номер последней страницы по ссылкам пагинатора (?page=N / data-page)"""
+    last = 1
+    for el in backend.select(doc, PAGINATION_SELECTOR):
+        value = backend.get_attr(el, 'data-page')
+        href = backend.get_attr(el, 'href')
+        if not value and href:
+            m = PAGE_PARAM_RE.search(href)
+            value = m.group(1) if m else None
+        if value and str(value).isdigit():
+            last = max(last, int(value))
+    return last
+
+def page_url(url: str, page: int) -> str:
+    """URL той же выдачи с нужным номером страницы"""
+    parts = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'page']
+    if page > 1:
+        query.append(('page', str(page)))
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+class FieldSelector:
+    """Заранее разобранный CSS-селектор поля карточки.
+
+    Покрывает используемое подмножество CSS: .class, [class*="..."], tag,
+    tag[attr], [attr] и a[href*="..."]. Элемент подходит, если выполнено
+    любое из условий (как у списка селекторов через запятую).
+    """
+    __slots__ = ('classes', 'class_re', 'tags', 'attrs', 'tag_attrs', 'href_tag', 'href_re')
+
+    def __init__(self, classes=(), class_contains=(), tags=(), attrs=(), tag_attrs=(),
+                 href_contains=()):
+        self.classes = frozenset(classes)
+        self.class_re = re.compile('|'.join(map(re.escape, class_contains))) if class_contains else None
+        self.tags = frozenset(tags)
+        self.attrs = tuple(attrs)
+        self.tag_attrs = tuple(tag_attrs)
+        self.href_re = re.compile('|'.join(map(re.escape, href_contains))) if href_contains else None
+
+    def matches(self, tag: str, attrs: Dict, classes, cls: str) -> bool:
+        if tag in self.tags:
+            return True
+        if self.classes and not self.classes.isdisjoint(classes):
+            return True
+        if self.class_re is not None and cls and self.class_re.search(cls):
+            return True
+        for name in self.attrs:
+            if name in attrs:
+                return True
+        for tag_name, name in self.tag_attrs:
+            if tag == tag_name and name in attrs:
+                return True
+        if self.href_re is not None and tag == 'a':
+            href = attrs.get('href')
+            if href is not None and self.href_re.search(href):
+                return True
+        return False
+
+# Поля карточки и селекторы их элементов: берется первый подходящий
+# потомок карточки в порядке документа, как у select_one.
+CARD_FIELDS = {
+    # .a-card__title, .a-card__title-link, a[title], h2, h3, h4
+    'title': FieldSelector(
+        classes=('a-card__title', 'a-card__title-link'),
+        tag_attrs=(('a', 'title'),),
+        tags=('h2', 'h3', 'h4'),
+    ),
+    # a[href*="/prodazha/"], a[href*="/arenda/"]
+    'listing_link': FieldSelector(href_contains=('/prodazha/', '/arenda/')),
+    # .a-card__price, .a-card__price-value, [class*="price"], [class*="стоимость"], .price, [data-price]
+    'price': FieldSelector(
+        classes=('a-card__price', 'a-card__price-value', 'price'),
+        class_contains=('price', 'стоимость'),
+        attrs=('data-price',),
+    ),
+    # .a-card__subtitle, .a-card__location, [class*="location"], [class*="address"], [class*="адрес"]
+    'location': FieldSelector(
+        classes=('a-card__subtitle', 'a-card__location'),
+        class_contains=('location', 'address', 'адрес'),
+    ),
+    # .a-card__description, .a-card__text, [class*="description"], [class*="описание"], p
+    'description': FieldSelector(
+        classes=('a-card__description', 'a-card__text'),
+        class_contains=('description', 'описание'),
+        tags=('p',),
+    ),
+    # a[href]
+    'link': FieldSelector(tag_attrs=(('a', 'href'),)),
+    # [class*="area"], [class*="square"], [class*="площадь"]
+    'area': FieldSelector(class_contains=('area', 'square', 'площадь')),
+}
+
+class CardScan:
+    """Один проход по поддереву карточки.
+
+    Собирает строки текста (как get_text(" ", strip=True)) и атрибуты первого
+    элемента для каждого поля из CARD_FIELDS; текст любого найденного элемента
+    берется срезом уже собранных строк, без повторного обхода. Сам обход
+    выполняет HTML-бэкенд, поэтому результат не зависит от парсера.
+    """
+
+    def __init__(self, card, backend: HTMLBackend):
+        self.strings: List[str] = []
+        self.attrs: Dict[str, Dict] = {}
+        self.pending = list(CARD_FIELDS)
+        self._spans: Dict[str, Tuple[int, int]] = {}
+        backend.walk(card, self)
+        self.card_text = " ".join(self.strings)
+
+    def match(self, tag: str, attrs: Dict, classes) -> Optional[List[str]]:
+        """Отмечает поля, для которых элемент оказался первым подходящим"""
+        cls = ' '.join(classes)
+        matched = [name for name in self.pending if CARD_FIELDS[name].matches(tag, attrs, classes, cls)]
+        if matched:
+            for name in matched:
+                self.attrs[name] = attrs
+            self.pending = [n for n in self.pending if n not in matched]
+        return matched
+
+    def close(self, matched: List[str], start: int) -> None:
+        for name in matched:
+            self._spans[name] = (start, len(self.strings))
+
+    def found(self, name: str) -> bool:
+        return name in self.attrs
+
+    def attr(self, name: str, key: str) -> Optional[str]:
+        value = self.attrs[name].get(key) if name in self.attrs else None
+        if isinstance(value, list):
+            return ' '.join(value)
+        return value
+
+    def text(self, name: str) -> str:
+        """Текст найденного элемента поля или пустая строка"""
+        span = self._spans.get(name)
+        return " ".join(self.strings[span[0]:span[1]]) if span else ""
+
 class KrishaParser:
-    def __init__(self, verify_ssl: bool = True, base_delay=(1.1, 2.6)):
+    def __init__(self, verify_ssl: bool = True, backend: Optional[str] = None):
         self.verify_ssl = verify_ssl
-        self.base_delay = base_delay
-        self.session = self._build_session()
+        self.backend = get_backend(backend)
+        with _sessions_lock:
+            session = _sessions.get(verify_ssl)
+            if session is None:
+                session = self._build_session()
+                _sessions[verify_ssl] = session
+        self.session = session
 
     def _build_session(self) -> requests.Session:
         s = requests.Session()
         s.verify = self.verify_ssl
         retries = Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[429, 500, 502, 503, 504],
+            total=http_client.RETRY_TOTAL,
+            backoff_factor=http_client.RETRY_BACKOFF_FACTOR,
+            status_forcelist=sorted(http_client.RETRY_STATUSES),
+        )
+        adapter = HTTPAdapter(
+            max_retries=retries,
+            pool_maxsize=http_client.MAX_CONNECTIONS_PER_HOST,
         )
-        adapter = HTTPAdapter(max_retries=retries)
         s.mount("http://", adapter)
         s.mount("https://", adapter)
         return s
@@ -83,170 +297,339 @@ class KrishaParser:
         return {"User-Agent": random.choice(USER_AGENTS)}
 
     def fetch(self, url: str, timeout: int = 15) -> Optional[bytes]:
+        result = self._fetch(url, timeout, None)
+        return result.content if result else None
+
+    def fetch_conditional(self, url: str, timeout: int = 15) -> Optional[FetchResult]:
+        """GET с If-None-Match / If-Modified-Since, если страница уже разбиралась"""
+        return self._fetch(url, timeout, page_validators.get(url))
+
+    def _fetch(self, url: str, timeout: int, cached: Optional[PageValidators]) -> Optional[FetchResult]:
+        limiter = get_limiter(url)
+        limiter.acquire()
+        headers = self._headers()
+        if cached:
+            headers.update(cached.headers())
         try:
-            r = self.session.get(url, headers=self._headers(), timeout=timeout)
-            r.raise_for_status()
-            time.sleep(random.uniform(*self.base_delay))
-            return r.content
+            r = self.session.get(url, headers=headers, timeout=timeout)
+            # Повторы urllib3 прячут промежуточные 429, смотрим их в истории
+            history = getattr(getattr(r.raw, 'retries', None), 'history', None) or ()
+            if r.status_code == 429 or any(h.status == 429 for h in history):
+                retry_after = r.headers.get('Retry-After')
+                limiter.on_throttled(float(retry_after) if retry_after and retry_after.isdigit() else None)
+            elif r.ok:
+                limiter.on_success()
+            return self._fetch_result(r.status_code, r.headers, r.content, cached, r.raise_for_status)
         except Exception as e:
             logger.warning(f"fetch failed: {e}")
             return None
 
+    async def fetch_async(self, url: str, timeout: int = 15) -> Optional[bytes]:
+        """Асинхронный вариант fetch через общий пул соединений"""
+        result = await self._fetch_async(url, timeout, None)
+        return result.content if result else None
+
+    async def fetch_conditional_async(self, url: str, timeout: int = 15) -> Optional[FetchResult]:
+        """Асинхронный вариант fetch_conditional"""
+        return await self._fetch_async(url, timeout, page_validators.get(url))
+
+    async def _fetch_async(self, url: str, timeout: int,
+                           cached: Optional[PageValidators]) -> Optional[FetchResult]:
+        headers = self._headers()
+        if cached:
+            headers.update(cached.headers())
+        try:
+            r = await http_client.fetch(url, verify_ssl=self.verify_ssl, timeout=timeout,
+                                        headers=headers)
+            return self._fetch_result(r.status_code, r.headers, r.content, cached, r.raise_for_status)
+        except Exception as e:
+            logger.warning(f"fetch failed: {e}")
+            return None
+
+    @staticmethod
+    def _fetch_result(status: int, headers, content: bytes, cached: Optional[PageValidators],
+                      raise_for_status) -> FetchResult:
+        if status == 304 and cached is not None:
+            page_validators.record(conditional=True, not_modified=True)
+            return FetchResult(not_modified=True, cached=cached)
+        raise_for_status()
+        page_validators.record(conditional=cached is not None, not_modified=False)
+        return FetchResult(
+            content=content,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+        )
+
+    def parse_fetched(self, result: FetchResult, url: str,
+                      on_item: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], int]:
+        """Разбирает ответ fetch_conditional; при 304 отдает прошлый результат без разбора"""
+        if result.not_modified:
+            items = [dict(item) for item in result.cached.items]
+            if on_item is not None:
+                for item in items:
+                    on_item(item)
+            return items, result.cached.last_page
+        items, last_page = self.parse_search_page(result.content, url, on_item)
+        page_validators.put(url, result, items, last_page)
+        return items, last_page
+
     def parse_url(self, url: str) -> List[Dict]:
         """Парсит страницу krisha.kz и возвращает список объявлений"""
-        html = self.fetch(url)
-        if html is None:
+        result = self.fetch_conditional(url)
+        if result is None:
             raise RuntimeError("Не удалось получить страницу. Проверь ссылку/доступ/SSL.")
+        items, _ = self.parse_fetched(result, url)
+        return items
+
+    def parse_html(self, html: bytes, url: str) -> List[Dict]:
+        """Извлекает объявления из уже загруженной страницы"""
+        items, _ = self.parse_search_page(html, url)
+        return items
+
+    def parse_detail(self, html: bytes, url: str) -> Dict:
+        """Поля страницы объявления; в результат попадает только найденное.
+
+        Координаты берутся из встроенного в страницу JSON карты, параметры
+        (этаж, год постройки, тип дома, площадь) - из блока характеристик,
+        все характеристики целиком - в attributes.
+        """
+        doc, backend = self._parse_doc(html)
+        details: Dict = {}
 
-        soup = BeautifulSoup(html, 'html.parser')  # Используем html.parser вместо lxml
+        def first_text(selector: str) -> str:
+            nodes = backend.select(doc, selector)
+            return node_text(nodes[0], backend) if nodes else ""
+
+        title = first_text(DETAIL_TITLE_SELECTOR)
+        if title:
+            details['title'] = title[:200]
+        price = parse_price(first_text(DETAIL_PRICE_SELECTOR))
+        if price > 0:
+            details['price'] = price
+
+        # Город и район - по тем же правилам, что и в карточке выдачи
+        address = first_text(DETAIL_LOCATION_SELECTOR)
+        if address:
+            details['address'] = address
+            city = detect_city(address)
+            if city != "Не указано":
+                details['location'] = city
+            district = detect_district(address)
+            if district:
+                details['district'] = district
+
+        description = first_text(DETAIL_DESCRIPTION_SELECTOR)
+        if description:
+            details['description'] = description
+
+        attributes: Dict[str, str] = {}
+        for info in backend.select(doc, DETAIL_INFO_SELECTOR):
+            titles = backend.select(info, DETAIL_INFO_TITLE_SELECTOR)
+            values = backend.select(info, DETAIL_INFO_VALUE_SELECTOR)
+            if not titles or not values:
+                continue
+            name = node_text(titles[0], backend).rstrip(':')
+            value = node_text(values[0], backend)
+            if not name or not value:
+                continue
+            attributes[name] = value
+            field = DETAIL_FIELDS.get(backend.get_attr(info, 'data-name') or '') or DETAIL_FIELDS.get(name.lower())
+            if field == 'floor':
+                m = FLOOR_RE.search(value)
+                if m:
+                    details['floor'], details['floors_total'] = int(m.group(1)), int(m.group(2))
+                elif value.strip().isdigit():
+                    details['floor'] = int(value)
+            elif field == 'year_built':
+                m = YEAR_RE.search(value)
+                if m:
+                    details['year_built'] = int(m.group(1))
+            elif field == 'area':
+                m = AREA_ELEMENT_RE.search(value) or NUMBER_RE.search(value)
+                if m:
+                    details['area'] = float(m.group(1).replace(',', '.'))
+            elif field is not None:
+                details[field] = value
+        if attributes:
+            details['attributes'] = attributes
+
+        rooms_match = ROOMS_RE.search(title)
+        if rooms_match:
+            details['rooms'] = int(rooms_match.group(1))
+
+        photos: List[str] = []
+        for node in backend.select(doc, DETAIL_PHOTO_SELECTOR):
+            src = (backend.get_attr(node, 'data-photo-url') or backend.get_attr(node, 'src')
+                   or backend.get_attr(node, 'content'))
+            if src:
+                src = urljoin(url, src)
+                if src not in photos:
+                    photos.append(src)
+            if len(photos) >= DETAIL_MAX_PHOTOS:
+                break
+        if photos:
+            details['photos'] = photos
+
+        text = html.decode('utf-8', 'replace') if isinstance(html, bytes) else html
+        lat, lon = LAT_RE.search(text), LON_RE.search(text)
+        if lat and lon:
+            details['lat'], details['lon'] = float(lat.group(1)), float(lon.group(1))
+        return details
+
+    def parse_search_page(self, html: bytes, url: str,
+                          on_item: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], int]:
+        """Объявления страницы поиска и номер последней страницы пагинации.
+
+        on_item вызывается для каждого объявления сразу после разбора его карточки.
+        """
+        doc, backend = self._parse_doc(html)
+        return self._parse_document(doc, url, backend, on_item), find_last_page(doc, backend)
+
+    def _parse_doc(self, html: bytes) -> Tuple[object, HTMLBackend]:
+        """Документ и бэкенд, который его разобрал; при сбое - запасной html.parser"""
+        backend = self.backend
+        try:
+            return backend.parse(html), backend
+        except Exception as e:
+            if backend.name == 'html.parser':
+                raise
+            logger.warning(f"Бэкенд {backend.name} не разобрал страницу ({e}), используем html.parser")
+            backend = get_backend('html.parser')
+            return backend.parse(html), backend
+
+    def _parse_document(self, doc, url: str, backend: HTMLBackend,
+                        on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
         items: List[Dict] = []
+        # Вложенные карточки дают одно объявление несколько раз
+        seen = DedupIndex()
+        # Элементы выданных карточек: карточка без ссылки внутри них - фрагмент разметки
+        emitted: set = set()
 
         # Обновленные селекторы для карточек объявлений на krisha.kz
         # Пробуем разные варианты селекторов
-        cards = soup.select(
-            ".a-card, .a-card__inc, .card--listing, .a-search-list-item, "
-            "article.a-card, div.a-card, [class*='card'], [class*='listing-item']"
-        )
+        cards = backend.select(doc, CARD_SELECTOR)
         
         # Если не нашли карточки, пробуем найти по структуре
         if not cards:
             # Ищем все ссылки на объявления
-            cards = soup.select('a[href*="/prodazha/"], a[href*="/arenda/"]')
-            cards = [c.find_parent(['div', 'article', 'li']) for c in cards if c.find_parent(['div', 'article', 'li'])]
+            cards = backend.select(doc, LISTING_LINK_SELECTOR)
+            cards = [backend.find_parent(c, ['div', 'article', 'li']) for c in cards]
             cards = [c for c in cards if c is not None]
         
         logger.info(f"Найдено карточек: {len(cards)}")
         
         for c in cards:
             try:
-                # Заголовок - пробуем разные варианты
-                title_el = (
-                    c.select_one('.a-card__title, .a-card__title-link, a[title], h2, h3, h4') or
-                    c.select_one('a[href*="/prodazha/"], a[href*="/arenda/"]')
-                )
-                title = title_el.get_text(" ", strip=True) if title_el else ""
-                if not title and title_el and title_el.has_attr('title'):
-                    title = title_el['title']
-                
-                if not title:
-                    # Пробуем извлечь из всего текста карточки
-                    title = c.get_text(" ", strip=True)[:100]
-
-                # Цена - обновленные селекторы
-                price_el = c.select_one(
-                    '.a-card__price, .a-card__price-value, [class*="price"], '
-                    '[class*="стоимость"], .price, [data-price]'
-                )
-                if price_el:
-                    price_text = price_el.get_text(" ", strip=True)
-                else:
-                    # Ищем цену в тексте карточки
-                    price_text = c.get_text(" ", strip=True)
-
-                price = parse_price(price_text)
-                if price <= 0:
-                    # Пробуем найти цену в ссылке или других местах
-                    all_text = c.get_text(" ", strip=True)
-                    price = parse_price(all_text)
-                
-                if price <= 0:
-                    logger.debug(f"Пропущена карточка без цены: {title[:50]}")
-                    continue
-
-                # Локация
-                location_el = c.select_one(
-                    '.a-card__subtitle, .a-card__location, [class*="location"], '
-                    '[class*="address"], [class*="адрес"]'
-                )
-                location_text = location_el.get_text(" ", strip=True) if location_el else ""
-                if not location_text:
-                    # Пробуем найти в тексте карточки
-                    card_text = c.get_text(" ", strip=True)
-                    location_text = card_text
-                
-                location = detect_city(location_text)
-                
-                # Район (попытка извлечь)
-                district = "Не указано"
-                district_keywords = ['район', 'р-н', 'мкр', 'микрорайон']
-                for keyword in district_keywords:
-                    if keyword in location_text.lower():
-                        parts = location_text.split(',')
-                        for part in parts:
-                            if keyword in part.lower():
-                                district = part.strip()
-                                break
-                        if district != "Не указано":
-                            break
-
-                # Описание
-                desc_el = c.select_one(
-                    '.a-card__description, .a-card__text, [class*="description"], '
-                    '[class*="описание"], p'
-                )
-                desc = desc_el.get_text(" ", strip=True) if desc_el else title
-                if len(desc) > 500:
-                    desc = desc[:500] + '...'
-
-                # URL
-                a = c.select_one('a[href*="/prodazha/"], a[href*="/arenda/"], a[href]')
-                if not a:
-                    a = c.find('a', href=True)
-                href = a['href'] if a and a.has_attr('href') else None
-                url_full = urljoin(url, href) if href else "N/A"
-
-                # Площадь и комнаты из текста
-                card_text_full = c.get_text(" ", strip=True)
-                
-                # Площадь
-                area = None
-                area_match = re.search(r'(\d+(?:[.,]\d+)?)\s*м²', card_text_full, re.IGNORECASE)
-                if area_match:
-                    area = float(area_match.group(1).replace(',', '.'))
-                else:
-                    # Пробуем найти в специальных элементах
-                    area_el = c.select_one('[class*="area"], [class*="square"], [class*="площадь"]')
-                    if area_el:
-                        area_text = area_el.get_text(" ", strip=True)
-                        area_match = re.search(r'(\d+(?:[.,]\d+)?)\s*м²', area_text)
-                        if area_match:
-                            area = float(area_match.group(1).replace(',', '.'))
-
-                # Количество комнат
-                rooms = None
-                rooms_match = re.search(r'(\d+)[-\s]*(?:комн|комнат|к\.)', card_text_full, re.IGNORECASE)
-                if rooms_match:
-                    rooms = int(rooms_match.group(1))
-                else:
-                    # Пробуем найти в заголовке
-                    if title_el:
-                        title_text = title_el.get_text(" ", strip=True)
-                        rooms_match = re.search(r'(\d+)[-\s]*(?:комн|комнат|к\.)', title_text, re.IGNORECASE)
-                        if rooms_match:
-                            rooms = int(rooms_match.group(1))
-
-                items.append({
-                    'marketplace': 'krisha.kz',
-                    'title': title[:200] if title else "Без названия",
-                    'price': price,
-                    'description': (desc[:200] + '...') if len(desc) > 200 else desc,
-                    'location': location,
-                    'district': district,
-                    'area': area,
-                    'rooms': rooms,
-                    'url': url_full,
-                    'scraped_at': now_str()
-                })
+                item = self._extract_card(c, url, backend)
             except Exception as e:
                 logger.warning(f"Ошибка при парсинге карточки: {e}")
                 continue
+            if item is None:
+                continue
+            if listing_key(item) is None and self._inside(c, emitted, backend):
+                seen.duplicates += 1
+                continue
+            if seen.add(item):
+                emitted.add(backend.node_id(c))
+                items.append(item)
+                if on_item is not None:
+                    on_item(item)
 
         if not items:
             logger.warning("Не найдено объявлений. Возможно, изменилась структура страницы.")
             # Пробуем альтернативный метод - поиск по всем ссылкам
-            all_links = soup.select('a[href*="/prodazha/"], a[href*="/arenda/"]')
+            all_links = backend.select(doc, LISTING_LINK_SELECTOR)
             logger.info(f"Найдено ссылок на объявления: {len(all_links)}")
         
+        if seen.duplicates:
+            logger.info(f"Повторов карточек отброшено: {seen.duplicates}")
         logger.info(f"Успешно распарсено объявлений: {len(items)}")
         return items
 
+    @staticmethod
+    def _inside(node, emitted: set, backend: HTMLBackend) -> bool:
+        """Лежит ли узел внутри одной из уже выданных карточек"""
+        parent = backend.parent(node)
+        while parent is not None:
+            if backend.node_id(parent) in emitted:
+                return True
+            parent = backend.parent(parent)
+        return False
+
+    def _extract_card(self, c, url: str, backend: HTMLBackend) -> Optional[Dict]:
+        """Собирает поля одной карточки за один обход ее поддерева"""
+        scan = CardScan(c, backend)
+        card_text = scan.card_text
+
+        # Заголовок - пробуем разные варианты
+        title_field = 'title' if scan.found('title') else 'listing_link'
+        title_el_text = scan.text(title_field)
+        title = title_el_text
+        if not title and scan.attr(title_field, 'title'):
+            title = scan.attr(title_field, 'title')
+
+        if not title:
+            # Пробуем извлечь из всего текста карточки
+            title = card_text[:100]
+
+        # Цена; без отдельного элемента ищем в тексте карточки
+        price = parse_price(scan.text('price') if scan.found('price') else card_text)
+        if price <= 0 and scan.found('price'):
+            price = parse_price(card_text)
+
+        if price <= 0:
+            logger.debug(f"Пропущена карточка без цены: {title[:50]}")
+            return None
+
+        # Локация
+        location_text = scan.text('location')
+        if not location_text:
+            location_text = card_text
+
+        location = detect_city(location_text)
+
+        # Район (попытка извлечь)
+        district = detect_district(location_text) or "Не указано"
+
+        # Описание
+        desc = scan.text('description') if scan.found('description') else title
+        if len(desc) > 500:
+            desc = desc[:500] + '...'
+
+        # URL
+        href = scan.attr('link', 'href')
+        url_full = urljoin(url, href) if href else "N/A"
+
+        # Площадь
+        area = None
+        area_match = AREA_RE.search(card_text)
+        if area_match:
+            area = float(area_match.group(1).replace(',', '.'))
+        elif scan.found('area'):
+            # Пробуем найти в специальных элементах
+            area_match = AREA_ELEMENT_RE.search(scan.text('area'))
+            if area_match:
+                area = float(area_match.group(1).replace(',', '.'))
+
+        # Количество комнат
+        rooms = None
+        rooms_match = ROOMS_RE.search(card_text)
+        if not rooms_match and scan.found(title_field):
+            # Пробуем найти в заголовке
+            rooms_match = ROOMS_RE.search(title_el_text)
+        if rooms_match:
+            rooms = int(rooms_match.group(1))
+
+        return {
+            'marketplace': 'krisha.kz',
+            'title': title[:200] if title else "Без названия",
+            'price': price,
+            'description': (desc[:200] + '...') if len(desc) > 200 else desc,
+            'location': location,
+            # Повторяющиеся строки интернируются: в больших выборках они общие
+            'district': sys.intern(district),
+            'area': area,
+            'rooms': rooms,
+            'url': url_full,
+            'scraped_at': sys.intern(now_str())
+        }
@@ -0,0 +1,237 @@
+"""Общий ограничитель частоты запросов к хостам (token bucket)"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("krisha_parser")
+
+RATE_PER_SEC = float(os.getenv("KRISHA_RATE_PER_SEC", 1.0))
+RATE_BURST = int(os.getenv("KRISHA_RATE_BURST", 3))
+RATE_MIN = float(os.getenv("KRISHA_RATE_MIN", 0.1))
+# Пауза после 429 без Retry-After
+THROTTLE_DEFAULT_SEC = float(os.getenv("KRISHA_THROTTLE_DEFAULT_SEC", 5))
+# Файл общего состояния лимита для всех процессов (воркеры uvicorn, bot_runner);
+# пустое значение - лимит только внутри процесса
+RATE_DB_PATH = os.getenv("KRISHA_RATE_DB_PATH", "data/rate_limit.db")
+
+
+class TokenBucket:
+    """Token bucket в форме GCRA с резервированием слотов.
+
+    Каждый вызов резервирует ближайший свободный слот и возвращает, сколько
+    ждать. После 429 скорость снижается вдвое и хост блокируется на Retry-After,
+    успешные ответы понемногу возвращают скорость к максимальной (AIMD).
+    Потокобезопасен: общий для пула потоков, event loop API и бота в одном
+    процессе; между процессами состояние делит SharedTokenBucket.
+    """
+
+    def __init__(self, rate: float = RATE_PER_SEC, burst: int = RATE_BURST, min_rate: float = RATE_MIN):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tat = 0.0  # теоретическое время прихода следующего запроса
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._throttled = 0
+        self._waited_total = 0.0
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    def reserve(self) -> float:
+        """Резервирует слот и возвращает время ожидания в секундах"""
+        with self._lock:
+            now = self._now()
+            interval = 1.0 / self.rate
+            tat = max(self._tat, now) + interval
+            wait = max(0.0, tat - self.burst * interval - now)
+            self._tat = tat
+            self._requests += 1
+            self._waited_total += wait
+            return wait
+
+    def _blocked(self) -> bool:
+        return self._blocked_until > self._now()
+
+    def acquire(self) -> None:
+        # Слот, занятый до 429, пересчитывается, если за время ожидания хост заблокировали
+        while True:
+            wait = self.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            if not self._blocked():
+                return
+
+    async def acquire_async(self) -> None:
+        while True:
+            wait = self.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if not self._blocked():
+                return
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """Ответ 429: снизить скорость и не отправлять запросы до Retry-After"""
+        with self._lock:
+            self._throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            interval = 1.0 / self.rate
+            pause = retry_after if retry_after is not None else THROTTLE_DEFAULT_SEC
+            until = self._now() + pause
+            self._blocked_until = max(self._blocked_until, until)
+            # Первый запрос после паузы пройдет ровно в until, дальше без всплеска
+            self._tat = max(self._tat, until + (self.burst - 1) * interval)
+        logger.warning(f"Получен 429: скорость снижена до {self.rate:.2f} req/s, пауза {pause:.1f}с")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "burst": self.burst,
+                "requests": self._requests,
+                "throttled": self._throttled,
+                "waited_total_sec": round(self._waited_total, 3),
+                "backlog_sec": round(max(0.0, self._tat - self._now()), 3),
+            }
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket, состояние которого (скорость, слот, блокировка после 429)
+    хранится в SQLite и общее для всех процессов на машине.
+
+    Каждая операция - короткая транзакция BEGIN IMMEDIATE: состояние читается,
+    меняется логикой TokenBucket и записывается обратно, так что воркеры API и
+    бот вместе не превышают заданную скорость, а 429 в одном процессе тормозит
+    все. Время - настенное (time.time), монотонные часы у процессов разные.
+    Если файл недоступен, работает как обычный TokenBucket процесса.
+    """
+
+    def __init__(self, host: str, path: str = RATE_DB_PATH, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.host = host
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._shared_failed = False
+
+    def _now(self) -> float:
+        return time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            # autocommit: транзакции открываются явно
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "host TEXT PRIMARY KEY, rate REAL NOT NULL, tat REAL NOT NULL, blocked_until REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _shared(self, write: bool = True) -> Iterator[None]:
+        """Загружает общее состояние перед операцией и сохраняет после"""
+        with self._db_lock:
+            if self._shared_failed:
+                yield
+                return
+            try:
+                conn = self._connect()
+                if write:
+                    conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT rate, tat, blocked_until FROM rate_limits WHERE host = ?", (self.host,)
+                ).fetchone()
+                if row is not None:
+                    self.rate, self._tat, self._blocked_until = row
+            except sqlite3.Error as e:
+                self._disable(e)
+                yield
+                return
+            try:
+                yield
+            finally:
+                if write:
+                    try:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?)",
+                            (self.host, self.rate, self._tat, self._blocked_until),
+                        )
+                        conn.execute("COMMIT")
+                    except sqlite3.Error as e:
+                        self._disable(e)
+
+    def _disable(self, error: Exception) -> None:
+        logger.warning(f"Общий лимит запросов ({self.path}) недоступен, лимит только процесса: {error}")
+        self._shared_failed = True
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def reserve(self) -> float:
+        with self._shared():
+            return super().reserve()
+
+    def _blocked(self) -> bool:
+        with self._shared(write=False):
+            return super()._blocked()
+
+    def on_success(self) -> None:
+        with self._shared():
+            super().on_success()
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        with self._shared():
+            super().on_throttled(retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._shared(write=False):
+            return {**super().stats(), "shared": not self._shared_failed}
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def _host_key(url_or_host: str) -> str:
+    host = urlparse(url_or_host).netloc if "://" in url_or_host else url_or_host
+    host = host.lower().split(":")[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def get_limiter(url_or_host: str) -> TokenBucket:
+    """Ограничитель для хоста (krisha.kz и www.krisha.kz делят один)"""
+    key = _host_key(url_or_host)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = SharedTokenBucket(key) if RATE_DB_PATH else TokenBucket()
+            _limiters[key] = limiter
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.stats() for host, limiter in limiters.items()}
@@ -0,0 +1,80 @@
+"""Валидаторы страниц (ETag / Last-Modified) для условных GET-запросов"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class PageValidators:
+    """Валидаторы последнего ответа и разобранный результат этой страницы"""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    items: List[Dict] = field(default_factory=list)
+    last_page: int = 1
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass
+class FetchResult:
+    """Ответ условного запроса; при not_modified тело не передавалось"""
+    content: Optional[bytes] = None
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    cached: Optional[PageValidators] = None
+
+
+class ValidatorStore:
+    """LRU валидаторов по URL, общий для всех экземпляров парсера"""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, PageValidators]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.conditional_requests = 0
+        self.not_modified = 0
+
+    def get(self, url: str) -> Optional[PageValidators]:
+        with self._lock:
+            entry = self._data.get(url)
+            if entry is not None:
+                self._data.move_to_end(url)
+            return entry
+
+    def put(self, url: str, result: FetchResult, items: List[Dict], last_page: int = 1) -> None:
+        """Запоминает страницу, если сервер прислал хотя бы один валидатор"""
+        if not result.etag and not result.last_modified:
+            return
+        entry = PageValidators(result.etag, result.last_modified, list(items), last_page)
+        with self._lock:
+            self._data[url] = entry
+            self._data.move_to_end(url)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def record(self, conditional: bool, not_modified: bool) -> None:
+        with self._lock:
+            self.conditional_requests += int(conditional)
+            self.not_modified += int(not_modified)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "conditional_requests": self.conditional_requests,
+                "not_modified": self.not_modified,
+            }
+
+
+page_validators = ValidatorStore(maxsize=int(os.getenv("KRISHA_VALIDATOR_CACHE_SIZE", 512)))
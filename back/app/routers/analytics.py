@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import List, Optional
+import logging
+import os
+
+from app.services.analytics import compute_analytics
+from app.services.executor import ExecutorBusyError, get_scrape_executor
+from app.services.scraper import scrape_url
+from app.services.store import get_listing_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Сколько сохраненных объявлений учитывать без url
+ANALYTICS_MAX_ROWS = int(os.getenv("ANALYTICS_MAX_ROWS", 50000))
+
+class Summary(BaseModel):
+    total: int
+    avg_price: int
+    min_price: int
+    max_price: int
+    cities: int
+
+class PriceRange(BaseModel):
+    range: str
+    count: int
+
+class NamedCount(BaseModel):
+    name: str
+    value: int
+
+class CityAvgPrice(BaseModel):
+    name: str
+    avg_price: int
+
+class AnalyticsResponse(BaseModel):
+    summary: Summary
+    price_ranges: List[PriceRange]
+    by_city: List[NamedCount]
+    avg_price_by_city: List[CityAvgPrice]
+    by_district: List[NamedCount]
+
+def _load_stored(city: Optional[str], district: Optional[str]):
+    return get_listing_store().search(location=city, district=district, limit=ANALYTICS_MAX_ROWS)
+
+@router.get("", response_model=AnalyticsResponse)
+async def analytics(
+    url: Optional[str] = Query(None, description="URL страницы krisha.kz; без него - по сохраненным объявлениям"),
+    verify_ssl: bool = Query(True, description="Проверять SSL"),
+    use_cache: bool = Query(True, description="Разрешить ответ из кеша"),
+    city: Optional[str] = Query(None, description="Город (для сохраненных объявлений)"),
+    district: Optional[str] = Query(None, description="Район (для сохраненных объявлений)")
+):
+    """Агрегаты для графиков и статистики, посчитанные на сервере"""
+    executor = get_scrape_executor()
+    try:
+        if url:
+            items = await scrape_url(url, verify_ssl, use_cache)
+        else:
+            items = await executor.run(_load_stored, city, district)
+        return await executor.run(compute_analytics, items)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка аналитики: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
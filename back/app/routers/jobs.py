@@ -0,0 +1,100 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+from typing import AsyncIterator, List, Literal, Optional
+import logging
+
+from app.routers.parser import PropertyItem, STREAM_MEDIA_TYPES, StreamFormat, encode_event
+from app.services.jobs import CRAWL, SCRAPE, Job, JobQueueFullError, job_manager
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+class JobRequest(BaseModel):
+    url: HttpUrl
+    kind: Literal["scrape", "crawl"] = SCRAPE
+    verify_ssl: Optional[bool] = True
+    max_pages: Optional[int] = Field(None, ge=1)
+    priority: int = Field(5, ge=0, le=9, description="0 - самый срочный")
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    url: str
+    priority: int
+    status: str
+    count: int
+    pages: int
+    page_errors: int
+    error: Optional[str] = None
+    coalesced: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class JobResult(JobInfo):
+    items: List[PropertyItem]
+
+def _get_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def submit_job(request: JobRequest):
+    """Ставит парсинг страницы или обход выдачи в очередь и сразу возвращает id задания"""
+    try:
+        job = job_manager.submit(
+            CRAWL if request.kind == CRAWL else SCRAPE,
+            str(request.url),
+            verify_ssl=request.verify_ssl,
+            max_pages=request.max_pages,
+            priority=request.priority,
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.info()
+
+@router.get("/stats")
+async def jobs_stats():
+    """Метрики очереди заданий"""
+    return job_manager.stats()
+
+@router.get("/{job_id}", response_model=JobResult)
+async def get_job(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="С какого объявления отдавать"),
+    limit: int = Query(100, ge=0, le=1000, description="Сколько объявлений отдать")
+):
+    """Состояние задания и уже собранные объявления (постранично)"""
+    job = _get_job(job_id)
+    return JobResult(**job.info(), items=[PropertyItem(**item) for item in job.items[offset:offset + limit]])
+
+@router.get("/{job_id}/export")
+async def export_job(job_id: str):
+    """Все объявления задания в NDJSON, без построчных моделей ответа"""
+    job = _get_job(job_id)
+    return StreamingResponse(job.items.iter_ndjson(), media_type=STREAM_MEDIA_TYPES["ndjson"])
+
+@router.delete("/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    """Отменяет задание в очереди или выполняющееся"""
+    _get_job(job_id)
+    return job_manager.cancel(job_id).info()
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    format: StreamFormat = Query("sse", description="Формат потока: sse или ndjson")
+):
+    """Подписка на прогресс задания: status, item, page, error"""
+    job = _get_job(job_id)
+
+    async def stream() -> AsyncIterator[bytes]:
+        async for event in job_manager.events(job):
+            if event["type"] == "item":
+                event = {**event, "item": PropertyItem(**event["item"]).model_dump()}
+            yield encode_event(event, format)
+
+    return StreamingResponse(stream(), media_type=STREAM_MEDIA_TYPES[format])
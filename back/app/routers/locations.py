@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
 
+from app.services.geocoder import Place, get_geocoder
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
@@ -69,6 +72,24 @@ class DistrictResponse(BaseModel):
     city: str
     districts: List[str]
 
+class GeocodeResponse(BaseModel):
+    query: str
+    found: bool
+    name: Optional[str] = None
+    # city, district, microdistrict или street
+    kind: Optional[str] = None
+    city: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+def _geocode_response(query: str, place: Optional[Place]) -> GeocodeResponse:
+    if place is None:
+        return GeocodeResponse(query=query, found=False)
+    return GeocodeResponse(
+        query=query, found=True, name=place.name, kind=place.kind,
+        city=place.city, lat=place.lat, lon=place.lon,
+    )
+
 @router.get("/cities", response_model=LocationSearchResponse)
 async def get_cities(
     search: Optional[str] = Query(None, description="Поиск по названию города")
@@ -115,6 +136,7 @@ async def search_location(
         "districts": []
     }
     
+    gazetteer = get_geocoder().gazetteer
     for city_name, city_data in CITIES_DATA.items():
         # Поиск по городу
         if (query_lower in city_name.lower() or
@@ -127,11 +149,35 @@ async def search_location(
         # Поиск по районам
         for district in city_data["districts"]:
             if query_lower in district.lower():
+                # Центр района из справочника, иначе центр города
+                place = gazetteer.find(city_data["name"], district)
                 results["districts"].append({
                     "city": city_data["name"],
                     "name": district,
-                    "coordinates": city_data["coordinates"]  # Примерные координаты
+                    "coordinates": [place.lat, place.lon] if place else city_data["coordinates"]
                 })
     
     return results
 
+@router.get("/geocode", response_model=GeocodeResponse)
+async def geocode(
+    q: str = Query(..., description="Адрес или район: 'Бостандыкский р-н, мкр Орбита-3'"),
+    city: Optional[str] = Query(None, description="Город, если его нет в адресе")
+):
+    """Координаты адреса по локальному справочнику (без внешних сервисов)"""
+    # Промах кеша может дописать пачку результатов в SQLite
+    return _geocode_response(q, await run_in_threadpool(get_geocoder().geocode, q, city))
+
+@router.get("/reverse", response_model=GeocodeResponse)
+async def reverse_geocode(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180)
+):
+    """Ближайший район или микрорайон справочника к точке"""
+    return _geocode_response(f"{lat},{lon}", await run_in_threadpool(get_geocoder().reverse, lat, lon))
+
+@router.get("/geocoder/stats")
+async def geocoder_stats():
+    """Размер справочника и метрики кеша геокодера"""
+    return get_geocoder().stats()
+
@@ -1,100 +1,303 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
 import folium
-import os
-import tempfile
-from pathlib import Path
+from folium.plugins import FastMarkerCluster
+import json
 import logging
+import os
 
+from app.parsers.dedup import DedupIndex
 from app.routers import locations
-from app.utils import ensure_dirs
+from app.services.map_cache import MAP_ID_RE, get_map_cache, map_id, stable_offset
+from app.services.geocoder import KIND_SPREAD, get_geocoder
+from app.services.map_cluster import grid_clusters
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Директория для временных файлов карт
-MAPS_DIR = ensure_dirs()
+# С какого числа маркеров режим auto включает кластеризацию
+MAP_CLUSTER_THRESHOLD = int(os.getenv("MAP_CLUSTER_THRESHOLD", 300))
+
+# none - маркер на объявление, grid - кластеры сетки на сервере,
+# fast - кластеризация в браузере по компактному массиву
+ClusterMode = Literal["auto", "none", "grid", "fast"]
 
 class MapMarker(BaseModel):
-    lat: float
-    lon: float
+    # Без координат точка ищется геокодером по адресу, району и городу
+    lat: Optional[float] = None
+    lon: Optional[float] = None
     title: str
     price: Optional[int] = None
     url: Optional[str] = None
+    location: Optional[str] = None
+    district: Optional[str] = None
+    address: Optional[str] = None
 
 class MapRequest(BaseModel):
     markers: List[MapMarker]
     center_lat: Optional[float] = None
     center_lon: Optional[float] = None
     zoom: Optional[int] = 12
+    # auto - сетка при числе маркеров больше MAP_CLUSTER_THRESHOLD
+    cluster: ClusterMode = "auto"
+
+# Клиентская кластеризация: маркеры передаются компактным массивом, а не разметкой
+FAST_CLUSTER_CALLBACK = """
+function (row) {
+    var esc = function (s) {
+        return String(s).replace(/[&<>"']/g, function (c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    };
+    var html = '<b>' + esc(row[2]) + '</b>';
+    if (row[3]) html += '<br>Цена: ' + String(row[3]).replace(/\\B(?=(\\d{3})+(?!\\d))/g, ' ') + ' ₸';
+    if (row[4]) html += '<br><a href="' + esc(row[4]) + '" target="_blank">Открыть</a>';
+    return L.marker(new L.LatLng(row[0], row[1])).bindPopup(html, {maxWidth: 300}).bindTooltip(esc(row[2]));
+}
+"""
+
+def _locate(markers: List[MapMarker]) -> Tuple[List[MapMarker], int]:
+    """Маркеры с координатами (недостающие - из геокодера) и число ненайденных.
+
+    Объявления одного места разносятся детерминированным смещением по url
+    в пределах точности места, чтобы не слипаться в одну точку.
+    """
+    geocoder = get_geocoder()
+    located: List[MapMarker] = []
+    unresolved = 0
+    for marker in markers:
+        if marker.lat is not None and marker.lon is not None:
+            located.append(marker)
+            continue
+        place = geocoder.geocode_item(marker.model_dump())
+        if place is None:
+            unresolved += 1
+            continue
+        d_lat, d_lon = stable_offset(marker.url or marker.title, spread=KIND_SPREAD[place.kind])
+        located.append(marker.model_copy(update={"lat": place.lat + d_lat, "lon": place.lon + d_lon}))
+    return located, unresolved
+
+def _price(value: int) -> str:
+    return f"{value:,} ₸".replace(",", " ")
+
+def _cluster_mode(request: MapRequest, count: int) -> str:
+    if request.cluster == "auto":
+        return "grid" if count > MAP_CLUSTER_THRESHOLD else "none"
+    return request.cluster
+
+def _add_marker(m: folium.Map, marker: MapMarker) -> None:
+    popup_html = f"<b>{marker.title}</b>"
+    if marker.price:
+        popup_html += f"<br>Цена: {_price(marker.price)}"
+    if marker.url:
+        popup_html += f'<br><a href="{marker.url}" target="_blank">Открыть</a>'
+
+    folium.Marker(
+        [marker.lat, marker.lon],
+        popup=folium.Popup(popup_html, max_width=300),
+        tooltip=marker.title,
+        icon=folium.Icon(color='blue', icon='home')
+    ).add_to(m)
+
+def _add_clusters(m: folium.Map, markers: List[MapMarker], zoom: int) -> None:
+    clusters = grid_clusters(
+        [mk.lat for mk in markers], [mk.lon for mk in markers], [mk.price for mk in markers], zoom
+    )
+    for cluster in clusters:
+        if cluster.count == 1:
+            _add_marker(m, markers[cluster.first])
+            continue
+        popup_html = f"<b>Объявлений: {cluster.count}</b>"
+        if cluster.avg_price is not None:
+            popup_html += (
+                f"<br>Цена: {_price(cluster.min_price)} – {_price(cluster.max_price)}"
+                f"<br>Средняя: {_price(cluster.avg_price)}"
+            )
+        # Размер значка растет с числом объявлений, но ограничен
+        size = min(56, 26 + 6 * len(str(cluster.count)))
+        folium.Marker(
+            [cluster.lat, cluster.lon],
+            popup=folium.Popup(popup_html, max_width=300),
+            tooltip=f"{cluster.count} объявлений",
+            icon=folium.DivIcon(
+                html=(
+                    f'<div style="width:{size}px;height:{size}px;line-height:{size}px;'
+                    f'border-radius:50%;background:rgba(37,99,235,.8);color:#fff;'
+                    f'text-align:center;font:bold 12px sans-serif">{cluster.count}</div>'
+                ),
+                icon_size=(size, size),
+                icon_anchor=(size // 2, size // 2),
+            ),
+        ).add_to(m)
+
+def _render_markers(request: MapRequest, markers: List[MapMarker], mode: str) -> str:
+    # Определяем центр карты
+    if request.center_lat and request.center_lon:
+        center = [request.center_lat, request.center_lon]
+    elif markers:
+        # Центр по среднему значению координат маркеров
+        avg_lat = sum(m.lat for m in markers) / len(markers)
+        avg_lon = sum(m.lon for m in markers) / len(markers)
+        center = [avg_lat, avg_lon]
+    else:
+        # По умолчанию Алматы
+        center = [43.2220, 76.8512]
+
+    # Создаем карту
+    zoom = request.zoom or 12
+    m = folium.Map(
+        location=center,
+        zoom_start=zoom,
+        tiles='OpenStreetMap'
+    )
+
+    # Добавляем маркеры: по одному, кластерами сетки или массивом для клиента
+    if mode == "grid":
+        _add_clusters(m, markers, zoom)
+    elif mode == "fast":
+        FastMarkerCluster(
+            data=[[mk.lat, mk.lon, mk.title, mk.price, mk.url] for mk in markers],
+            callback=FAST_CLUSTER_CALLBACK,
+        ).add_to(m)
+    else:
+        for marker in markers:
+            _add_marker(m, marker)
+
+    return m.get_root().render()
 
 @router.post("/generate")
 async def generate_map(request: MapRequest):
-    """Генерирует карту с маркерами"""
+    """Генерирует карту с маркерами (одинаковый запрос - та же карта из кеша)"""
     try:
-        # Определяем центр карты
-        if request.center_lat and request.center_lon:
-            center = [request.center_lat, request.center_lon]
-        elif request.markers:
-            # Центр по среднему значению координат маркеров
-            avg_lat = sum(m.lat for m in request.markers) / len(request.markers)
-            avg_lon = sum(m.lon for m in request.markers) / len(request.markers)
-            center = [avg_lat, avg_lon]
-        else:
-            # По умолчанию Алматы
-            center = [43.2220, 76.8512]
-        
-        # Создаем карту
-        m = folium.Map(
-            location=center,
-            zoom_start=request.zoom or 12,
-            tiles='OpenStreetMap'
+        # Одно объявление - один маркер
+        seen = DedupIndex()
+        markers = [m for m in request.markers if seen.add({"url": m.url})]
+        mode = _cluster_mode(request, len(markers))
+        mid = map_id("markers", {
+            "markers": [m.model_dump() for m in markers],
+            "center": [request.center_lat, request.center_lon],
+            "zoom": request.zoom,
+            "cluster": mode,
+            "gazetteer": get_geocoder().gazetteer.version,
+        })
+        located, unresolved = await run_in_threadpool(_locate, markers)
+        _, cached = await run_in_threadpool(
+            get_map_cache().get_or_render, mid, lambda: _render_markers(request, located, mode)
         )
-        
-        # Добавляем маркеры
-        for marker in request.markers:
-            popup_html = f"<b>{marker.title}</b>"
-            if marker.price:
-                popup_html += f"<br>Цена: {marker.price:,} ₸".replace(",", " ")
-            if marker.url:
-                popup_html += f'<br><a href="{marker.url}" target="_blank">Открыть</a>'
-            
-            folium.Marker(
-                [marker.lat, marker.lon],
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=marker.title,
-                icon=folium.Icon(color='blue', icon='home')
-            ).add_to(m)
-        
-        # Сохраняем во временный файл
-        import uuid
-        map_id = str(uuid.uuid4())
-        map_path = MAPS_DIR / f"{map_id}.html"
-        m.save(str(map_path))
-        
         return {
             "success": True,
-            "map_id": map_id,
-            "map_url": f"/api/maps/view/{map_id}"
+            "map_id": mid,
+            "map_url": f"/api/maps/view/{mid}",
+            "cached": cached,
+            "cluster": mode,
+            "unresolved": unresolved,
         }
     except Exception as e:
         logger.error(f"Ошибка генерации карты: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Точность координат в GeoJSON: 6 знаков - около 10 см
+GEOJSON_PRECISION = 6
+
+def _point(lat: float, lon: float, properties: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [round(lon, GEOJSON_PRECISION), round(lat, GEOJSON_PRECISION)],
+        },
+        "properties": properties,
+    }
+
+def _marker_feature(marker: MapMarker) -> dict:
+    return _point(marker.lat, marker.lon, {"title": marker.title, "price": marker.price, "url": marker.url})
+
+def _geojson(markers: List[MapMarker], zoom: int, mode: str) -> dict:
+    """Точки объявлений и кластеры сетки как GeoJSON FeatureCollection"""
+    if mode == "grid":
+        features = []
+        clusters = grid_clusters(
+            [mk.lat for mk in markers], [mk.lon for mk in markers], [mk.price for mk in markers], zoom
+        )
+        for cluster in clusters:
+            if cluster.count == 1:
+                features.append(_marker_feature(markers[cluster.first]))
+                continue
+            features.append(_point(cluster.lat, cluster.lon, {
+                "cluster": True,
+                "count": cluster.count,
+                "min_price": cluster.min_price,
+                "max_price": cluster.max_price,
+                "avg_price": cluster.avg_price,
+            }))
+    else:
+        features = [_marker_feature(marker) for marker in markers]
+    collection = {"type": "FeatureCollection", "features": features}
+    if markers:
+        lats = [mk.lat for mk in markers]
+        lons = [mk.lon for mk in markers]
+        collection["bbox"] = [
+            round(value, GEOJSON_PRECISION) for value in (min(lons), min(lats), max(lons), max(lats))
+        ]
+    return collection
+
+@router.post("/geojson")
+async def map_geojson(request: MapRequest, http_request: Request):
+    """Точки и кластеры для карты в GeoJSON (рисует клиент, без HTML на сервере).
+
+    cluster: grid - кластеры сетки на масштабе zoom, none/fast - все точки
+    (fast - кластеризация на клиенте), auto - grid при большом числе точек.
+    """
+    seen = DedupIndex()
+    markers = [m for m in request.markers if seen.add({"url": m.url})]
+    mode = _cluster_mode(request, len(markers))
+    if mode == "fast":
+        mode = "none"
+    zoom = request.zoom or 12
+    mid = map_id("geojson", {
+        "markers": [m.model_dump() for m in markers],
+        "zoom": zoom,
+        "cluster": mode,
+        "gazetteer": get_geocoder().gazetteer.version,
+    })
+
+    # Одинаковый запрос - тот же ответ: клиент может переиспользовать его по ETag
+    etag = f'"{mid}"'
+    headers = {"ETag": etag, "X-Map-Cluster": mode}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    located, unresolved = await run_in_threadpool(_locate, markers)
+    headers["X-Map-Unresolved"] = str(unresolved)
+    collection = await run_in_threadpool(_geojson, located, zoom, mode)
+    content = json.dumps(collection, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=content, media_type="application/geo+json", headers=headers)
+
 @router.get("/view/{map_id}")
-async def view_map(map_id: str):
-    """Возвращает HTML файл карты"""
-    map_path = MAPS_DIR / f"{map_id}.html"
-    if not map_path.exists():
+async def view_map(map_id: str, request: Request):
+    """Возвращает HTML карты (из памяти или с диска)"""
+    html = await run_in_threadpool(get_map_cache().get, map_id) if MAP_ID_RE.match(map_id) else None
+    if html is None:
         raise HTTPException(status_code=404, detail="Карта не найдена")
-    
-    return FileResponse(
-        str(map_path),
-        media_type="text/html",
-        filename=f"map_{map_id}.html"
-    )
+
+    # Содержимое карты с данным id не меняется
+    etag = f'"{map_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=86400",
+        "Content-Disposition": f'attachment; filename="map_{map_id}.html"',
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=html, media_type="text/html", headers=headers)
+
+@router.get("/stats")
+async def maps_stats():
+    """Метрики кеша карт и каталога файлов карт"""
+    cache = get_map_cache()
+    return {"cache": cache.stats(), "storage": cache.storage.stats()}
 
 @router.get("/city/{city_name}")
 async def get_city_map(
@@ -114,13 +317,28 @@ async def get_city_map(
     if not city_data:
         raise HTTPException(status_code=404, detail=f"Город '{city_name}' не найден")
     
+    mid = map_id("city", {
+        "city": city_data["name"],
+        "show_districts": show_districts,
+        "gazetteer": get_geocoder().gazetteer.version,
+    })
+    await run_in_threadpool(get_map_cache().get_or_render, mid, lambda: _render_city(city_data, show_districts))
+
+    return {
+        "success": True,
+        "city": city_data["name"],
+        "map_id": mid,
+        "map_url": f"/api/maps/view/{mid}"
+    }
+
+def _render_city(city_data: dict, show_districts: bool) -> str:
     # Создаем карту города
     m = folium.Map(
         location=city_data["coordinates"],
         zoom_start=11,
         tiles='OpenStreetMap'
     )
-    
+
     # Добавляем маркер центра города
     folium.Marker(
         city_data["coordinates"],
@@ -128,32 +346,23 @@ async def get_city_map(
         tooltip=city_data["name"],
         icon=folium.Icon(color='red', icon='city', prefix='fa')
     ).add_to(m)
-    
-    # Если нужно показать районы, добавляем примерные маркеры
+
+    # Если нужно показать районы, добавляем маркеры центров районов
     if show_districts:
-        import random
-        for i, district in enumerate(city_data["districts"]):
-            # Случайное смещение для визуализации районов
-            offset_lat = city_data["coordinates"][0] + random.uniform(-0.1, 0.1)
-            offset_lon = city_data["coordinates"][1] + random.uniform(-0.1, 0.1)
-            
+        gazetteer = get_geocoder().gazetteer
+        for district in city_data["districts"]:
+            place = gazetteer.find(city_data["name"], district)
+            if place is not None:
+                point = [place.lat, place.lon]
+            else:
+                # Района нет в справочнике: постоянное для пары город/район смещение
+                d_lat, d_lon = stable_offset(city_data["name"], district)
+                point = [city_data["coordinates"][0] + d_lat, city_data["coordinates"][1] + d_lon]
             folium.Marker(
-                [offset_lat, offset_lon],
+                point,
                 popup=f"<b>{district}</b>",
                 tooltip=district,
                 icon=folium.Icon(color='green', icon='map-marker')
             ).add_to(m)
-    
-    # Сохраняем карту
-    import uuid
-    map_id = str(uuid.uuid4())
-    map_path = MAPS_DIR / f"{map_id}.html"
-    m.save(str(map_path))
-    
-    return {
-        "success": True,
-        "city": city_data["name"],
-        "map_id": map_id,
-        "map_url": f"/api/maps/view/{map_id}"
-    }
 
+    return m.get_root().render()
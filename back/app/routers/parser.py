@@ -1,16 +1,33 @@
 from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+from typing import AsyncIterator, Dict, List, Literal, Optional
+import json
 import logging
 
-from app.parsers.krisha_parser import KrishaParser
+from app.parsers.rate_limit import limiter_stats
+from app.parsers.validators import page_validators
+from app.services.bulk import BULK_MAX_URLS, BulkResult, ItemMerger, bulk_scrape
+from app.services.crawler import CrawlPage, crawl
+from app.services.enrich import enrich_items, enrich_stats
+from app.services.executor import ExecutorBusyError, get_scrape_executor
+from app.services.scraper import inflight, result_cache, scrape_url, stream_url
+from app.services.store import get_listing_store
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Потоковые форматы ответа: NDJSON или Server-Sent Events
+StreamFormat = Literal["ndjson", "sse"]
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
 class ParseRequest(BaseModel):
     url: HttpUrl
     verify_ssl: Optional[bool] = True
+    use_cache: Optional[bool] = True
+    stream: Optional[StreamFormat] = None
+    enrich: bool = False
 
 class PropertyItem(BaseModel):
     marketplace: str
@@ -23,6 +40,24 @@ class PropertyItem(BaseModel):
     rooms: Optional[int] = None
     url: str
     scraped_at: str
+    # Поля страницы объявления (enrich=true)
+    enriched: Optional[bool] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    address: Optional[str] = None
+    floor: Optional[int] = None
+    floors_total: Optional[int] = None
+    year_built: Optional[int] = None
+    building_type: Optional[str] = None
+    complex: Optional[str] = None
+    photos: Optional[List[str]] = None
+    attributes: Optional[Dict[str, str]] = None
+
+class CrawlRequest(BaseModel):
+    url: HttpUrl
+    verify_ssl: Optional[bool] = True
+    max_pages: Optional[int] = Field(None, ge=1)
+    format: StreamFormat = "ndjson"
 
 class ParseResponse(BaseModel):
     success: bool
@@ -30,12 +65,56 @@ class ParseResponse(BaseModel):
     items: List[PropertyItem]
     message: Optional[str] = None
 
+class StoredItem(PropertyItem):
+    key: str
+    first_seen: str
+    last_seen: str
+
+class StoredResponse(BaseModel):
+    count: int
+    items: List[StoredItem]
+
+class PricePoint(BaseModel):
+    price: int
+    seen_at: str
+
+class BulkRequest(BaseModel):
+    urls: List[HttpUrl] = Field(..., min_length=1, max_length=BULK_MAX_URLS)
+    crawl: bool = Field(False, description="Обходить все страницы выдачи каждой ссылки")
+    max_pages: Optional[int] = Field(None, ge=1)
+    verify_ssl: Optional[bool] = True
+    use_cache: Optional[bool] = True
+    stream: Optional[StreamFormat] = None
+    enrich: bool = False
+
+class BulkUrlStatus(BaseModel):
+    url: str
+    # partial - при обходе часть страниц не обработана (они в failed_pages)
+    status: Literal["ok", "partial", "error"]
+    count: int
+    pages: int
+    error: Optional[str] = None
+    failed_pages: List[str] = []
+
+class BulkResponse(BaseModel):
+    success: bool
+    total: int
+    failed: int
+    count: int
+    duplicates: int
+    results: List[BulkUrlStatus]
+    items: List[PropertyItem]
+
 @router.post("/scrape", response_model=ParseResponse)
 async def scrape_krisha(request: ParseRequest):
-    """Парсит страницу krisha.kz"""
+    """Парсит страницу krisha.kz (stream=ndjson|sse - объявления потоком, enrich - со страниц объявлений)"""
+    _check_enrich(request.enrich, request.stream)
+    if request.stream:
+        return await _scrape_stream(str(request.url), request.verify_ssl, request.use_cache, request.stream)
     try:
-        parser = KrishaParser(verify_ssl=request.verify_ssl)
-        items = parser.parse_url(str(request.url))
+        items = await scrape_url(str(request.url), request.verify_ssl, request.use_cache)
+        if request.enrich:
+            items = await enrich_items(items, request.verify_ssl)
         
         return ParseResponse(
             success=True,
@@ -43,6 +122,8 @@ async def scrape_krisha(request: ParseRequest):
             items=[PropertyItem(**item) for item in items],
             message=f"Найдено {len(items)} объявлений"
         )
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка парсинга: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,12 +131,19 @@ async def scrape_krisha(request: ParseRequest):
 @router.get("/scrape", response_model=ParseResponse)
 async def scrape_krisha_get(
     url: str = Query(..., description="URL страницы krisha.kz"),
-    verify_ssl: bool = Query(True, description="Проверять SSL")
+    verify_ssl: bool = Query(True, description="Проверять SSL"),
+    use_cache: bool = Query(True, description="Разрешить ответ из кеша"),
+    stream: Optional[StreamFormat] = Query(None, description="Отдавать объявления потоком: ndjson или sse"),
+    enrich: bool = Query(False, description="Дополнить данными страниц объявлений")
 ):
     """Парсит страницу krisha.kz (GET метод)"""
+    _check_enrich(enrich, stream)
+    if stream:
+        return await _scrape_stream(url, verify_ssl, use_cache, stream)
     try:
-        parser = KrishaParser(verify_ssl=verify_ssl)
-        items = parser.parse_url(url)
+        items = await scrape_url(url, verify_ssl, use_cache)
+        if enrich:
+            items = await enrich_items(items, verify_ssl)
         
         return ParseResponse(
             success=True,
@@ -63,7 +151,213 @@ async def scrape_krisha_get(
             items=[PropertyItem(**item) for item in items],
             message=f"Найдено {len(items)} объявлений"
         )
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка парсинга: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _check_enrich(enrich: bool, stream: Optional[str]) -> None:
+    if enrich and stream:
+        raise HTTPException(status_code=400, detail="enrich не поддерживается в потоковом режиме")
+
+def _ndjson(data: dict) -> bytes:
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+
+def encode_event(data: dict, fmt: str) -> bytes:
+    """Событие потока в формате NDJSON или SSE"""
+    if fmt == "sse":
+        payload = json.dumps(data, ensure_ascii=False)
+        return f"event: {data['type']}\ndata: {payload}\n\n".encode("utf-8")
+    return _ndjson(data)
+
+def _item_event(item: Dict, page: Optional[int] = None) -> dict:
+    event = {"type": "item", "item": PropertyItem(**item).model_dump()}
+    if page is not None:
+        event["page"] = page
+    return event
+
+def _page_events(page: CrawlPage) -> List[dict]:
+    if page.error:
+        return [{"type": "error", "page": page.page, "url": page.url, "message": page.error}]
+    events = [_item_event(item, page.page) for item in page.items]
+    events.append({
+        "type": "page", "page": page.page, "url": page.url,
+        "count": len(page.items), "duplicates": page.duplicates,
+    })
+    return events
+
+async def _first(source: AsyncIterator, what: str):
+    """Первый элемент потока до начала ответа, чтобы ошибки доступа вернулись HTTP-статусом"""
+    try:
+        return await source.__anext__()
+    except StopAsyncIteration:
+        return None
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка {what}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _scrape_stream(url: str, verify_ssl: bool, use_cache: bool, fmt: str) -> StreamingResponse:
+    items = stream_url(url, verify_ssl=verify_ssl, use_cache=use_cache)
+    first = await _first(items, "парсинга")
+
+    async def stream() -> AsyncIterator[bytes]:
+        if first is None:
+            yield encode_event({"type": "done", "count": 0}, fmt)
+            return
+        yield encode_event(_item_event(first), fmt)
+        count = 1
+        try:
+            async for item in items:
+                count += 1
+                yield encode_event(_item_event(item), fmt)
+            yield encode_event({"type": "done", "count": count}, fmt)
+        except Exception as e:
+            logger.error(f"Ошибка парсинга: {e}")
+            yield encode_event({"type": "error", "message": str(e)}, fmt)
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(stream(), media_type=STREAM_MEDIA_TYPES[fmt])
+
+async def _crawl_response(url: str, verify_ssl: bool, max_pages: Optional[int],
+                          fmt: str = "ndjson") -> StreamingResponse:
+    pages = crawl(url, verify_ssl=verify_ssl, max_pages=max_pages)
+    first = await _first(pages, "обхода")
+
+    async def stream() -> AsyncIterator[bytes]:
+        for event in _page_events(first):
+            yield encode_event(event, fmt)
+        total, done = len(first.items), 1
+        try:
+            async for page in pages:
+                total += len(page.items)
+                done += 1
+                for event in _page_events(page):
+                    yield encode_event(event, fmt)
+            yield encode_event({"type": "done", "pages": done, "count": total}, fmt)
+        finally:
+            await pages.aclose()
+
+    return StreamingResponse(stream(), media_type=STREAM_MEDIA_TYPES[fmt])
+
+@router.post("/crawl")
+async def crawl_krisha(request: CrawlRequest):
+    """Обходит все страницы выдачи krisha.kz, отдавая объявления потоком NDJSON или SSE"""
+    return await _crawl_response(str(request.url), request.verify_ssl, request.max_pages, request.format)
+
+@router.get("/crawl")
+async def crawl_krisha_get(
+    url: str = Query(..., description="URL поисковой выдачи krisha.kz"),
+    verify_ssl: bool = Query(True, description="Проверять SSL"),
+    max_pages: Optional[int] = Query(None, ge=1, description="Максимум страниц"),
+    format: StreamFormat = Query("ndjson", description="Формат потока: ndjson или sse")
+):
+    """Обходит все страницы выдачи krisha.kz (GET метод)"""
+    return await _crawl_response(url, verify_ssl, max_pages, format)
+
+def _bulk_status(result: BulkResult) -> BulkUrlStatus:
+    return BulkUrlStatus(
+        url=result.url,
+        status=result.status,
+        count=result.count,
+        pages=result.pages,
+        error=result.error,
+        failed_pages=result.failed_pages,
+    )
+
+def _bulk_stream(request: BulkRequest, urls: List[str]) -> StreamingResponse:
+    fmt = request.stream
+    results = bulk_scrape(urls, request.verify_ssl, request.use_cache, request.crawl, request.max_pages)
+
+    async def stream() -> AsyncIterator[bytes]:
+        merger = ItemMerger()
+        failed = 0
+        try:
+            async for result in results:
+                failed += not result.ok
+                for item in merger.add(result.items):
+                    yield encode_event(_item_event(item), fmt)
+                yield encode_event({"type": "result", **_bulk_status(result).model_dump()}, fmt)
+            yield encode_event({
+                "type": "done", "failed": failed, "count": len(merger.items), "duplicates": merger.duplicates,
+            }, fmt)
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(stream(), media_type=STREAM_MEDIA_TYPES[fmt])
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_scrape_krisha(request: BulkRequest):
+    """Парсит много ссылок (или обходит их выдачи) общим пулом.
+
+    Возвращает статус каждой ссылки и сводный список объявлений без повторов;
+    со stream=ndjson|sse отдает объявления и статусы по мере готовности.
+    """
+    _check_enrich(request.enrich, request.stream)
+    urls = [str(url) for url in request.urls]
+    if request.stream:
+        return _bulk_stream(request, urls)
+    merger = ItemMerger()
+    statuses = {}
+    async for result in bulk_scrape(urls, request.verify_ssl, request.use_cache, request.crawl, request.max_pages):
+        merger.add(result.items)
+        statuses[result.url] = _bulk_status(result)
+    # Статусы в порядке ссылок запроса, а не завершения
+    results = [statuses[url] for url in dict.fromkeys(urls) if url in statuses]
+    failed = sum(1 for status in results if status.status == "error")
+    items = merger.items
+    if request.enrich:
+        items = await enrich_items(items, request.verify_ssl)
+    return BulkResponse(
+        success=failed < len(results),
+        total=len(results),
+        failed=failed,
+        count=len(merger.items),
+        duplicates=merger.duplicates,
+        results=results,
+        items=[PropertyItem(**item) for item in items],
+    )
+
+@router.get("/listings", response_model=StoredResponse)
+async def stored_listings(
+    city: Optional[str] = Query(None, description="Город"),
+    district: Optional[str] = Query(None, description="Район"),
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    rooms: Optional[int] = Query(None, ge=0),
+    min_area: Optional[float] = Query(None, ge=0),
+    max_area: Optional[float] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Сохраненные объявления без повторного парсинга"""
+    items = await run_in_threadpool(
+        get_listing_store().search,
+        location=city, district=district, min_price=min_price, max_price=max_price,
+        rooms=rooms, min_area=min_area, max_area=max_area, limit=limit, offset=offset,
+    )
+    return StoredResponse(count=len(items), items=[StoredItem(**item) for item in items])
+
+@router.get("/listings/{key:path}/history", response_model=List[PricePoint])
+async def listing_price_history(key: str):
+    """История цены сохраненного объявления"""
+    history = await run_in_threadpool(get_listing_store().price_history, key)
+    if not history:
+        raise HTTPException(status_code=404, detail="Объявление не найдено")
+    return history
+
+@router.get("/stats")
+async def scrape_stats():
+    """Метрики пула парсинга, лимитера запросов, кеша и объединения запросов"""
+    return {
+        "executor": get_scrape_executor().stats(),
+        "rate_limit": limiter_stats(),
+        "cache": result_cache.stats(),
+        "singleflight": inflight.stats(),
+        "conditional": page_validators.stats(),
+        "enrich": enrich_stats(),
+        "store": await run_in_threadpool(get_listing_store().stats),
+    }
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Optional
+import logging
+
+from app.routers.parser import PropertyItem
+from app.services.executor import ExecutorBusyError
+from app.services.watch import forget, list_watches, poll
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+class WatchRequest(BaseModel):
+    url: HttpUrl
+    verify_ssl: Optional[bool] = True
+    max_pages: Optional[int] = Field(None, ge=1)
+    full: bool = Field(False, description="Пройти всю выдачу, чтобы найти снятые объявления")
+
+class PriceChangedItem(PropertyItem):
+    old_price: int
+
+class RemovedItem(BaseModel):
+    key: str
+    price: Optional[int] = None
+    title: Optional[str] = None
+    url: Optional[str] = None
+
+class WatchResponse(BaseModel):
+    query: str
+    url: str
+    initial: bool
+    complete: bool
+    truncated: bool
+    removals_checked: bool
+    pages_fetched: int
+    known: int
+    new: List[PropertyItem]
+    price_changed: List[PriceChangedItem]
+    removed: List[RemovedItem]
+
+class WatchInfo(BaseModel):
+    query: str
+    url: str
+    polls: int
+    last_polled: Optional[str] = None
+    known: int
+
+@router.post("/poll", response_model=WatchResponse)
+async def watch_poll(request: WatchRequest):
+    """Новые, снятые и изменившиеся в цене объявления с прошлого опроса"""
+    try:
+        diff = await poll(str(request.url), request.verify_ssl, request.max_pages, request.full)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка опроса: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return diff.to_dict()
+
+@router.get("", response_model=List[WatchInfo])
+async def watch_list():
+    """Отслеживаемые запросы"""
+    return await list_watches()
+
+@router.delete("")
+async def watch_forget(url: str = Query(..., description="URL выдачи krisha.kz")):
+    """Забывает снимок запроса"""
+    if not await forget(url):
+        raise HTTPException(status_code=404, detail="Запрос не отслеживается")
+    return {"ok": True}
@@ -0,0 +1 @@
+"""Сервисный слой: пулы, кеши и фоновые задачи парсера"""
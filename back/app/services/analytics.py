@@ -0,0 +1,80 @@
+"""Агрегаты по объявлениям для графиков и карточек статистики"""
+from __future__ import annotations
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from app.services.table import ListingTable
+
+UNKNOWN = "Не указано"
+
+# Границы диапазонов цен: [min, max)
+PRICE_EDGES = np.array([0, 100_000, 300_000, 500_000, 1_000_000, np.inf])
+PRICE_LABELS = ["0-100k", "100k-300k", "300k-500k", "500k-1M", "1M+"]
+
+TOP_CITIES = 10
+TOP_DISTRICTS = 8
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    # Округление половин вверх, как Math.round на фронтенде
+    return np.floor(values + 0.5).astype(np.int64)
+
+
+def _top(counts: pd.Series, limit: int, value_name: str) -> List[Dict[str, Any]]:
+    # Стабильная сортировка: при равенстве порядок первого появления
+    counts = counts.sort_values(ascending=False, kind="stable").head(limit)
+    return [{"name": name, value_name: int(value)} for name, value in counts.items()]
+
+
+def compute_analytics(items: Union[List[Dict], ListingTable]) -> Dict[str, Any]:
+    """Сводка, распределение цен и разбивки по городам и районам.
+
+    Все группировки считаются векторно по колонкам DataFrame, наружу
+    уходят только компактные агрегаты. Из ListingTable колонки берутся
+    напрямую, без dict на объявление.
+    """
+    if not len(items):
+        return {
+            "summary": {"total": 0, "avg_price": 0, "min_price": 0, "max_price": 0, "cities": 0},
+            "price_ranges": [{"range": label, "count": 0} for label in PRICE_LABELS],
+            "by_city": [],
+            "avg_price_by_city": [],
+            "by_district": [],
+        }
+
+    if isinstance(items, ListingTable):
+        df = items.to_frame(["price", "location", "district"])
+    else:
+        df = pd.DataFrame(items, columns=["price", "location", "district"])
+    df["location"] = df["location"].replace("", UNKNOWN).fillna(UNKNOWN)
+    prices = df["price"].to_numpy(dtype=np.int64)
+
+    # Номер диапазона для каждой цены одним searchsorted
+    buckets = np.searchsorted(PRICE_EDGES, prices, side="right") - 1
+    valid = (buckets >= 0) & (buckets < len(PRICE_LABELS))
+    bucket_counts = np.bincount(buckets[valid], minlength=len(PRICE_LABELS))
+
+    by_city = df.groupby("location", sort=False)["price"].agg(["size", "mean"])
+    districts = df.loc[df["district"].notna() & ~df["district"].isin(["", UNKNOWN]), "district"]
+
+    return {
+        "summary": {
+            "total": int(prices.size),
+            "avg_price": int(_round(np.array([prices.mean()]))[0]),
+            "min_price": int(prices.min()),
+            "max_price": int(prices.max()),
+            "cities": int(by_city.shape[0]),
+        },
+        "price_ranges": [
+            {"range": label, "count": int(count)} for label, count in zip(PRICE_LABELS, bucket_counts)
+        ],
+        "by_city": _top(by_city["size"], TOP_CITIES, "value"),
+        "avg_price_by_city": _top(
+            pd.Series(_round(by_city["mean"].to_numpy()), index=by_city.index),
+            TOP_CITIES,
+            "avg_price",
+        ),
+        "by_district": _top(districts.groupby(districts, sort=False).size(), TOP_DISTRICTS, "value"),
+    }
@@ -0,0 +1,129 @@
+"""Пакетный парсинг множества ссылок с общим бюджетом параллельности"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.parsers.dedup import DedupIndex
+from app.services.cache import normalize_url
+from app.services.crawler import crawl
+from app.services.scraper import scrape_url
+from app.services.table import ListingTable
+
+logger = logging.getLogger(__name__)
+
+# Максимум ссылок в одном запросе
+BULK_MAX_URLS = int(os.getenv("BULK_MAX_URLS", 500))
+# Сколько ссылок всех пакетных запросов обрабатывается одновременно
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 8))
+
+_budget: Dict[int, asyncio.Semaphore] = {}
+
+
+@dataclass
+class BulkResult:
+    url: str
+    ok: bool = True
+    count: int = 0
+    pages: int = 0
+    error: Optional[str] = None
+    items: List[Dict] = field(default_factory=list)
+    # Страницы выдачи, которые не удалось обработать при обходе (crawl)
+    failed_pages: List[str] = field(default_factory=list)
+
+    @property
+    def status(self) -> str:
+        """ok, partial (часть страниц обхода не обработана) или error"""
+        if not self.ok:
+            return "error"
+        return "partial" if self.failed_pages else "ok"
+
+
+def _bulk_budget() -> asyncio.Semaphore:
+    key = id(asyncio.get_running_loop())
+    budget = _budget.get(key)
+    if budget is None:
+        budget = asyncio.Semaphore(BULK_CONCURRENCY)
+        _budget[key] = budget
+    return budget
+
+
+def unique_urls(urls: List[str]) -> List[str]:
+    """Ссылки без повторов (по нормализованному URL), в исходном порядке"""
+    seen = set()
+    result = []
+    for url in urls:
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            result.append(url)
+    return result
+
+
+async def _run_one(url: str, verify_ssl: bool, use_cache: bool,
+                   crawl_pages: bool, max_pages: Optional[int]) -> BulkResult:
+    result = BulkResult(url=url)
+    async with _bulk_budget():
+        try:
+            if crawl_pages:
+                async for page in crawl(url, verify_ssl=verify_ssl, max_pages=max_pages):
+                    result.pages += 1
+                    if page.error:
+                        logger.warning(f"Пакет: {page.url} не обработана: {page.error}")
+                        result.failed_pages.append(page.url)
+                        result.error = result.error or page.error
+                        continue
+                    result.items.extend(page.items)
+                # Ни одна страница не обработана - ссылка не обработана
+                if result.failed_pages and len(result.failed_pages) == result.pages:
+                    result.ok = False
+            else:
+                result.items = await scrape_url(url, verify_ssl, use_cache)
+                result.pages = 1
+        except Exception as e:
+            logger.warning(f"Пакет: {url} не обработан: {e}")
+            result.ok = False
+            result.error = str(e)
+    result.count = len(result.items)
+    return result
+
+
+async def bulk_scrape(urls: List[str], verify_ssl: bool = True, use_cache: bool = True,
+                      crawl_pages: bool = False, max_pages: Optional[int] = None) -> AsyncIterator[BulkResult]:
+    """Обрабатывает ссылки параллельно и отдает результаты по мере готовности.
+
+    Параллельность ограничена общим для всех пакетов бюджетом, частоту
+    запросов к хосту держит общий лимитер. Повторяющиеся ссылки
+    обрабатываются один раз. С crawl_pages каждая ссылка обходится
+    постранично (не больше max_pages).
+    """
+    tasks = [
+        asyncio.create_task(_run_one(url, verify_ssl, use_cache, crawl_pages, max_pages))
+        for url in unique_urls(urls)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class ItemMerger:
+    """Сводный список объявлений без повторов по ключу объявления"""
+
+    def __init__(self):
+        self._seen = DedupIndex()
+        self.items = ListingTable()
+
+    @property
+    def duplicates(self) -> int:
+        return self._seen.duplicates
+
+    def add(self, items: List[Dict]) -> List[Dict]:
+        """Добавляет объявления и возвращает те, что встретились впервые"""
+        added = self._seen.filter(items)
+        self.items.extend(added)
+        return added
@@ -0,0 +1,105 @@
+"""Кеш результатов парсинга: TTL + LRU, ключ - нормализованный URL"""
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Параметры, которые не влияют на выдачу krisha.kz
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "yclid", "ysclid", "_openstat", "_ga"})
+TRACKING_PREFIXES = ("utm_",)
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+def normalize_url(url: str) -> str:
+    """Канонический вид URL для ключа кеша.
+
+    Схема и хост в нижнем регистре без www., без фрагмента, трекинговые
+    параметры удалены, остальные отсортированы.
+    """
+    parts = urlparse(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path or "/"
+    return urlunparse((parts.scheme.lower() or "https", host, path, "", urlencode(query), ""))
+
+
+class TTLCache:
+    """LRU ограниченного размера с TTL и окном stale-while-revalidate.
+
+    Запись свежая ttl секунд, затем еще stale_ttl секунд отдается как
+    устаревшая (вызывающий сам решает, обновлять ли ее в фоне).
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300, stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: str) -> Tuple[Optional[Any], str]:
+        """Значение и его состояние: fresh, stale или miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            value, stored_at = entry
+            age = now - stored_at
+            if age <= self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value, FRESH
+            if age <= self.ttl + self.stale_ttl:
+                self._data.move_to_end(key)
+                self.stale_hits += 1
+                return value, STALE
+            del self._data[key]
+            self.misses += 1
+            return None, MISS
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_sec": self.ttl,
+                "stale_ttl_sec": self.stale_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,107 @@
+"""Многостраничный обход поисковой выдачи krisha.kz"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.parsers.dedup import DedupIndex
+from app.parsers.krisha_parser import KrishaParser, page_url
+from app.services.executor import get_scrape_executor
+from app.services.store import save_items
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница страниц за один обход
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 50))
+# Общий для всех обходов бюджет одновременных загрузок страниц
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 4))
+
+_budget: Dict[int, asyncio.Semaphore] = {}
+
+
+@dataclass
+class CrawlPage:
+    page: int
+    url: str
+    items: List[Dict] = field(default_factory=list)
+    error: Optional[str] = None
+    # Объявления страницы, уже отданные на предыдущих страницах обхода
+    duplicates: int = 0
+
+
+def _crawl_budget() -> asyncio.Semaphore:
+    key = id(asyncio.get_running_loop())
+    budget = _budget.get(key)
+    if budget is None:
+        budget = asyncio.Semaphore(CRAWL_CONCURRENCY)
+        _budget[key] = budget
+    return budget
+
+
+async def fetch_page(parser: KrishaParser, url: str) -> Tuple[List[Dict], int]:
+    """Условный GET страницы, разбор и сохранение (при 304 - без разбора)"""
+    async with _crawl_budget():
+        result = await parser.fetch_conditional_async(url)
+    if result is None:
+        raise RuntimeError("Не удалось получить страницу. Проверь ссылку/доступ/SSL.")
+    if result.not_modified:
+        return parser.parse_fetched(result, url)
+    return await get_scrape_executor().run(_parse_and_store, parser, result, url)
+
+
+def _parse_and_store(parser: KrishaParser, result, url: str) -> Tuple[List[Dict], int]:
+    items, last_page = parser.parse_fetched(result, url)
+    save_items(items)
+    return items, last_page
+
+
+async def _crawl_one(parser: KrishaParser, url: str, page: int) -> CrawlPage:
+    try:
+        items, _ = await fetch_page(parser, url)
+        return CrawlPage(page=page, url=url, items=items)
+    except Exception as e:
+        logger.warning(f"Страница {page} не обработана: {e}")
+        return CrawlPage(page=page, url=url, error=str(e))
+
+
+def _unseen(page: CrawlPage, seen: DedupIndex) -> CrawlPage:
+    before = seen.duplicates
+    page.items = seen.filter(page.items)
+    page.duplicates = seen.duplicates - before
+    return page
+
+
+async def crawl(
+    url: str,
+    verify_ssl: bool = True,
+    max_pages: Optional[int] = None,
+) -> AsyncIterator[CrawlPage]:
+    """Обходит страницы выдачи, отдавая каждую по мере готовности.
+
+    Первая страница загружается сразу, по ее пагинатору определяется
+    число страниц, остальные грузятся параллельно в пределах общего бюджета.
+    Ошибка первой страницы пробрасывается, ошибки остальных попадают в CrawlPage.error.
+    Объявление, повторяющееся на нескольких страницах, отдается один раз.
+    """
+    limit = min(max_pages or CRAWL_MAX_PAGES, CRAWL_MAX_PAGES)
+    parser = KrishaParser(verify_ssl=verify_ssl)
+    seen = DedupIndex()
+
+    first_url = page_url(url, 1)
+    items, last_page = await fetch_page(parser, first_url)
+    yield _unseen(CrawlPage(page=1, url=first_url, items=items), seen)
+
+    last_page = min(last_page, limit)
+    logger.info(f"Обход {url}: страниц {last_page}")
+    tasks = [
+        asyncio.create_task(_crawl_one(parser, page_url(url, n), n))
+        for n in range(2, last_page + 1)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield _unseen(await next_done, seen)
+    finally:
+        for task in tasks:
+            task.cancel()
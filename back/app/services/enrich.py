@@ -0,0 +1,93 @@
+"""Обогащение объявлений данными со страницы объявления"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from app.parsers.dedup import listing_key
+from app.parsers.krisha_parser import KrishaParser
+from app.services.cache import FRESH, TTLCache
+from app.services.executor import get_scrape_executor
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Одновременных загрузок страниц объявлений (частоту к хосту держит общий лимитер)
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", 4))
+# Максимум объявлений, обогащаемых за один запрос
+ENRICH_MAX_ITEMS = int(os.getenv("ENRICH_MAX_ITEMS", 200))
+# Значения страницы объявления, которые не переносятся в карточку
+EMPTY_DETAIL_VALUES = (None, "", "Не указано", [], {})
+
+# Кеш страниц объявлений: ключ - номер объявления, страница грузится раз в TTL
+detail_cache = TTLCache(
+    maxsize=int(os.getenv("ENRICH_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("ENRICH_CACHE_TTL", 86400)),
+)
+
+_details = SingleFlight()
+_budget: Dict[int, asyncio.Semaphore] = {}
+
+
+def _enrich_budget() -> asyncio.Semaphore:
+    key = id(asyncio.get_running_loop())
+    budget = _budget.get(key)
+    if budget is None:
+        budget = asyncio.Semaphore(ENRICH_CONCURRENCY)
+        _budget[key] = budget
+    return budget
+
+
+async def _fetch_details(parser: KrishaParser, key: str, url: str) -> Dict:
+    async with _enrich_budget():
+        content = await parser.fetch_async(url)
+    if content is None:
+        raise RuntimeError(f"Не удалось получить страницу объявления {url}")
+    details = await get_scrape_executor().run(parser.parse_detail, content, url)
+    detail_cache.set(key, details)
+    return details
+
+
+async def get_details(url: str, verify_ssl: bool = True) -> Optional[Dict]:
+    """Поля страницы объявления из кеша или с сайта (одновременные запросы объединяются)"""
+    key = listing_key({"url": url})
+    if key is None:
+        return None
+    cached, state = detail_cache.lookup(key)
+    if state == FRESH:
+        return cached
+    parser = KrishaParser(verify_ssl=verify_ssl)
+    return await _details.do((key, verify_ssl), lambda: _fetch_details(parser, key, url))
+
+
+async def _enrich_one(item: Dict, verify_ssl: bool) -> Dict:
+    try:
+        details = await get_details(item.get("url", ""), verify_ssl)
+    except Exception as e:
+        logger.warning(f"Обогащение {item.get('url')} не удалось: {e}")
+        return item
+    if not details:
+        return item
+    # Страница объявления точнее карточки выдачи, но цена и дата - из выдачи;
+    # пустые и неопределенные значения не затирают поля карточки
+    enriched = {**item, **{k: v for k, v in details.items()
+                           if k not in ("price", "title") and v not in EMPTY_DETAIL_VALUES}}
+    enriched["enriched"] = True
+    return enriched
+
+
+async def enrich_items(items: List[Dict], verify_ssl: bool = True,
+                       limit: Optional[int] = None) -> List[Dict]:
+    """Копии объявлений с полями страниц объявлений (координаты, этаж, год, фото).
+
+    Обогащаются первые limit объявлений (не больше ENRICH_MAX_ITEMS), остальные
+    и те, чью страницу получить не удалось, возвращаются как есть.
+    """
+    limit = min(limit or ENRICH_MAX_ITEMS, ENRICH_MAX_ITEMS)
+    head = await asyncio.gather(*(_enrich_one(item, verify_ssl) for item in items[:limit]))
+    return list(head) + list(items[limit:])
+
+
+def enrich_stats() -> Dict:
+    return {"cache": detail_cache.stats(), "singleflight": _details.stats()}
@@ -0,0 +1,126 @@
+"""Ограниченный пул потоков для блокирующего парсинга"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusyError(RuntimeError):
+    """Очередь пула переполнена"""
+
+
+class ScrapeExecutor:
+    """Выполняет блокирующие вызовы вне event loop и считает глубину очереди"""
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 100):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_queued_seen = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Запускает func(*args) в пуле и ждет результата"""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusyError("Слишком много запросов на парсинг, попробуйте позже")
+            self._queued += 1
+            self._max_queued_seen = max(self._max_queued_seen, self._queued)
+        submitted_at = time.monotonic()
+        # Кто первым снимает вызов с очереди: задача в пуле или run() при отмене/ошибке
+        dequeued = False
+
+        def task():
+            nonlocal dequeued
+            started_at = time.monotonic()
+            with self._lock:
+                if not dequeued:
+                    dequeued = True
+                    self._queued -= 1
+                self._running += 1
+                self._wait_total += started_at - submitted_at
+            ok = False
+            try:
+                result = func(*args)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_total += time.monotonic() - started_at
+                    if ok:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, task)
+        finally:
+            # Отмена до старта задачи (обрыв клиента, отмена задания) или
+            # остановленный пул: задача в пуле так и не сняла вызов с очереди
+            with self._lock:
+                if not dequeued:
+                    dequeued = True
+                    self._queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики пула для мониторинга и подбора размера"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "max_queued_seen": self._max_queued_seen,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_sec": round(self._wait_total / finished, 4) if finished else 0.0,
+                "avg_run_sec": round(self._run_total / finished, 4) if finished else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[ScrapeExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_scrape_executor() -> ScrapeExecutor:
+    """Общий для процесса пул, размер задается через SCRAPE_MAX_WORKERS / SCRAPE_MAX_QUEUE"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ScrapeExecutor(
+                max_workers=int(os.getenv("SCRAPE_MAX_WORKERS", 4)),
+                max_queue=int(os.getenv("SCRAPE_MAX_QUEUE", 100)),
+            )
+            logger.info(
+                f"Пул парсинга: workers={_executor.max_workers}, queue={_executor.max_queue}"
+            )
+        return _executor
+
+
+def shutdown_scrape_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
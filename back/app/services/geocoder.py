@@ -0,0 +1,364 @@
+"""Офлайн-геокодер объявлений по локальному справочнику: города, районы, мкр, улицы"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", str(Path(__file__).resolve().parent.parent / "resources" / "kz_gazetteer.json")
+)
+# Кеш результатов: файл SQLite и сколько записей держать в памяти
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "data/geocode.db")
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 50000))
+# Новые результаты пишутся в SQLite пачками
+GEOCODE_FLUSH_EVERY = 256
+
+# Виды мест по точности. Улица задана одной точкой посередине, поэтому
+# микрорайон (около километра) точнее
+KIND_RANK = {"city": 0, "district": 1, "street": 2, "microdistrict": 3}
+KIND_FIELDS = {"districts": "district", "microdistricts": "microdistrict", "streets": "street"}
+# Радиус разброса точек одного места на карте (градусы), чтобы объявления не слипались
+KIND_SPREAD = {"city": 0.02, "district": 0.008, "street": 0.004, "microdistrict": 0.003}
+
+# Служебные слова адреса: тип места, номер дома, сокращения
+STOP_WORDS = frozenset({
+    "г", "город", "район", "р", "н", "рн", "ауданы", "мкр", "мкрн", "микрорайон", "шагын",
+    "ул", "улица", "көшесі", "пр", "т", "кт", "просп", "проспект", "даңғылы", "бульвар",
+    "им", "имени", "д", "дом", "кв", "квартира", "жк",
+})
+TOKEN_RE = re.compile(r"[0-9a-zа-яәғқңөұүһі]+")
+# Самое длинное название справочника в словах
+MAX_NGRAM = 4
+# Ячейка пространственного индекса (градусы)
+GRID_CELL = 0.05
+
+
+def normalize(text: str) -> Tuple[str, ...]:
+    """Слова адреса в нижнем регистре без служебных: 'мкр. Самал-2' -> ('самал', '2')"""
+    tokens = TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return tuple(t for t in tokens if t not in STOP_WORDS)
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    kind: str
+    city: str
+    lat: float
+    lon: float
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Равнопромежуточное приближение: на масштабе города ошибка пренебрежимо мала
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2)) * 111.32
+    dy = (lat2 - lat1) * 110.57
+    return math.hypot(dx, dy)
+
+
+class Gazetteer:
+    """Справочник мест с двумя индексами в памяти.
+
+    Текстовый: кортеж нормализованных слов названия (и синонимов) -> места.
+    Адрес разбирается на слова, и каждая n-грамма до MAX_NGRAM слов ищется
+    в словаре, так что разбор строки - несколько десятков обращений к dict.
+    Пространственный: сетка GRID_CELL градусов для поиска ближайшего места.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.places: List[Place] = []
+        self._names: Dict[Tuple[str, ...], List[Place]] = {}
+        self._grid: Dict[Tuple[int, int], List[Place]] = {}
+        for city in data["cities"]:
+            self._add(Place(city["name"], "city", city["name"], city["lat"], city["lon"]), city.get("aliases", ()))
+            for field, kind in KIND_FIELDS.items():
+                for row in city.get(field, ()):
+                    self._add(Place(row["name"], kind, city["name"], row["lat"], row["lon"]), row.get("aliases", ()))
+        # Границы справочника: дальше них ближайшего места нет
+        self.bbox = (
+            min(p.lat for p in self.places), min(p.lon for p in self.places),
+            max(p.lat for p in self.places), max(p.lon for p in self.places),
+        )
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        # Версия по содержимому: правка справочника сбрасывает постоянный кеш
+        self.version = hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _add(self, place: Place, aliases: Iterable[str]) -> None:
+        self.places.append(place)
+        for name in (place.name, *aliases):
+            key = normalize(name)
+            if not key:
+                continue
+            bucket = self._names.setdefault(key, [])
+            if place not in bucket:
+                bucket.append(place)
+        self._grid.setdefault(self._cell(place.lat, place.lon), []).append(place)
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_CELL)), int(math.floor(lon / GRID_CELL))
+
+    def city(self, name: str) -> Optional[Place]:
+        for place in self._names.get(normalize(name), ()):
+            if place.kind == "city":
+                return place
+        return None
+
+    def find(self, city: str, name: str) -> Optional[Place]:
+        """Место с данным названием в городе (без разбора адреса)"""
+        city_place = self.city(city)
+        for place in self._names.get(normalize(name), ()):
+            if city_place is not None and place.city == city_place.city and place.kind != "city":
+                return place
+        return None
+
+    def match(self, tokens: Tuple[str, ...], city: Optional[str] = None) -> Optional[Place]:
+        """Самое точное место, упомянутое в адресе.
+
+        Город берется из аргумента или из самого адреса; без города название,
+        которое есть в нескольких городах (проспект Абая), не используется.
+        """
+        found: List[Tuple[Place, int]] = []
+        for i in range(len(tokens)):
+            for n in range(min(MAX_NGRAM, len(tokens) - i), 0, -1):
+                places = self._names.get(tokens[i:i + n])
+                if places:
+                    found.extend((place, n) for place in places)
+                    break
+
+        city_place = self.city(city) if city else None
+        if city_place is None:
+            cities = [place for place, _ in found if place.kind == "city"]
+            city_place = cities[0] if cities else None
+
+        best: Optional[Tuple[Place, int]] = None
+        if city_place is not None:
+            candidates = [(p, n) for p, n in found if p.kind != "city" and p.city == city_place.city]
+        else:
+            candidates = [(p, n) for p, n in found if p.kind != "city"]
+            if len({p.city for p, _ in candidates}) > 1:
+                candidates = []
+        for place, n in candidates:
+            if best is None or (KIND_RANK[place.kind], n) > (KIND_RANK[best[0].kind], best[1]):
+                best = (place, n)
+        if best is not None:
+            return best[0]
+        return city_place
+
+    def nearest(self, lat: float, lon: float, kinds: Iterable[str] = ("district", "microdistrict"),
+                max_km: float = 30.0) -> Optional[Place]:
+        """Ближайшее место данных видов не дальше max_km: обход колец сетки от ячейки точки.
+
+        Точка дальше max_km от границ справочника сразу дает None. Число колец
+        ограничено размером сетки справочника, обход кольца - только его периметр.
+        """
+        lat_min, lon_min, lat_max, lon_max = self.bbox
+        # Запас max_km в градусах; для долготы - по самой северной широте справочника
+        margin = max_km / 110.57
+        if not (lat_min - margin <= lat <= lat_max + margin):
+            return None
+        near_lat = min(max(lat, lat_min), lat_max)
+        lon_margin = margin / max(math.cos(math.radians(max(abs(lat_min), abs(lat_max)))), 0.1)
+        if not (lon_min - lon_margin <= lon <= lon_max + lon_margin):
+            return None
+
+        kinds = set(kinds)
+        row, col = self._cell(lat, lon)
+        row_min, col_min = self._cell(lat_min, lon_min)
+        row_max, col_max = self._cell(lat_max, lon_max)
+        max_ring = max(row - row_min, row_max - row, col - col_min, col_max - col, 0)
+        # Меньшая сторона ячейки (по долготе) у точки внутри справочника
+        cell_km = GRID_CELL * 111.32 * math.cos(math.radians(near_lat))
+        best: Optional[Place] = None
+        best_km = max_km
+        for ring in range(max_ring + 1):
+            # Места дальних колец не ближе (ring - 1) ячеек
+            if (ring - 1) * cell_km > best_km:
+                break
+            for cell in self._ring(row, col, ring):
+                for place in self._grid.get(cell, ()):
+                    if place.kind not in kinds:
+                        continue
+                    km = _distance_km(lat, lon, place.lat, place.lon)
+                    if km <= best_km:
+                        best, best_km = place, km
+        return best
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int) -> Iterable[Tuple[int, int]]:
+        """Ячейки периметра квадрата со стороной 2 * ring + 1 вокруг (row, col)"""
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+
+class GeocodeCache:
+    """Результаты геокодирования: LRU в памяти и копия в SQLite.
+
+    При старте в память читаются последние использованные записи текущей
+    версии справочника, записи других версий удаляются. Новые результаты
+    (и промахи - None) копятся и пишутся в SQLite пачками по GEOCODE_FLUSH_EVERY.
+    """
+
+    def __init__(self, path: str, version: str, max_size: int = GEOCODE_CACHE_SIZE):
+        self.path = path
+        self.version = version
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Optional[Place]]" = OrderedDict()
+        self._pending: Dict[str, Optional[Place]] = {}
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "query TEXT PRIMARY KEY, version TEXT NOT NULL, name TEXT, kind TEXT, city TEXT, "
+                "lat REAL, lon REAL, used REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM geocode WHERE version <> ?", (version,))
+        rows = self._conn.execute(
+            "SELECT query, name, kind, city, lat, lon FROM geocode ORDER BY used DESC LIMIT ?", (max_size,)
+        ).fetchall()
+        for query, name, kind, city, lat, lon in reversed(rows):
+            self._entries[query] = Place(name, kind, city, lat, lon) if name is not None else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Tuple[bool, Optional[Place]]:
+        """(найдено ли в кеше, место)"""
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key]
+
+    def put(self, key: str, place: Optional[Place]) -> None:
+        with self._lock:
+            self._entries[key] = place
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._pending[key] = place
+            flush = len(self._pending) >= GEOCODE_FLUSH_EVERY
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            used = time.time()
+            rows = [
+                (key, self.version, *((p.name, p.kind, p.city, p.lat, p.lon) if p else (None,) * 5), used)
+                for key, p in pending.items()
+            ]
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось сохранить кеш геокодера: {e}")
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+
+class Geocoder:
+    """Адрес объявления -> координаты по справочнику, без сетевых сервисов"""
+
+    def __init__(self, gazetteer: Gazetteer, cache: Optional[GeocodeCache] = None):
+        self.gazetteer = gazetteer
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def geocode(self, text: str, city: Optional[str] = None) -> Optional[Place]:
+        tokens = normalize(text)
+        key = f"{' '.join(normalize(city)) if city else ''}|{' '.join(tokens)}"
+        if self.cache is not None:
+            hit, place = self.cache.get(key)
+            if hit:
+                self.hits += 1
+                return place
+        self.misses += 1
+        place = self.gazetteer.match(tokens, city)
+        if self.cache is not None:
+            self.cache.put(key, place)
+        return place
+
+    def geocode_item(self, item: Dict[str, Any]) -> Optional[Place]:
+        """Место объявления по адресу (после enrich), району и городу"""
+        text = ", ".join(str(item[f]) for f in ("address", "district") if item.get(f))
+        return self.geocode(text, item.get("location"))
+
+    def reverse(self, lat: float, lon: float) -> Optional[Place]:
+        return self.gazetteer.nearest(lat, lon)
+
+    def stats(self) -> Dict[str, Any]:
+        kinds: Dict[str, int] = {}
+        for place in self.gazetteer.places:
+            kinds[place.kind] = kinds.get(place.kind, 0) + 1
+        return {
+            "version": self.gazetteer.version,
+            "places": kinds,
+            "cache_entries": len(self.cache) if self.cache is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_geocoder: Optional[Geocoder] = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder() -> Geocoder:
+    """Общий геокодер (GAZETTEER_PATH, кеш в GEOCODE_CACHE_PATH)"""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            gazetteer = Gazetteer.load(GAZETTEER_PATH)
+            try:
+                cache = GeocodeCache(GEOCODE_CACHE_PATH, gazetteer.version)
+            except sqlite3.Error as e:
+                # Без постоянного кеша геокодер работает, просто без теплого старта
+                logger.warning(f"Кеш геокодера недоступен: {e}")
+                cache = None
+            _geocoder = Geocoder(gazetteer, cache)
+            logger.info(
+                f"Геокодер: {len(gazetteer.places)} мест, в кеше {len(cache) if cache else 0} адресов"
+            )
+        return _geocoder
+
+
+def close_geocoder() -> None:
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is not None and _geocoder.cache is not None:
+            _geocoder.cache.close()
+        _geocoder = None
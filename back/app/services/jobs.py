@@ -0,0 +1,297 @@
+"""Фоновые задания парсинга: очередь с приоритетами, прогресс и отмена"""
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services.cache import normalize_url
+from app.services.crawler import crawl
+from app.services.scraper import stream_url
+from app.services.table import ListingTable
+
+logger = logging.getLogger(__name__)
+
+# Сколько заданий выполняется одновременно
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Максимум заданий в очереди
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", 100))
+# Сколько хранить завершенные задания (секунды и штуки)
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 3600))
+JOB_RETAIN = int(os.getenv("JOB_RETAIN", 200))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+SCRAPE = "scrape"
+CRAWL = "crawl"
+
+
+class JobQueueFullError(RuntimeError):
+    """Очередь заданий переполнена"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    url: str
+    verify_ssl: bool = True
+    max_pages: Optional[int] = None
+    priority: int = 5
+    status: str = QUEUED
+    # Результаты больших обходов хранятся по колонкам, а не списком dict
+    items: ListingTable = field(default_factory=ListingTable)
+    pages: int = 0
+    page_errors: int = 0
+    error: Optional[str] = None
+    coalesced: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+    _listeners: List[asyncio.Queue] = field(default_factory=list, repr=False)
+    _callbacks: List[Callable[["Job"], Awaitable[None]]] = field(default_factory=list, repr=False)
+
+    @property
+    def key(self) -> Tuple:
+        return (self.kind, normalize_url(self.url), self.verify_ssl, self.max_pages)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def info(self) -> Dict[str, Any]:
+        """Состояние задания без списка объявлений"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "url": self.url,
+            "priority": self.priority,
+            "status": self.status,
+            "count": len(self.items),
+            "pages": self.pages,
+            "page_errors": self.page_errors,
+            "error": self.error,
+            "coalesced": self.coalesced,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Очередь заданий с приоритетами и ограниченным числом воркеров.
+
+    Повторная отправка того же URL (с теми же параметрами), пока задание
+    в очереди или выполняется, возвращает уже существующее задание.
+    О прогрессе можно узнать опросом (info) или подпиской (events), по
+    завершении вызываются зарегистрированные колбэки.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED,
+                 result_ttl: float = JOB_RESULT_TTL, retain: int = JOB_RETAIN):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.retain = retain
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[Tuple, Job] = {}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+        self._submitted = 0
+        self._coalesced = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Очередь и воркеры привязаны к event loop, в котором запущены
+        self._loop = loop
+        self._stopping = False
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _queued_count(self) -> int:
+        return sum(1 for job in self._active.values() if job.status == QUEUED)
+
+    def submit(self, kind: str, url: str, verify_ssl: bool = True,
+               max_pages: Optional[int] = None, priority: int = 5) -> Job:
+        """Ставит задание в очередь или возвращает уже идущее для того же URL"""
+        self._ensure_started()
+        job = Job(id=uuid.uuid4().hex, kind=kind, url=url, verify_ssl=verify_ssl,
+                  max_pages=max_pages if kind == CRAWL else None, priority=priority)
+        active = self._active.get(job.key)
+        if active is not None:
+            active.coalesced += 1
+            self._coalesced += 1
+            # Более срочная повторная отправка поднимает приоритет ожидающего задания
+            if active.status == QUEUED and priority < active.priority:
+                active.priority = priority
+                self._queue.put_nowait((priority, next(self._seq), active.id))
+            return active
+        if self._queued_count() >= self.max_queued:
+            raise JobQueueFullError("Слишком много заданий в очереди, попробуйте позже")
+
+        self._prune()
+        self._jobs[job.id] = job
+        self._active[job.key] = job
+        self._submitted += 1
+        self._queue.put_nowait((priority, next(self._seq), job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED)
+        elif job._task is not None:
+            job._task.cancel()
+        return job
+
+    def add_done_callback(self, job: Job, callback: Callable[[Job], Awaitable[None]]) -> None:
+        """Асинхронный колбэк по завершении задания (сразу, если оно уже завершено)"""
+        if job.finished:
+            asyncio.get_running_loop().create_task(self._call(callback, job))
+        else:
+            job._callbacks.append(callback)
+
+    async def events(self, job: Job) -> AsyncIterator[Dict[str, Any]]:
+        """Поток событий задания: item, page, status; завершается вместе с заданием"""
+        if job.finished:
+            yield {"type": "status", **job.info()}
+            return
+        # Подписка до первого yield, чтобы не потерять события между ними
+        queue: asyncio.Queue = asyncio.Queue()
+        job._listeners.append(queue)
+        try:
+            yield {"type": "status", **job.info()}
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "status" and event["status"] in FINISHED:
+                    return
+        finally:
+            if queue in job._listeners:
+                job._listeners.remove(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "submitted": self._submitted,
+            "coalesced": self._coalesced,
+            "jobs": statuses,
+        }
+
+    async def shutdown(self) -> None:
+        self._stopping = True
+        for job in list(self._active.values()):
+            self.cancel(job.id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
+        self._stopping = False
+
+    def _emit(self, job: Job, event: Dict[str, Any]) -> None:
+        for queue in job._listeners:
+            queue.put_nowait(event)
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        self._emit(job, {"type": "status", **job.info()})
+        for callback in job._callbacks:
+            asyncio.get_running_loop().create_task(self._call(callback, job))
+        job._callbacks.clear()
+
+    @staticmethod
+    async def _call(callback: Callable[[Job], Awaitable[None]], job: Job) -> None:
+        try:
+            await callback(job)
+        except Exception as e:
+            logger.warning(f"Колбэк задания {job.id} завершился ошибкой: {e}")
+
+    def _prune(self) -> None:
+        """Удаляет завершенные задания старше TTL и самые старые сверх лимита"""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(self._jobs) - self.retain + 1
+        for job in finished:
+            if excess > 0 or now - job.finished_at > self.result_ttl:
+                del self._jobs[job.id]
+                excess -= 1
+
+    async def _worker(self) -> None:
+        while True:
+            priority, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            # Отмененные и уже запущенные (после повышения приоритета) пропускаем
+            if job is None or job.status != QUEUED or priority != job.priority:
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._emit(job, {"type": "status", **job.info()})
+            job._task = asyncio.create_task(self._run(job))
+            try:
+                await job._task
+            except asyncio.CancelledError:
+                self._finish(job, CANCELLED)
+                if self._stopping:
+                    raise
+                continue
+            except Exception as e:
+                logger.warning(f"Задание {job.id} ({job.url}) не выполнено: {e}")
+                self._finish(job, FAILED, str(e))
+                continue
+            finally:
+                job._task = None
+            self._finish(job, DONE)
+
+    async def _run(self, job: Job) -> None:
+        if job.kind == SCRAPE:
+            async for item in stream_url(job.url, verify_ssl=job.verify_ssl):
+                job.items.append(item)
+                self._emit(job, {"type": "item", "item": item})
+            job.pages = 1
+            return
+        async for page in crawl(job.url, verify_ssl=job.verify_ssl, max_pages=job.max_pages):
+            job.pages += 1
+            if page.error:
+                job.page_errors += 1
+                self._emit(job, {"type": "error", "page": page.page, "url": page.url, "message": page.error})
+                continue
+            job.items.extend(page.items)
+            for item in page.items:
+                self._emit(job, {"type": "item", "page": page.page, "item": item})
+            self._emit(job, {
+                "type": "page", "page": page.page, "url": page.url,
+                "count": len(page.items), "duplicates": page.duplicates,
+            })
+
+
+job_manager = JobManager()
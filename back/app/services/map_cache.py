@@ -0,0 +1,175 @@
+"""Кеш отрисованных карт: id по содержимому запроса, LRU в памяти перед диском"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services.map_storage import MapStorage
+from app.utils import ensure_dirs
+
+logger = logging.getLogger(__name__)
+
+# Сколько HTML карт держать в памяти (байт)
+MAP_CACHE_MAX_BYTES = int(os.getenv("MAP_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Как часто проверять квоты каталога карт (секунды)
+MAP_GC_INTERVAL = float(os.getenv("MAP_GC_INTERVAL", 600))
+
+# id по содержимому (hex blake2b) или uuid4 старых карт
+MAP_ID_RE = re.compile(r'^[0-9a-f]{32}$|^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def map_id(kind: str, spec: Dict[str, Any]) -> str:
+    """id карты: хеш канонического JSON параметров (одинаковый запрос - тот же id)"""
+    raw = json.dumps({"kind": kind, **spec}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def stable_offset(*parts: str, spread: float = 0.1) -> Tuple[float, float]:
+    """Детерминированное смещение (dlat, dlon) в пределах ±spread по хешу строк"""
+    digest = hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=8).digest()
+    lat = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+    lon = int.from_bytes(digest[4:], "big") / 0xFFFFFFFF
+    return (lat * 2 - 1) * spread, (lon * 2 - 1) * spread
+
+
+class MapCache:
+    """HTML карт в памяти (LRU, ограничение по байтам) поверх хранилища файлов карт.
+
+    Отрисовка одной карты выполняется один раз: одновременные запросы того же
+    id ждут ее под замком id, повторные отдаются из памяти или с диска.
+    """
+
+    def __init__(self, storage: MapStorage, max_bytes: int = MAP_CACHE_MAX_BYTES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._render_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _remember(self, map_id: str, html: bytes) -> None:
+        if len(html) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(map_id, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[map_id] = html
+            self._size += len(html)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _cached(self, map_id: str) -> Optional[bytes]:
+        with self._lock:
+            html = self._entries.get(map_id)
+            if html is not None:
+                self._entries.move_to_end(map_id)
+                self.hits += 1
+            return html
+
+    def get(self, map_id: str) -> Optional[bytes]:
+        """HTML карты из памяти или с диска, None - карты нет"""
+        html = self._cached(map_id)
+        if html is not None:
+            return html
+        html = self.storage.read(map_id)
+        if html is None:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(map_id, html)
+        return html
+
+    def get_or_render(self, map_id: str, render: Callable[[], str]) -> Tuple[bytes, bool]:
+        """HTML карты и признак, что она взята из кеша; render() вызывается только при промахе.
+
+        Блокирующий вызов: из async-кода - через пул потоков.
+        """
+        html = self.get(map_id)
+        if html is not None:
+            return html, True
+        with self._lock:
+            render_lock = self._render_locks.setdefault(map_id, threading.Lock())
+        try:
+            with render_lock:
+                html = self.get(map_id)
+                if html is not None:
+                    return html, True
+                html = render().encode("utf-8")
+                self.forget(self.storage.write(map_id, html))
+                self._remember(map_id, html)
+                with self._lock:
+                    self.renders += 1
+        finally:
+            with self._lock:
+                self._render_locks.pop(map_id, None)
+        return html, False
+
+    def forget(self, map_ids) -> None:
+        with self._lock:
+            for map_id in map_ids:
+                html = self._entries.pop(map_id, None)
+                if html is not None:
+                    self._size -= len(html)
+
+    def collect(self) -> int:
+        """Применяет квоты хранилища; удаленные карты уходят и из памяти"""
+        evicted = self.storage.evict()
+        self.forget(evicted)
+        return len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "renders": self.renders,
+            }
+
+
+_map_cache: Optional[MapCache] = None
+_gc_task: Optional[asyncio.Task] = None
+
+
+def get_map_cache() -> MapCache:
+    global _map_cache
+    if _map_cache is None:
+        _map_cache = MapCache(MapStorage(ensure_dirs()))
+    return _map_cache
+
+
+async def _gc_loop() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(get_map_cache().collect)
+        except Exception as e:
+            logger.error(f"Ошибка очистки карт: {e}")
+        await asyncio.sleep(MAP_GC_INTERVAL)
+
+
+def start_map_gc() -> None:
+    """Фоновая очистка каталога карт по квотам (первый проход строит индекс)"""
+    global _gc_task
+    if _gc_task is None and MAP_GC_INTERVAL > 0:
+        _gc_task = asyncio.create_task(_gc_loop())
+
+
+async def stop_map_gc() -> None:
+    global _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        await asyncio.gather(_gc_task, return_exceptions=True)
+        _gc_task = None
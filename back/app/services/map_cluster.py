@@ -0,0 +1,77 @@
+"""Кластеризация маркеров карты по сетке в пикселях заданного масштаба"""
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Размер ячейки сетки на экране (пиксели тайла 256x256)
+MAP_CLUSTER_CELL_PX = int(os.getenv("MAP_CLUSTER_CELL_PX", 60))
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.05112878
+
+
+@dataclass
+class Cluster:
+    lat: float
+    lon: float
+    count: int
+    # Номер маркера во входных данных (первого в ячейке)
+    first: int
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    avg_price: Optional[int] = None
+
+
+def _pixels(lats: np.ndarray, lons: np.ndarray, zoom: int):
+    """Координаты Web Mercator в пикселях мира на данном масштабе"""
+    scale = TILE_SIZE * (2 ** zoom)
+    x = (lons + 180.0) / 360.0 * scale
+    sin = np.sin(np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE)))
+    y = (0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def grid_clusters(lats: Sequence[float], lons: Sequence[float], prices: Sequence[Optional[int]],
+                  zoom: int, cell_px: int = MAP_CLUSTER_CELL_PX) -> List[Cluster]:
+    """Группирует маркеры, попавшие в одну ячейку сетки cell_px x cell_px на масштабе zoom.
+
+    Все вычисления векторные: ячейка каждого маркера, затем np.unique и
+    bincount для числа маркеров, центра ячейки и статистики цен. Порядок
+    кластеров - по первому маркеру, так что результат детерминирован.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats.size == 0:
+        return []
+    x, y = _pixels(lats, lons, zoom)
+    cells = np.floor(x / cell_px).astype(np.int64) * (1 << 32) + np.floor(y / cell_px).astype(np.int64)
+    _, first, inverse, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+
+    lat_mean = np.bincount(inverse, weights=lats) / counts
+    lon_mean = np.bincount(inverse, weights=lons) / counts
+
+    price = np.array([p if p else np.nan for p in prices], dtype=np.float64)
+    priced = ~np.isnan(price)
+    priced_counts = np.bincount(inverse, weights=priced, minlength=counts.size)
+    price_sum = np.bincount(inverse, weights=np.where(priced, price, 0.0), minlength=counts.size)
+    price_min = np.full(counts.size, np.inf)
+    price_max = np.full(counts.size, -np.inf)
+    np.minimum.at(price_min, inverse[priced], price[priced])
+    np.maximum.at(price_max, inverse[priced], price[priced])
+
+    clusters = []
+    for c in np.argsort(first, kind="stable"):
+        has_price = priced_counts[c] > 0
+        clusters.append(Cluster(
+            lat=float(lat_mean[c]),
+            lon=float(lon_mean[c]),
+            count=int(counts[c]),
+            first=int(first[c]),
+            min_price=int(price_min[c]) if has_price else None,
+            max_price=int(price_max[c]) if has_price else None,
+            avg_price=int(np.floor(price_sum[c] / priced_counts[c] + 0.5)) if has_price else None,
+        ))
+    return clusters
@@ -0,0 +1,164 @@
+"""Файлы карт на диске: индекс, квоты по объему и возрасту, вытеснение"""
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Квоты каталога карт: общий объем (байт) и срок с последнего обращения (секунды)
+MAP_STORAGE_MAX_BYTES = int(os.getenv("MAP_STORAGE_MAX_BYTES", 512 * 1024 * 1024))
+MAP_STORAGE_MAX_AGE = float(os.getenv("MAP_STORAGE_MAX_AGE", 7 * 24 * 3600))
+
+
+@dataclass
+class _Entry:
+    path: Path
+    size: int
+    accessed: float
+
+
+class MapStorage:
+    """Каталог HTML-файлов карт с индексом в памяти.
+
+    Файлы раскладываются по подкаталогам по первым двум символам id, чтобы
+    каталог не превращался в одну огромную плоскую папку. Индекс (id -> путь,
+    размер, время последнего обращения) строится одним проходом по каталогу
+    при первом обращении; дальше наличие карты проверяется по индексу, без
+    обращений к файловой системе. Индекс упорядочен по давности обращения:
+    при превышении квоты объема удаляются самые давно не открывавшиеся карты,
+    по квоте возраста - не открывавшиеся дольше max_age.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = MAP_STORAGE_MAX_BYTES,
+                 max_age: float = MAP_STORAGE_MAX_AGE):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._index: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    def _path(self, map_id: str) -> Path:
+        return self.directory / map_id[:2] / f"{map_id}.html"
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            entries: List[Tuple[str, _Entry]] = []
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Корень (карты до раскладки по подкаталогам) и подкаталоги первого уровня
+            dirs = [self.directory] + [Path(e.path) for e in os.scandir(self.directory) if e.is_dir()]
+            for directory in dirs:
+                for entry in os.scandir(directory):
+                    if not entry.is_file():
+                        continue
+                    if entry.name.endswith(".tmp"):
+                        # Недописанный файл прерванной записи
+                        Path(entry.path).unlink(missing_ok=True)
+                        continue
+                    if not entry.name.endswith(".html"):
+                        continue
+                    st = entry.stat()
+                    entries.append((entry.name[:-5], _Entry(Path(entry.path), st.st_size, st.st_mtime)))
+            entries.sort(key=lambda pair: pair[1].accessed)
+            for map_id, entry in entries:
+                self._index[map_id] = entry
+                self._bytes += entry.size
+            self._loaded = True
+        logger.info(f"Карты: в индексе {len(entries)} файлов, {self._bytes / 2**20:.1f} МБ")
+
+    def __contains__(self, map_id: str) -> bool:
+        self._ensure_loaded()
+        with self._lock:
+            return map_id in self._index
+
+    def read(self, map_id: str) -> Optional[bytes]:
+        """Содержимое карты или None; обращение продлевает жизнь файла"""
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._index.get(map_id)
+            if entry is None:
+                return None
+            entry.accessed = time.time()
+            self._index.move_to_end(map_id)
+        try:
+            return entry.path.read_bytes()
+        except FileNotFoundError:
+            # Файл удалили в обход индекса
+            self._drop(map_id)
+            return None
+
+    def write(self, map_id: str, html: bytes) -> List[str]:
+        """Сохраняет карту; при превышении квоты объема сразу вытесняет старые (их id - в ответе)"""
+        self._ensure_loaded()
+        path = self._path(map_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Через временный файл, чтобы читатель не увидел недописанную карту
+        tmp = path.with_name(f".{map_id}.tmp")
+        tmp.write_bytes(html)
+        os.replace(tmp, path)
+        with self._lock:
+            old = self._index.pop(map_id, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._index[map_id] = _Entry(path, len(html), time.time())
+            self._bytes += len(html)
+            over_quota = self._bytes > self.max_bytes
+        return self.evict() if over_quota else []
+
+    def _drop(self, map_id: str) -> None:
+        with self._lock:
+            entry = self._index.pop(map_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        """Удаляет карты сверх квот возраста и объема; возвращает их id"""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        victims: List[Tuple[str, _Entry]] = []
+        with self._lock:
+            # Индекс упорядочен по давности обращения: старые - в начале
+            while self._index:
+                map_id, entry = next(iter(self._index.items()))
+                expired = self.max_age > 0 and entry.accessed < now - self.max_age
+                if not expired and self._bytes <= self.max_bytes:
+                    break
+                del self._index[map_id]
+                self._bytes -= entry.size
+                victims.append((map_id, entry))
+            self.evicted_files += len(victims)
+            self.evicted_bytes += sum(entry.size for _, entry in victims)
+        for _, entry in victims:
+            try:
+                entry.path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить карту {entry.path}: {e}")
+        if victims:
+            logger.info(f"Карты: удалено {len(victims)} файлов")
+        return [map_id for map_id, _ in victims]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_sec": self.max_age,
+                "usage": round(self._bytes / self.max_bytes, 4) if self.max_bytes else 0.0,
+                "evicted_files": self.evicted_files,
+                "evicted_bytes": self.evicted_bytes,
+                "indexed": self._loaded,
+            }
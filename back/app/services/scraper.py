@@ -0,0 +1,148 @@
+"""Единая точка запуска парсинга для API и бота"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from app.parsers.krisha_parser import KrishaParser
+from app.services.cache import FRESH, STALE, TTLCache, normalize_url
+from app.services.executor import get_scrape_executor
+from app.services.singleflight import SingleFlight
+from app.services.store import save_items
+
+logger = logging.getLogger(__name__)
+
+# Кеш результатов: повторный парсинг той же выдачи отдается из памяти
+result_cache = TTLCache(
+    maxsize=int(os.getenv("SCRAPE_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("SCRAPE_CACHE_TTL", 300)),
+    stale_ttl=float(os.getenv("SCRAPE_CACHE_STALE_TTL", 0)),
+)
+
+# Одновременные запросы одной выдачи делят одну загрузку и разбор
+inflight = SingleFlight()
+
+_revalidating: Set[str] = set()
+_background: Set[asyncio.Task] = set()
+
+
+def _parse_and_store(parser: KrishaParser, result, url: str,
+                     on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    items, _ = parser.parse_fetched(result, url, on_item)
+    save_items(items)
+    return items
+
+
+async def _scrape(url: str, verify_ssl: bool,
+                  on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """Загружает страницу асинхронно (условным GET) и разбирает HTML в пуле потоков.
+
+    Разобранные объявления сохраняются в хранилище; при 304 они там уже есть.
+    """
+    parser = KrishaParser(verify_ssl=verify_ssl)
+    result = await parser.fetch_conditional_async(url)
+    if result is None:
+        raise RuntimeError("Не удалось получить страницу. Проверь ссылку/доступ/SSL.")
+    if result.not_modified:
+        items, _ = parser.parse_fetched(result, url, on_item)
+        return items
+    return await get_scrape_executor().run(_parse_and_store, parser, result, url, on_item)
+
+
+async def _scrape_and_cache(key: str, url: str, verify_ssl: bool,
+                            on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    items = await _scrape(url, verify_ssl, on_item)
+    result_cache.set(key, items)
+    return items
+
+
+def _flight_key(key: str, verify_ssl: bool) -> Tuple[str, bool]:
+    return key, verify_ssl
+
+
+async def _revalidate(key: str, url: str, verify_ssl: bool) -> None:
+    try:
+        await inflight.do(_flight_key(key, verify_ssl), lambda: _scrape_and_cache(key, url, verify_ssl))
+    except Exception as e:
+        logger.warning(f"Фоновое обновление кеша не удалось ({url}): {e}")
+    finally:
+        _revalidating.discard(key)
+
+
+def _schedule_revalidation(key: str, url: str, verify_ssl: bool) -> None:
+    if key in _revalidating:
+        return
+    _revalidating.add(key)
+    task = asyncio.create_task(_revalidate(key, url, verify_ssl))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _from_cache(key: str, url: str, verify_ssl: bool) -> Optional[List[Dict]]:
+    items, state = result_cache.lookup(key)
+    if state == STALE:
+        # stale-while-revalidate: отдаем старое, обновляем в фоне
+        _schedule_revalidation(key, url, verify_ssl)
+    if state in (FRESH, STALE):
+        return items
+    return None
+
+
+async def scrape_url(url: str, verify_ssl: bool = True, use_cache: bool = True) -> List[Dict]:
+    """Объявления со страницы с учетом кеша результатов.
+
+    Одновременные вызовы для одного нормализованного URL ждут одну загрузку.
+    """
+    key = normalize_url(url)
+    if use_cache:
+        items = _from_cache(key, url, verify_ssl)
+        if items is not None:
+            return [dict(item) for item in items]
+
+    items = await inflight.do(_flight_key(key, verify_ssl), lambda: _scrape_and_cache(key, url, verify_ssl))
+    return [dict(item) for item in items]
+
+
+_DONE = object()
+
+
+async def stream_url(url: str, verify_ssl: bool = True, use_cache: bool = True) -> AsyncIterator[Dict]:
+    """Объявления со страницы по одному, сразу после разбора каждой карточки.
+
+    Из кеша и при 304 объявления отдаются без разбора. Если та же страница
+    уже загружается, поток ждет ее и отдает готовый результат. Разбор
+    доводится до конца, даже если клиент отключился: результат попадает в
+    кеш и хранилище.
+    """
+    key = normalize_url(url)
+    if use_cache:
+        items = _from_cache(key, url, verify_ssl)
+        if items is not None:
+            for item in items:
+                yield dict(item)
+            return
+
+    flight_key = _flight_key(key, verify_ssl)
+    shared = inflight.join(flight_key)
+    if shared is not None:
+        for item in await asyncio.shield(shared):
+            yield dict(item)
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_item(item: Dict) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, dict(item))
+
+    task = inflight.start(flight_key, _scrape_and_cache(key, url, verify_ssl, on_item))
+    task.add_done_callback(lambda _: queue.put_nowait(_DONE))
+
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            break
+        yield item
+    # Ошибку загрузки или разбора пробрасываем после уже отданных объявлений
+    task.result()
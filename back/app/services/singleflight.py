@@ -0,0 +1,53 @@
+"""Объединение одновременных одинаковых запросов (single-flight)"""
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """Одна выполняющаяся задача на ключ, остальные вызовы ждут ее результата.
+
+    Задача живет отдельно от вызвавшего: отмена любого из ожидающих
+    (например, отключение клиента) не прерывает ее для остальных.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: Hashable) -> Optional[asyncio.Task]:
+        """Уже выполняющаяся задача для ключа, если есть"""
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        self.coalesced += 1
+        return task
+
+    def start(self, key: Hashable, coro: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks[key] = task
+        self.started += 1
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Ошибку получают ожидающие; если их не осталось, не шумим в лог
+            task.exception()
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат factory() для ключа, общий для одновременных вызовов"""
+        task = self.join(key) or self.start(key, factory())
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.started + self.coalesced
+        return {
+            "in_flight": len(self._tasks),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,336 @@
+"""Постоянное хранилище объявлений (SQLite в режиме WAL)"""
+from __future__ import annotations
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.parsers.dedup import listing_id, listing_key
+from app.parsers.krisha_parser import now_str
+
+logger = logging.getLogger(__name__)
+
+LISTINGS_DB_PATH = os.getenv("LISTINGS_DB_PATH", "data/listings.db")
+
+# Поля объявления в том же виде, что отдает парсер
+ITEM_FIELDS = (
+    "marketplace", "title", "price", "description", "location",
+    "district", "area", "rooms", "url", "scraped_at",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    listing_id TEXT,
+    marketplace TEXT NOT NULL,
+    title TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    description TEXT,
+    location TEXT,
+    district TEXT,
+    area REAL,
+    rooms INTEGER,
+    url TEXT NOT NULL,
+    scraped_at TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_listings_location_district ON listings(location, district);
+CREATE INDEX IF NOT EXISTS idx_listings_price ON listings(price);
+CREATE INDEX IF NOT EXISTS idx_listings_rooms ON listings(rooms);
+CREATE INDEX IF NOT EXISTS idx_listings_area ON listings(area);
+CREATE INDEX IF NOT EXISTS idx_listings_last_seen ON listings(last_seen);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    key TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    seen_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_price_history_key ON price_history(key, seen_at);
+
+CREATE TABLE IF NOT EXISTS watch_queries (
+    query TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    polls INTEGER NOT NULL DEFAULT 0,
+    last_polled TEXT
+);
+CREATE TABLE IF NOT EXISTS watch_seen (
+    query TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    price INTEGER,
+    title TEXT,
+    url TEXT,
+    PRIMARY KEY (query, key)
+);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    url TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (chat_id, query)
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_query ON subscriptions(query);
+
+CREATE TRIGGER IF NOT EXISTS listings_price_new AFTER INSERT ON listings
+BEGIN
+    INSERT INTO price_history (key, price, seen_at) VALUES (new.key, new.price, new.last_seen);
+END;
+CREATE TRIGGER IF NOT EXISTS listings_price_changed AFTER UPDATE OF price ON listings
+WHEN old.price <> new.price
+BEGIN
+    INSERT INTO price_history (key, price, seen_at) VALUES (new.key, new.price, new.last_seen);
+END;
+"""
+
+UPSERT_SQL = """
+INSERT INTO listings (
+    key, listing_id, marketplace, title, price, description, location,
+    district, area, rooms, url, scraped_at, first_seen, last_seen
+) VALUES (
+    :key, :listing_id, :marketplace, :title, :price, :description, :location,
+    :district, :area, :rooms, :url, :scraped_at, :seen, :seen
+)
+ON CONFLICT(key) DO UPDATE SET
+    listing_id = excluded.listing_id,
+    marketplace = excluded.marketplace,
+    title = excluded.title,
+    price = excluded.price,
+    description = excluded.description,
+    location = excluded.location,
+    district = excluded.district,
+    area = excluded.area,
+    rooms = excluded.rooms,
+    url = excluded.url,
+    scraped_at = excluded.scraped_at,
+    last_seen = excluded.last_seen
+"""
+
+
+class ListingStore:
+    """Объявления с историей цен в SQLite.
+
+    Запись идет через upsert по ключу объявления, смена цены фиксируется
+    триггером в price_history. У каждого потока свое соединение; WAL позволяет
+    читать параллельно с записью, сама запись сериализуется блокировкой.
+    """
+
+    def __init__(self, path: str = LISTINGS_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Соединение используется только своим потоком, флаг нужен для close()
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def save(self, items: Iterable[Dict]) -> int:
+        """Upsert объявлений; возвращает число записанных объявлений"""
+        seen = now_str()
+        rows: Dict[str, Dict] = {}
+        for item in items:
+            key = listing_key(item)
+            # Вложенные карточки дают повторы одного объявления: берем первое
+            if key is None or key in rows:
+                continue
+            row = {name: item.get(name) for name in ITEM_FIELDS}
+            row.update(key=key, listing_id=listing_id(item["url"]), seen=seen)
+            rows[key] = row
+        if not rows:
+            return 0
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany(UPSERT_SQL, list(rows.values()))
+        return len(rows)
+
+    def search(
+        self,
+        location: Optional[str] = None,
+        district: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        rooms: Optional[int] = None,
+        min_area: Optional[float] = None,
+        max_area: Optional[float] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> List[Dict]:
+        """Сохраненные объявления по фильтрам, сначала недавно виденные"""
+        where, params = [], []
+        for clause, value in (
+            ("location = ?", location),
+            ("district = ?", district),
+            ("price >= ?", min_price),
+            ("price <= ?", max_price),
+            ("rooms = ?", rooms),
+            ("area >= ?", min_area),
+            ("area <= ?", max_area),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = "SELECT * FROM listings"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_seen DESC, key LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM listings WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def price_history(self, key: str) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT price, seen_at FROM price_history WHERE key = ? ORDER BY seen_at, rowid",
+            (key,),
+        )
+        return [dict(row) for row in rows]
+
+    def watch_state(self, query: str) -> Tuple[int, Dict[str, Dict]]:
+        """Число прошлых опросов запроса и известные по нему объявления"""
+        conn = self._connect()
+        row = conn.execute("SELECT polls FROM watch_queries WHERE query = ?", (query,)).fetchone()
+        seen = conn.execute(
+            "SELECT key, fingerprint, price, title, url FROM watch_seen WHERE query = ?", (query,)
+        )
+        return (row["polls"] if row else 0), {r["key"]: dict(r) for r in seen}
+
+    def save_watch(self, query: str, url: str, seen: List[Dict], removed: Iterable[str]) -> None:
+        """Обновляет снимок запроса: seen - строки watch_seen, removed - ключи на удаление"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT INTO watch_queries (query, url, polls, last_polled) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(query) DO UPDATE SET url = excluded.url, polls = polls + 1, "
+                "last_polled = excluded.last_polled",
+                (query, url, now_str()),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO watch_seen (query, key, fingerprint, price, title, url) "
+                "VALUES (:query, :key, :fingerprint, :price, :title, :url)",
+                [{**row, "query": query} for row in seen],
+            )
+            conn.executemany(
+                "DELETE FROM watch_seen WHERE query = ? AND key = ?",
+                [(query, key) for key in removed],
+            )
+
+    def watch_queries(self) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT q.query, q.url, q.polls, q.last_polled, COUNT(s.key) AS known "
+            "FROM watch_queries q LEFT JOIN watch_seen s ON s.query = q.query "
+            "GROUP BY q.query ORDER BY q.last_polled DESC"
+        )
+        return [dict(row) for row in rows]
+
+    def delete_watch(self, query: str) -> bool:
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM watch_seen WHERE query = ?", (query,))
+            cursor = conn.execute("DELETE FROM watch_queries WHERE query = ?", (query,))
+        return cursor.rowcount > 0
+
+    def subscribe(self, chat_id: int, query: str, url: str) -> bool:
+        """Подписывает чат на запрос; False, если подписка уже была"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO subscriptions (chat_id, query, url, created_at) VALUES (?, ?, ?, ?)",
+                (chat_id, query, url, now_str()),
+            )
+        return cursor.rowcount > 0
+
+    def unsubscribe(self, chat_id: int, query: Optional[str] = None) -> int:
+        """Отписывает чат от запроса или от всех запросов; возвращает число снятых подписок"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            if query is None:
+                cursor = conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+            else:
+                cursor = conn.execute(
+                    "DELETE FROM subscriptions WHERE chat_id = ? AND query = ?", (chat_id, query)
+                )
+        return cursor.rowcount
+
+    def chat_subscriptions(self, chat_id: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT query, url, created_at FROM subscriptions WHERE chat_id = ? ORDER BY created_at",
+            (chat_id,),
+        )
+        return [dict(row) for row in rows]
+
+    def subscribed_queries(self) -> List[Dict]:
+        """Уникальные запросы с подписчиками (URL - первой подписки)"""
+        rows = self._connect().execute(
+            "SELECT query, MIN(url) AS url, COUNT(*) AS subscribers FROM subscriptions GROUP BY query"
+        )
+        return [dict(row) for row in rows]
+
+    def subscribers(self, query: str) -> List[int]:
+        rows = self._connect().execute("SELECT chat_id FROM subscriptions WHERE query = ?", (query,))
+        return [row["chat_id"] for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        return {
+            "path": self.path,
+            "listings": conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0],
+            "price_points": conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0],
+            "subscriptions": conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+_store: Optional[ListingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_listing_store() -> ListingStore:
+    """Общее хранилище объявлений (LISTINGS_DB_PATH)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ListingStore(LISTINGS_DB_PATH)
+            logger.info(f"Хранилище объявлений: {LISTINGS_DB_PATH}")
+        return _store
+
+
+def save_items(items: List[Dict]) -> None:
+    """Сохраняет объявления; ошибка хранилища не прерывает парсинг"""
+    try:
+        get_listing_store().save(items)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить объявления: {e}")
+
+
+def close_listing_store() -> None:
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
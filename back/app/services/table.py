@@ -0,0 +1,160 @@
+"""Компактное колоночное хранение больших наборов объявлений"""
+from __future__ import annotations
+import json
+import math
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Колонки со словарным кодированием: значений мало, повторяются постоянно
+CODED_FIELDS = ("marketplace", "location", "district", "scraped_at")
+# Текстовые колонки: строки хранятся как есть, без обертки в dict
+TEXT_FIELDS = ("title", "description", "url")
+BASE_FIELDS = (
+    "marketplace", "title", "price", "description", "location",
+    "district", "area", "rooms", "url", "scraped_at",
+)
+_BASE_SET = frozenset(BASE_FIELDS)
+
+_NO_ROOMS = -1
+
+
+class _Dictionary:
+    """Словарь значений колонки: строка хранится один раз, в строке таблицы - ее номер"""
+    __slots__ = ("values", "_index")
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._index: Dict[Optional[str], int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self._index[value] = code
+        return code
+
+
+class ListingTable:
+    """Объявления по колонкам вместо списка dict.
+
+    Цена, площадь и комнаты лежат в типизированных массивах (без объекта на
+    значение), город, район, площадка и время парсинга закодированы номерами
+    в словаре строк. Поля сверх базового набора (например, после обогащения)
+    хранятся отдельно только для тех строк, где они есть. Наружу строки
+    отдаются dict-ами по требованию, колонки - numpy-массивами.
+    """
+
+    def __init__(self):
+        self._price = array("q")
+        self._area = array("d")
+        self._rooms = array("i")
+        self._codes = {name: array("i") for name in CODED_FIELDS}
+        self._dicts = {name: _Dictionary() for name in CODED_FIELDS}
+        self._text: Dict[str, List[str]] = {name: [] for name in TEXT_FIELDS}
+        self._extra: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict]) -> "ListingTable":
+        table = cls()
+        table.extend(items)
+        return table
+
+    def append(self, item: Dict) -> None:
+        self._price.append(int(item.get("price") or 0))
+        area = item.get("area")
+        self._area.append(math.nan if area is None else float(area))
+        rooms = item.get("rooms")
+        self._rooms.append(_NO_ROOMS if rooms is None else int(rooms))
+        for name in CODED_FIELDS:
+            self._codes[name].append(self._dicts[name].code(item.get(name)))
+        for name in TEXT_FIELDS:
+            self._text[name].append(item.get(name))
+        if not _BASE_SET.issuperset(item):
+            self._extra[len(self._price) - 1] = {
+                key: value for key, value in item.items() if key not in _BASE_SET
+            }
+
+    def extend(self, items: Iterable[Dict]) -> None:
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return len(self._price)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Строка таблицы в виде dict объявления"""
+        area = self._area[i]
+        rooms = self._rooms[i]
+        item = {
+            "marketplace": self._value("marketplace", i),
+            "title": self._text["title"][i],
+            "price": self._price[i],
+            "description": self._text["description"][i],
+            "location": self._value("location", i),
+            "district": self._value("district", i),
+            "area": None if math.isnan(area) else area,
+            "rooms": None if rooms == _NO_ROOMS else rooms,
+            "url": self._text["url"][i],
+            "scraped_at": self._value("scraped_at", i),
+        }
+        extra = self._extra.get(i)
+        if extra:
+            item.update(extra)
+        return item
+
+    def _value(self, name: str, i: int) -> Optional[str]:
+        return self._dicts[name].values[self._codes[name][i]]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ListingTable index out of range")
+        return self.row(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, name: str) -> np.ndarray:
+        """Колонка как numpy-массив (копия: таблица может расти дальше), строковые - dtype=object"""
+        if name == "price":
+            return np.array(self._price, dtype=np.int64)
+        if name == "area":
+            return np.array(self._area, dtype=np.float64)
+        if name == "rooms":
+            rooms = np.array(self._rooms, dtype=np.int32)
+            return np.where(rooms == _NO_ROOMS, np.nan, rooms)
+        if name in self._codes:
+            codes = np.array(self._codes[name], dtype=np.int32)
+            return np.array(self._dicts[name].values, dtype=object)[codes]
+        if name in self._text:
+            return np.array(self._text[name], dtype=object)
+        raise KeyError(name)
+
+    def to_frame(self, columns: Sequence[str] = BASE_FIELDS):
+        """DataFrame из нужных колонок (для агрегатов), без промежуточных dict"""
+        return pd.DataFrame({name: self.column(name) for name in columns})
+
+    def iter_ndjson(self) -> Iterator[bytes]:
+        """Строки таблицы в NDJSON для выгрузки без моделей pydantic"""
+        for item in self:
+            yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def nbytes(self) -> int:
+        """Приблизительный объем памяти таблицы, байт"""
+        size = sum(a.buffer_info()[1] * a.itemsize for a in (self._price, self._area, self._rooms))
+        for name in CODED_FIELDS:
+            size += self._codes[name].buffer_info()[1] * 4
+            size += sum(sys.getsizeof(v) for v in self._dicts[name].values)
+        for values in self._text.values():
+            size += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+        size += sum(sys.getsizeof(extra) for extra in self._extra.values())
+        return size
@@ -0,0 +1,167 @@
+"""Отслеживание выдачи: только новые, снятые и подешевевшие/подорожавшие объявления"""
+from __future__ import annotations
+import hashlib
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.parsers.dedup import listing_key
+from app.parsers.krisha_parser import KrishaParser, page_url
+from app.services.cache import normalize_url
+from app.services.crawler import CRAWL_MAX_PAGES, fetch_page
+from app.services.executor import get_scrape_executor
+from app.services.singleflight import SingleFlight
+from app.services.store import get_listing_store
+
+logger = logging.getLogger(__name__)
+
+# Каждый N-й опрос проходит всю выдачу, чтобы заметить снятые объявления
+WATCH_FULL_SCAN_EVERY = int(os.getenv("WATCH_FULL_SCAN_EVERY", 10))
+# Верхняя граница страниц за один опрос
+WATCH_MAX_PAGES = int(os.getenv("WATCH_MAX_PAGES", CRAWL_MAX_PAGES))
+# Граница для полного прохода: снятые объявления видны, только если пройдена вся выдача
+WATCH_FULL_SCAN_MAX_PAGES = int(os.getenv("WATCH_FULL_SCAN_MAX_PAGES", 1000))
+
+_polls = SingleFlight()
+
+
+def fingerprint(item: Dict) -> str:
+    """Отпечаток содержимого объявления: цена и заголовок"""
+    raw = f"{item.get('price')}|{item.get('title')}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def watch_query(url: str, scope: str = "") -> str:
+    """Ключ запроса: нормализованный URL выдачи без номера страницы.
+
+    scope разделяет снимки разных потребителей (API и подписки бота),
+    чтобы опрос одного не съедал изменения другого.
+    """
+    query = normalize_url(page_url(url, 1))
+    return f"{scope}|{query}" if scope else query
+
+
+@dataclass
+class WatchDiff:
+    query: str
+    url: str
+    # Первый опрос запроса: все объявления считаются новыми
+    initial: bool = False
+    # Пройдена вся выдача (только тогда известны снятые объявления)
+    complete: bool = False
+    # Обход остановлен лимитом страниц раньше конца выдачи
+    truncated: bool = False
+    # Снятые объявления проверялись: пустой removed значит "ничего не снято"
+    removals_checked: bool = False
+    pages_fetched: int = 0
+    new: List[Dict] = field(default_factory=list)
+    price_changed: List[Dict] = field(default_factory=list)
+    removed: List[Dict] = field(default_factory=list)
+    known: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.new or self.price_changed or self.removed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+async def poll(url: str, verify_ssl: bool = True, max_pages: Optional[int] = None,
+               full: bool = False, scope: str = "") -> WatchDiff:
+    """Опрашивает выдачу и возвращает изменения с прошлого опроса.
+
+    Страницы загружаются по порядку; обход останавливается на первой
+    странице, где все объявления уже известны и не изменились. Снятые
+    объявления определяются только при полном проходе (full, первый опрос
+    или каждый WATCH_FULL_SCAN_EVERY-й). Одновременные опросы одного
+    запроса объединяются.
+    """
+    query = watch_query(url, scope)
+    return await _polls.do(
+        (query, verify_ssl),
+        lambda: _poll(query, url, verify_ssl, max_pages, full),
+    )
+
+
+async def _poll(query: str, url: str, verify_ssl: bool, max_pages: Optional[int],
+                full: bool) -> WatchDiff:
+    executor = get_scrape_executor()
+    store = get_listing_store()
+    polls, known = await executor.run(store.watch_state, query)
+    diff = WatchDiff(query=query, url=url, initial=polls == 0)
+    full = full or diff.initial or (WATCH_FULL_SCAN_EVERY > 0 and polls % WATCH_FULL_SCAN_EVERY == 0)
+    cap = WATCH_FULL_SCAN_MAX_PAGES if full else WATCH_MAX_PAGES
+    limit = min(max_pages or cap, cap)
+
+    parser = KrishaParser(verify_ssl=verify_ssl)
+    seen: Dict[str, Dict] = {}
+    last_page = 1
+    page = 0
+    failed = False
+    while page < min(last_page, limit):
+        page += 1
+        try:
+            items, page_last = await fetch_page(parser, page_url(url, page))
+        except Exception as e:
+            # Ошибка первой страницы - ошибка опроса, дальше - просто неполный проход
+            if page == 1:
+                raise
+            logger.warning(f"Опрос {query}: страница {page} не загружена: {e}")
+            failed = True
+            break
+        diff.pages_fetched += 1
+        if page == 1:
+            last_page = page_last
+        page_unchanged = True
+        for item in items:
+            key = listing_key(item)
+            if key is None or key in seen:
+                continue
+            row = {
+                "key": key,
+                "fingerprint": fingerprint(item),
+                "price": item["price"],
+                "title": item["title"],
+                "url": item["url"],
+            }
+            seen[key] = row
+            before = known.get(key)
+            if before is None:
+                page_unchanged = False
+                diff.new.append(item)
+            elif before["fingerprint"] != row["fingerprint"]:
+                page_unchanged = False
+                if before["price"] != row["price"]:
+                    diff.price_changed.append({**item, "old_price": before["price"]})
+        if page_unchanged and items and not full:
+            break
+
+    diff.complete = not failed and page >= last_page
+    diff.truncated = not failed and page >= limit and last_page > limit
+    if full and diff.truncated:
+        # Объявления за пределами лимита не видны: отсутствие не значит снятие
+        logger.warning(f"Опрос {query}: выдача длиннее {limit} страниц, снятые объявления не проверены")
+    removed = []
+    if diff.complete and not diff.initial:
+        removed = [key for key in known if key not in seen]
+        diff.removed = [known[key] for key in removed]
+        diff.removals_checked = True
+    diff.known = len(known) + len([key for key in seen if key not in known]) - len(removed)
+
+    await executor.run(store.save_watch, query, url, list(seen.values()), removed)
+    logger.info(
+        f"Опрос {query}: страниц {diff.pages_fetched}, новых {len(diff.new)}, "
+        f"цена изменилась {len(diff.price_changed)}, снято {len(diff.removed)}"
+    )
+    return diff
+
+
+async def list_watches() -> List[Dict]:
+    return await get_scrape_executor().run(get_listing_store().watch_queries)
+
+
+async def forget(url: str) -> bool:
+    """Удаляет снимок запроса; следующий опрос снова будет первым"""
+    return await get_scrape_executor().run(get_listing_store().delete_watch, watch_query(url))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Микробенчмарк извлечения одной карточки (без построения дерева)
+
+Страница разбирается один раз, затем многократно прогоняется
+извлечение полей по всем карточкам. Запуск из каталога back/:
+    python benchmarks/bench_card.py [--repeat 30] [--backend lxml]
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.parsers.backends import available_backends  # noqa: E402
+from app.parsers.krisha_parser import CARD_SELECTOR, KrishaParser  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+PAGE_URL = "https://krisha.kz/arenda/kvartiry/almaty/"
+
+
+def bench_cards(parser: KrishaParser, html: bytes, repeat: int):
+    """CPU-время на карточку, мкс (медиана по повторам) и число карточек"""
+    backend = parser.backend
+    doc = backend.parse(html)
+    cards = backend.select(doc, CARD_SELECTOR)
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        for card in cards:
+            parser._extract_card(card, PAGE_URL, backend)
+        samples.append((time.process_time() - start) * 1e6 / len(cards))
+    return statistics.median(samples), len(cards)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=30, help="повторов на фикстуру")
+    ap.add_argument("--backend", action="append", help="HTML-бэкенд (по умолчанию все доступные)")
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'fixture':<32} {'backend':<12} {'per card, us':>13} {'cards':>6}")
+    for path in sorted(FIXTURES_DIR.glob("krisha_*.html")):
+        html = path.read_bytes()
+        for backend in args.backend or available_backends():
+            per_card, count = bench_cards(KrishaParser(backend=backend), html, args.repeat)
+            print(f"{path.name:<32} {backend:<12} {per_card:>13.1f} {count:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Пропускная способность пула парсинга и учет очереди при отмене вызовов
+
+Вызовы - time.sleep (как ожидание сети в парсере). После прогонов
+проверяется, что отмененные до старта вызовы не остаются в счетчике queued.
+Запуск из каталога back/:
+    python benchmarks/bench_executor.py [--calls 200] [--workers 4] [--sleep 0.01]
+Код возврата 1, если после отмен счетчик очереди не вернулся к нулю.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.executor import ScrapeExecutor  # noqa: E402
+
+
+async def throughput(workers: int, calls: int, delay: float) -> float:
+    executor = ScrapeExecutor(max_workers=workers, max_queue=calls)
+    start = time.perf_counter()
+    await asyncio.gather(*(executor.run(time.sleep, delay) for _ in range(calls)))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    return calls / elapsed
+
+
+async def check_cancel() -> bool:
+    """Один воркер занят, два вызова ждут в очереди и отменяются до старта"""
+    executor = ScrapeExecutor(max_workers=1, max_queue=10)
+    busy = asyncio.create_task(executor.run(time.sleep, 0.2))
+    await asyncio.sleep(0.05)
+    waiting = [asyncio.create_task(executor.run(time.sleep, 0.2)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    for task in waiting:
+        task.cancel()
+    await asyncio.gather(*waiting, return_exceptions=True)
+    await busy
+    stats = executor.stats()
+    executor.shutdown()
+    ok = stats["queued"] == 0 and stats["running"] == 0
+    print(f"[{'OK' if ok else 'ERROR'}] отмена в очереди: queued={stats['queued']}, running={stats['running']}")
+    return ok
+
+
+async def main_async(args) -> int:
+    print(f"{'workers':>8} {'calls/s':>9}")
+    for workers in (1, args.workers, args.workers * 2):
+        rate = await throughput(workers, args.calls, args.sleep)
+        print(f"{workers:>8} {rate:>9.0f}")
+    return 0 if await check_cancel() else 1
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--calls", type=int, default=200, help="вызовов на прогон")
+    ap.add_argument("--workers", type=int, default=4, help="размер пула")
+    ap.add_argument("--sleep", type=float, default=0.01, help="длительность вызова, с")
+    args = ap.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
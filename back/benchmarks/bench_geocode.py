@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Время геокодирования адреса объявления: разбор по индексу справочника и из кеша
+
+Запуск из каталога back/:
+    python benchmarks/bench_geocode.py [--count 100000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.geocoder import GeocodeCache, Gazetteer, Geocoder  # noqa: E402
+
+SAMPLES = [
+    {"location": "Алматы", "district": "Бостандыкский р-н"},
+    {"location": "Алматы", "district": "мкр Орбита-3", "address": "ул. Навои 208"},
+    {"location": "Алматы", "district": "Ауэзовский р-н", "address": "мкр Аксай-4, д. 12"},
+    {"location": "Астана", "district": "Есильский р-н", "address": "пр. Мангилик Ел 30"},
+    {"location": "Караганда", "district": "район имени Казыбек би"},
+    {"location": "Не указано", "district": "Не указано"},
+]
+
+
+def measure(geocoder: Geocoder, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        geocoder.geocode_item(SAMPLES[i % len(SAMPLES)])
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--count", type=int, default=100_000, help="число адресов")
+    args = ap.parse_args()
+
+    gazetteer = Gazetteer.load()
+    print(f"мест в справочнике: {len(gazetteer.places)}")
+    print(f"{'mode':<8} {'us/address':>11}")
+    print(f"{'index':<8} {measure(Geocoder(gazetteer), args.count):>11.1f}")
+    cached = Geocoder(gazetteer, GeocodeCache(":memory:", gazetteer.version))
+    print(f"{'cache':<8} {measure(cached, args.count):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
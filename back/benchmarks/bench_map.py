@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Размер HTML и время построения карты по режимам кластеризации
+
+Маркеры случайно (с фиксированным seed) разбросаны по Алматы.
+Запуск из каталога back/:
+    python benchmarks/bench_map.py [--sizes 1000,10000,50000] [--modes none,grid,fast]
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.routers.maps import MapMarker, MapRequest, _render_markers  # noqa: E402
+
+CENTER = (43.2220, 76.8512)
+
+
+def sample_markers(count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    return [
+        MapMarker(
+            lat=CENTER[0] + rnd.gauss(0, 0.05),
+            lon=CENTER[1] + rnd.gauss(0, 0.08),
+            title=f"{rnd.randint(1, 5)}-комнатная квартира · {rnd.randint(25, 150)} м²",
+            price=rnd.randint(100_000, 1_500_000),
+            url=f"https://krisha.kz/a/show/{700000000 + i}",
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="1000,10000,50000", help="число маркеров через запятую")
+    ap.add_argument("--modes", default="none,grid,fast", help="режимы кластеризации через запятую")
+    ap.add_argument("--zoom", type=int, default=12)
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'markers':>8} {'mode':<6} {'html, KB':>10} {'B/marker':>9} {'render, s':>10}")
+    for size in map(int, args.sizes.split(",")):
+        markers = sample_markers(size)
+        request = MapRequest(markers=markers, center_lat=CENTER[0], center_lon=CENTER[1], zoom=args.zoom)
+        for mode in args.modes.split(","):
+            start = time.perf_counter()
+            html = _render_markers(request, markers, mode).encode("utf-8")
+            elapsed = time.perf_counter() - start
+            print(f"{size:>8} {mode:<6} {len(html) / 1024:>10.0f} {len(html) / size:>9.0f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Память и время агрегатов: список dict, модели pydantic и ListingTable
+
+Объявления берутся из HTML-фикстур и размножаются до нужного числа
+(с разными ссылками и ценами). Память считается через tracemalloc.
+Запуск из каталога back/:
+    python benchmarks/bench_memory.py [--sizes 1000,10000,50000]
+"""
+import argparse
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.parsers.krisha_parser import KrishaParser  # noqa: E402
+from app.routers.parser import PropertyItem  # noqa: E402
+from app.services.analytics import compute_analytics  # noqa: E402
+from app.services.table import ListingTable  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+PAGE_URL = "https://krisha.kz/arenda/kvartiry/almaty/"
+
+
+def sample_items(count: int):
+    """count объявлений из фикстур: каждая копия со своей ссылкой и ценой"""
+    parser = KrishaParser()
+    base = []
+    for path in sorted(FIXTURES_DIR.glob("krisha_*.html")):
+        base.extend(parser.parse_html(path.read_bytes(), PAGE_URL))
+    items = []
+    for i in range(count):
+        item = dict(base[i % len(base)])
+        item["url"] = f"https://krisha.kz/a/show/{700000000 + i}"
+        item["title"] = f"{item['title']} #{i}"
+        item["price"] = item["price"] + i
+        items.append(item)
+    return items
+
+
+def measure(build):
+    """Прирост памяти (байт) после build() и время построения (мс)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = build()
+    elapsed = (time.perf_counter() - start) * 1000
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="1000,10000,50000", help="размеры выборок через запятую")
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'rows':>7} {'representation':<16} {'memory, MB':>11} {'B/row':>7} {'build, ms':>10} {'analytics, ms':>14}")
+    for size in map(int, args.sizes.split(",")):
+        # Исходные строки полей общие для всех представлений, меряем только обертку
+        source = sample_items(size)
+        dicts, dict_mem, dict_ms = measure(lambda: [dict(item) for item in source])
+        _, model_mem, model_ms = measure(lambda: [PropertyItem(**item) for item in source])
+        table, table_mem, table_ms = measure(lambda: ListingTable.from_items(source))
+        _, json_mem, json_ms = measure(lambda: json.dumps(source, ensure_ascii=False))
+
+        rows = [
+            ("dict", dict_mem, dict_ms, dicts),
+            ("pydantic", model_mem, model_ms, None),
+            ("ListingTable", table_mem, table_ms, table),
+            ("json", json_mem, json_ms, None),
+        ]
+        for name, mem, ms, data in rows:
+            analytics = ""
+            if data is not None:
+                start = time.perf_counter()
+                compute_analytics(data)
+                analytics = f"{(time.perf_counter() - start) * 1000:.1f}"
+            print(f"{size:>7} {name:<16} {mem / 2**20:>11.2f} {mem / size:>7.0f} {ms:>10.1f} {analytics:>14}")
+
+
+if __name__ == "__main__":
+    main()
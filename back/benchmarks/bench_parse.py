@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Микробенчмарк разбора страниц выдачи на сохраненных HTML-фикстурах
+
+Запуск из каталога back/:
+    python benchmarks/bench_parse.py [--repeat 50] [--backend lxml]
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.parsers.backends import available_backends  # noqa: E402
+from app.parsers.krisha_parser import KrishaParser  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+PAGE_URL = "https://krisha.kz/arenda/kvartiry/almaty/"
+
+
+def bench_fixture(parser: KrishaParser, html: bytes, repeat: int):
+    """CPU-время разбора одной страницы, мс (медиана и минимум)"""
+    samples = []
+    items = []
+    for _ in range(repeat):
+        start = time.process_time()
+        items = parser.parse_html(html, PAGE_URL)
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples), min(samples), len(items)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=50, help="повторов на фикстуру")
+    ap.add_argument("--backend", action="append", help="HTML-бэкенд (по умолчанию все доступные)")
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'fixture':<32} {'backend':<12} {'median, ms':>11} {'min, ms':>9} {'items':>6}")
+    for path in sorted(FIXTURES_DIR.glob("*.html")):
+        html = path.read_bytes()
+        for backend in args.backend or available_backends():
+            parser = KrishaParser(backend=backend)
+            median, best, count = bench_fixture(parser, html, args.repeat)
+            print(f"{path.name:<32} {backend:<12} {median:>11.2f} {best:>9.2f} {count:>6}")
+
+
+if __name__ == "__main__":
+    main()
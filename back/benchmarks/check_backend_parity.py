@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Проверка, что все HTML-бэкенды дают одинаковый результат на фикстурах
+
+Эталон - html.parser. Страницы выдачи - fixtures/*.html, страницы объявлений -
+fixtures/detail/*.html. Запуск из каталога back/:
+    python benchmarks/check_backend_parity.py
+Код возврата 1, если хотя бы один бэкенд разошелся с эталоном или эталон
+дал не то, что записано в EXPECTED_COUNTS и EXPECTED_DETAILS.
+"""
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.parsers.backends import available_backends  # noqa: E402
+from app.parsers.krisha_parser import KrishaParser  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DETAIL_DIR = FIXTURES_DIR / "detail"
+PAGE_URL = "https://krisha.kz/arenda/kvartiry/almaty/"
+DETAIL_URL = "https://krisha.kz/a/show/681234567"
+
+# Число объявлений на фикстуре: вложенные карточки и их фрагменты не дают
+# лишних объявлений, а отдельные карточки без ссылки не теряются
+EXPECTED_COUNTS = {
+    "edge_cases.html": 3,
+    "krisha_arenda_almaty.html": 20,
+    "krisha_prodazha_astana.html": 20,
+    "link_fallback.html": 2,
+}
+
+# Поля страницы объявления: None - поле не должно попасть в результат
+# (город и район без ключевых слов не выдумываются)
+EXPECTED_DETAILS = {
+    "krisha_show_almaty.html": {
+        "location": "Алматы", "district": "Медеуский р-н", "price": 40_000_000,
+        "rooms": 3, "floor": 7, "floors_total": 12, "year_built": 2015, "area": 80.5,
+        "lat": 43.2389, "lon": 76.9453,
+    },
+    "no_district.html": {
+        "location": None, "district": None, "price": 180_000,
+        "rooms": 2, "floor": 3, "floors_total": 9,
+    },
+}
+
+
+def extract(backend: str, html: bytes):
+    items, last_page = KrishaParser(backend=backend).parse_search_page(html, PAGE_URL)
+    for item in items:
+        item.pop("scraped_at", None)
+    return items, last_page
+
+
+def check_details(backends) -> bool:
+    """Страницы объявлений: совпадение с html.parser и ожидаемые поля"""
+    failed = False
+    for path in sorted(DETAIL_DIR.glob("*.html")):
+        html = path.read_bytes()
+        reference = KrishaParser(backend="html.parser").parse_detail(html, DETAIL_URL)
+        for field, want in EXPECTED_DETAILS.get(path.name, {}).items():
+            if reference.get(field) != want:
+                failed = True
+                print(f"[ERROR] detail/{path.name}: {field}={reference.get(field)!r}, ожидалось {want!r}")
+        for backend in backends:
+            if backend == "html.parser":
+                continue
+            result = KrishaParser(backend=backend).parse_detail(html, DETAIL_URL)
+            if result == reference:
+                print(f"[OK] detail/{path.name}: {backend} ({len(result)} полей)")
+                continue
+            failed = True
+            print(f"[ERROR] detail/{path.name}: {backend} отличается от html.parser")
+            for field in sorted(set(result) | set(reference)):
+                if result.get(field) != reference.get(field):
+                    print(f"   {field}: {result.get(field)!r} != {reference.get(field)!r}")
+    return failed
+
+
+def main() -> int:
+    logging.disable(logging.WARNING)
+    backends = available_backends()
+    print(f"Бэкенды: {', '.join(backends)}")
+    failed = check_details(backends)
+    for path in sorted(FIXTURES_DIR.glob("*.html")):
+        html = path.read_bytes()
+        reference = extract("html.parser", html)
+        expected = EXPECTED_COUNTS.get(path.name)
+        if expected is not None and len(reference[0]) != expected:
+            failed = True
+            print(f"[ERROR] {path.name}: html.parser дал {len(reference[0])} объявлений, ожидалось {expected}")
+        for backend in backends:
+            if backend == "html.parser":
+                continue
+            result = extract(backend, html)
+            if result == reference:
+                print(f"[OK] {path.name}: {backend} ({len(result[0])} объявлений)")
+                continue
+            failed = True
+            print(f"[ERROR] {path.name}: {backend} отличается от html.parser")
+            if result[1] != reference[1]:
+                print(f"   последняя страница: {result[1]} != {reference[1]}")
+            for i, (got, want) in enumerate(zip(result[0], reference[0])):
+                if got != want:
+                    print(f"   объявление #{i}: {got} != {want}")
+                    break
+            if len(result[0]) != len(reference[0]):
+                print(f"   количество: {len(result[0])} != {len(reference[0])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
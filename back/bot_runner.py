@@ -3,6 +3,11 @@ import asyncio
 import logging
 import os
 from dotenv import load_dotenv
+
+# Настройки модулей приложения читаются при импорте, поэтому .env загружаем раньше
+load_dotenv()
+
+from app.bot.alerts import start_alerts, stop_alerts
 from app.bot.bot import create_bot_application
 
 # Настройка логирования
@@ -11,8 +16,6 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-load_dotenv()
-
 async def main():
     """Главная функция для запуска бота"""
     application = create_bot_application()
@@ -29,6 +32,8 @@ async def main():
         drop_pending_updates=True
     )
     
+    start_alerts(application.bot)
+    
     logging.info("Бот запущен и готов к работе!")
     logging.info("Нажми Ctrl+C для остановки")
     
@@ -38,6 +43,7 @@ async def main():
     except KeyboardInterrupt:
         logging.info("Остановка бота...")
     finally:
+        await stop_alerts()
         await application.updater.stop()
         await application.stop()
         await application.shutdown()
@@ -6,17 +6,38 @@ import SearchBar from '@/components/SearchBar'
 import PropertyList from '@/components/PropertyList'
 import StatsCards from '@/components/StatsCards'
 import ChartsSection from '@/components/ChartsSection'
-import MapSection from '@/components/MapSection'
-import { PropertyItem } from '@/types'
+import { Analytics, PropertyItem } from '@/types'
 
 // Динамический импорт для избежания SSR проблем с Leaflet
 const MapSectionDynamic = dynamic(() => import('@/components/MapSection'), {
   ssr: false
 })
 
+// Читает поток NDJSON и передает события пачками по мере прихода данных
+async function readNdjson(body: ReadableStream<Uint8Array>, onEvents: (events: any[]) => void) {
+  const reader = body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done })
+    const lines = buffer.split('\n')
+    buffer = done ? '' : lines.pop() || ''
+    const events = lines.filter(line => line.trim()).map(line => JSON.parse(line))
+    if (events.length > 0) {
+      onEvents(events)
+    }
+    if (done) {
+      break
+    }
+  }
+}
+
 export default function Home() {
   const [properties, setProperties] = useState<PropertyItem[]>([])
+  const [analytics, setAnalytics] = useState<Analytics | null>(null)
   const [loading, setLoading] = useState(false)
+  const [streaming, setStreaming] = useState(false)
   const [selectedCity, setSelectedCity] = useState<string>('')
   const [selectedDistrict, setSelectedDistrict] = useState<string>('')
 
@@ -55,41 +76,70 @@ export default function Home() {
     }
   }, [])
 
+  const loadAnalytics = async (apiUrl: string, url: string) => {
+    // Повторный запрос той же страницы отдается из кеша бэкенда
+    try {
+      const response = await fetch(`${apiUrl}/api/analytics?url=${encodeURIComponent(url)}`)
+      if (!response.ok) {
+        throw new Error(`Ошибка сервера: ${response.status}`)
+      }
+      setAnalytics(await response.json())
+    } catch (error) {
+      console.error('Ошибка загрузки аналитики:', error)
+      setAnalytics(null)
+    }
+  }
+
   const handleSearch = async (url: string) => {
     setLoading(true)
+    setStreaming(true)
+    setAnalytics(null)
+    setProperties([])
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
-      console.log('Запрос к API:', `${apiUrl}/api/parser/scrape?url=${encodeURIComponent(url)}`)
+      const requestUrl = `${apiUrl}/api/parser/scrape?url=${encodeURIComponent(url)}&stream=ndjson`
+      console.log('Запрос к API:', requestUrl)
       
-      const response = await fetch(`${apiUrl}/api/parser/scrape?url=${encodeURIComponent(url)}`, {
-        method: 'GET',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-      })
+      const response = await fetch(requestUrl, { method: 'GET' })
       
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorText = await response.text()
         console.error('Ошибка ответа:', response.status, errorText)
         throw new Error(`Ошибка сервера: ${response.status} - ${errorText}`)
       }
       
-      const data = await response.json()
-      console.log('Ответ API:', data)
-      
-      if (data.success) {
-        setProperties(data.items || [])
-        if (data.items && data.items.length === 0) {
-          alert('Объявления не найдены. Проверьте URL или попробуйте другую страницу.')
+      // Объявления приходят по одному (NDJSON) и показываются сразу
+      let count = 0
+      let streamError = ''
+      await readNdjson(response.body, (events) => {
+        const batch: PropertyItem[] = []
+        for (const event of events) {
+          if (event.type === 'item') {
+            batch.push(event.item)
+          } else if (event.type === 'error') {
+            streamError = event.message
+          }
+        }
+        if (batch.length > 0) {
+          count += batch.length
+          setProperties(prev => [...prev, ...batch])
         }
+      })
+      setStreaming(false)
+      
+      if (streamError) {
+        alert('Ошибка при парсинге: ' + streamError)
+      } else if (count === 0) {
+        alert('Объявления не найдены. Проверьте URL или попробуйте другую страницу.')
       } else {
-        alert('Ошибка при парсинге: ' + (data.message || 'Неизвестная ошибка'))
+        await loadAnalytics(apiUrl, url)
       }
     } catch (error: any) {
       console.error('Error:', error)
       const errorMessage = error.message || 'Ошибка при подключении к серверу'
       alert(`Ошибка: ${errorMessage}\n\nУбедитесь, что бэкенд запущен на ${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}`)
     } finally {
+      setStreaming(false)
       setLoading(false)
     }
   }
@@ -117,9 +167,13 @@ export default function Home() {
 
         {properties.length > 0 && (
           <>
-            <StatsCards properties={properties} />
-            <ChartsSection properties={properties} />
-            <MapSectionDynamic properties={properties} />
+            {analytics && (
+              <>
+                <StatsCards analytics={analytics} />
+                <ChartsSection analytics={analytics} />
+              </>
+            )}
+            <MapSectionDynamic properties={properties} streaming={streaming} />
             <PropertyList properties={properties} />
           </>
         )}
@@ -1,6 +1,6 @@
 'use client'
 
-import { PropertyItem } from '@/types'
+import { Analytics } from '@/types'
 import {
   BarChart,
   Bar,
@@ -18,70 +18,17 @@ import {
 } from 'recharts'
 
 interface ChartsSectionProps {
-  properties: PropertyItem[]
+  analytics: Analytics
 }
 
 const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884d8', '#82ca9d']
 
-export default function ChartsSection({ properties }: ChartsSectionProps) {
-  // График по городам
-  const cityData = properties.reduce((acc, prop) => {
-    const city = prop.location || 'Не указано'
-    acc[city] = (acc[city] || 0) + 1
-    return acc
-  }, {} as Record<string, number>)
-
-  const cityChartData = Object.entries(cityData)
-    .map(([name, value]) => ({ name, value }))
-    .sort((a, b) => b.value - a.value)
-    .slice(0, 10)
-
-  // График распределения цен
-  const priceRanges = [
-    { range: '0-100k', min: 0, max: 100000 },
-    { range: '100k-300k', min: 100000, max: 300000 },
-    { range: '300k-500k', min: 300000, max: 500000 },
-    { range: '500k-1M', min: 500000, max: 1000000 },
-    { range: '1M+', min: 1000000, max: Infinity },
-  ]
-
-  const priceData = priceRanges.map(range => ({
-    range: range.range,
-    count: properties.filter(p => p.price >= range.min && p.price < range.max).length,
-  }))
-
-  // График по районам
-  const districtData = properties
-    .filter(p => p.district && p.district !== 'Не указано')
-    .reduce((acc, prop) => {
-      const district = prop.district
-      acc[district] = (acc[district] || 0) + 1
-      return acc
-    }, {} as Record<string, number>)
-
-  const districtChartData = Object.entries(districtData)
-    .map(([name, value]) => ({ name, value }))
-    .sort((a, b) => b.value - a.value)
-    .slice(0, 8)
-
-  // График средних цен по городам
-  const avgPriceByCity = properties.reduce((acc, prop) => {
-    const city = prop.location || 'Не указано'
-    if (!acc[city]) {
-      acc[city] = { total: 0, count: 0 }
-    }
-    acc[city].total += prop.price
-    acc[city].count += 1
-    return acc
-  }, {} as Record<string, { total: number; count: number }>)
-
-  const avgPriceData = Object.entries(avgPriceByCity)
-    .map(([name, data]) => ({
-      name,
-      avgPrice: Math.round(data.total / data.count),
-    }))
-    .sort((a, b) => b.avgPrice - a.avgPrice)
-    .slice(0, 10)
+export default function ChartsSection({ analytics }: ChartsSectionProps) {
+  // Группировки и гистограмма цен приходят готовыми с /api/analytics
+  const cityChartData = analytics.by_city
+  const priceData = analytics.price_ranges
+  const districtChartData = analytics.by_district
+  const avgPriceData = analytics.avg_price_by_city
 
   return (
     <div className="space-y-6 mb-6">
@@ -135,7 +82,7 @@ export default function ChartsSection({ properties }: ChartsSectionProps) {
               <XAxis dataKey="name" angle={-45} textAnchor="end" height={100} />
               <YAxis />
               <Tooltip formatter={(value) => `${value.toLocaleString('ru-KZ')} ₸`} />
-              <Line type="monotone" dataKey="avgPrice" stroke="#8884d8" strokeWidth={2} />
+              <Line type="monotone" dataKey="avg_price" stroke="#8884d8" strokeWidth={2} />
             </LineChart>
           </ResponsiveContainer>
         </div>
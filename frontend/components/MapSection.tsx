@@ -1,92 +1,178 @@
 'use client'
 
-import { useEffect, useState } from 'react'
-import { PropertyItem } from '@/types'
+import { useEffect, useRef, useState } from 'react'
+import { MapContainer, TileLayer, GeoJSON, useMap, useMapEvents } from 'react-leaflet'
+import L from 'leaflet'
+import 'leaflet/dist/leaflet.css'
 import axios from 'axios'
+import { MapFeatureCollection, MapPointProperties, PropertyItem } from '@/types'
 
 interface MapSectionProps {
   properties: PropertyItem[]
+  // Объявления еще приходят: карта запрашивается после окончания потока
+  streaming?: boolean
 }
 
-export default function MapSection({ properties }: MapSectionProps) {
-  const [mapUrl, setMapUrl] = useState<string>('')
+const DEFAULT_CENTER: [number, number] = [43.2220, 76.8512]
+const DEFAULT_ZOOM = 12
+
+function formatPrice(value: number) {
+  return `${value.toLocaleString('ru-RU')} ₸`
+}
+
+function escapeHtml(value: string) {
+  return value.replace(/[&<>"']/g, (c) => (
+    { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c] as string
+  ))
+}
+
+// Координаты объявления: с сервера (enrich) или по адресу и району (геокодер на сервере)
+function toMarker(prop: PropertyItem) {
+  const marker = { title: prop.title.substring(0, 50), price: prop.price, url: prop.url }
+  if (prop.lat != null && prop.lon != null) {
+    return { ...marker, lat: prop.lat, lon: prop.lon }
+  }
+  return { ...marker, location: prop.location, district: prop.district, address: prop.address }
+}
+
+function popupHtml(p: MapPointProperties) {
+  if (p.cluster) {
+    let html = `<b>Объявлений: ${p.count}</b>`
+    if (p.min_price != null && p.max_price != null && p.avg_price != null) {
+      html += `<br>Цена: ${formatPrice(p.min_price)} – ${formatPrice(p.max_price)}`
+      html += `<br>Средняя: ${formatPrice(p.avg_price)}`
+    }
+    return html
+  }
+  let html = `<b>${escapeHtml(p.title || '')}</b>`
+  if (p.price) html += `<br>Цена: ${formatPrice(p.price)}`
+  if (p.url) html += `<br><a href="${escapeHtml(p.url)}" target="_blank">Открыть</a>`
+  return html
+}
+
+function pointToLayer(feature: any, latlng: L.LatLng) {
+  const p: MapPointProperties = feature.properties
+  if (p.cluster) {
+    const size = Math.min(56, 26 + 6 * String(p.count).length)
+    return L.marker(latlng, {
+      icon: L.divIcon({
+        html: `<div style="width:${size}px;height:${size}px;line-height:${size}px;border-radius:50%;background:rgba(37,99,235,.8);color:#fff;text-align:center;font:bold 12px sans-serif">${p.count}</div>`,
+        className: '',
+        iconSize: [size, size],
+        iconAnchor: [size / 2, size / 2],
+      }),
+    })
+  }
+  return L.circleMarker(latlng, { radius: 7, color: '#1d4ed8', fillColor: '#3b82f6', fillOpacity: 0.9, weight: 2 })
+}
+
+function ZoomWatcher({ onZoom }: { onZoom: (zoom: number) => void }) {
+  useMapEvents({ zoomend: (e) => onZoom(e.target.getZoom()) })
+  return null
+}
+
+// bbox ответа: [minLon, minLat, maxLon, maxLat]
+function FitBounds({ bbox }: { bbox: [number, number, number, number] | null }) {
+  const map = useMap()
+  useEffect(() => {
+    if (!bbox) return
+    const [minLon, minLat, maxLon, maxLat] = bbox
+    map.fitBounds([[minLat, minLon], [maxLat, maxLon]], { padding: [20, 20], maxZoom: 16 })
+  }, [bbox, map])
+  return null
+}
+
+export default function MapSection({ properties, streaming = false }: MapSectionProps) {
+  const [data, setData] = useState<MapFeatureCollection | null>(null)
+  const [version, setVersion] = useState(0)
+  const [zoom, setZoom] = useState(DEFAULT_ZOOM)
   const [loading, setLoading] = useState(false)
+  // Рамка объявлений: карта подстраивается один раз на новый набор, не на каждый зум
+  const [bbox, setBbox] = useState<[number, number, number, number] | null>(null)
+  // Ответы по масштабу для текущего набора объявлений: повторный зум без запроса
+  const cache = useRef(new Map<number, MapFeatureCollection>())
+  const cachedFor = useRef<PropertyItem[] | null>(null)
+  const fittedFor = useRef<PropertyItem[] | null>(null)
 
   const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 
   useEffect(() => {
-    if (properties.length > 0) {
-      generateMap()
+    if (properties.length === 0 || streaming) return
+    if (cachedFor.current !== properties) {
+      cache.current.clear()
+      cachedFor.current = properties
+    }
+    const cached = cache.current.get(zoom)
+    if (cached) {
+      setData(cached)
+      setVersion((v) => v + 1)
+      return
     }
-  }, [properties])
 
-  const generateMap = async () => {
+    // Новый набор или зум отменяет запрос, ответ на который уже не нужен
+    const controller = new AbortController()
     setLoading(true)
-    try {
-      // Для демонстрации используем примерные координаты
-      // В реальном приложении нужно геокодировать адреса
-      const markers = properties.slice(0, 50).map((prop, index) => {
-        // Примерные координаты для Алматы (можно улучшить с помощью геокодинга)
-        const baseLat = 43.2220
-        const baseLon = 76.8512
-        // Небольшое случайное смещение для визуализации
-        const offset = 0.01
-        return {
-          lat: baseLat + (Math.random() - 0.5) * offset * 2,
-          lon: baseLon + (Math.random() - 0.5) * offset * 2,
-          title: prop.title.substring(0, 50),
-          price: prop.price,
-          url: prop.url,
+    axios
+      .post<MapFeatureCollection>(`${apiUrl}/api/maps/geojson`, {
+        markers: properties.map(toMarker),
+        zoom,
+        cluster: 'auto',
+      }, { signal: controller.signal })
+      .then((response) => {
+        cache.current.set(zoom, response.data)
+        setData(response.data)
+        setVersion((v) => v + 1)
+        if (fittedFor.current !== properties && response.data.bbox) {
+          fittedFor.current = properties
+          setBbox(response.data.bbox)
         }
       })
-
-      const response = await axios.post(`${apiUrl}/api/maps/generate`, {
-        markers,
-        center_lat: 43.2220,
-        center_lon: 76.8512,
-        zoom: 12,
+      .catch((error) => {
+        if (!axios.isCancel(error)) console.error('Error loading map data:', error)
       })
-
-      if (response.data.success) {
-        setMapUrl(`${apiUrl}${response.data.map_url}`)
-      }
-    } catch (error) {
-      console.error('Error generating map:', error)
-    } finally {
+      .finally(() => {
+        if (!controller.signal.aborted) setLoading(false)
+      })
+    return () => {
+      controller.abort()
       setLoading(false)
     }
-  }
+  }, [properties, streaming, zoom, apiUrl])
 
-  if (loading) {
-    return (
-      <div className="bg-white rounded-lg shadow-md p-4 mb-6">
-        <h3 className="text-lg font-semibold mb-4">Карта объявлений</h3>
-        <div className="h-96 flex items-center justify-center">
-          <p className="text-gray-500">Генерация карты...</p>
-        </div>
-      </div>
-    )
-  }
-
-  if (!mapUrl) {
+  if (properties.length === 0) {
     return null
   }
 
   return (
     <div className="bg-white rounded-lg shadow-md p-4 mb-6">
       <h3 className="text-lg font-semibold mb-4">Карта объявлений</h3>
-      <div className="h-96 rounded-lg overflow-hidden border">
-        <iframe
-          src={mapUrl}
-          className="w-full h-full"
-          style={{ border: 'none' }}
-          title="Карта объявлений"
-        />
+      <div className="h-96 rounded-lg overflow-hidden border relative">
+        <MapContainer center={DEFAULT_CENTER} zoom={DEFAULT_ZOOM} className="w-full h-full">
+          <TileLayer
+            attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a>'
+            url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
+          />
+          <ZoomWatcher onZoom={setZoom} />
+          <FitBounds bbox={bbox} />
+          {data && (
+            // GeoJSON в react-leaflet не обновляется по data, поэтому новый слой на каждый ответ
+            <GeoJSON
+              key={version}
+              data={data as any}
+              pointToLayer={pointToLayer}
+              onEachFeature={(feature, layer) => layer.bindPopup(popupHtml(feature.properties), { maxWidth: 300 })}
+            />
+          )}
+        </MapContainer>
+        {(loading || streaming) && (
+          <div className="absolute top-2 right-2 z-[1000] bg-white/90 rounded px-2 py-1 text-sm text-gray-500">
+            Загрузка...
+          </div>
+        )}
       </div>
       <p className="text-sm text-gray-500 mt-2">
-        Показано {Math.min(properties.length, 50)} объявлений на карте
+        Показано {properties.length} объявлений на карте
       </p>
     </div>
   )
 }
-
@@ -1,24 +1,19 @@
 'use client'
 
-import { PropertyItem } from '@/types'
+import { Analytics } from '@/types'
 
 interface StatsCardsProps {
-  properties: PropertyItem[]
+  analytics: Analytics
 }
 
-export default function StatsCards({ properties }: StatsCardsProps) {
+export default function StatsCards({ analytics }: StatsCardsProps) {
+  // Агрегаты считает сервер (/api/analytics)
   const stats = {
-    total: properties.length,
-    avgPrice: properties.length > 0
-      ? Math.round(properties.reduce((sum, p) => sum + p.price, 0) / properties.length)
-      : 0,
-    minPrice: properties.length > 0
-      ? Math.min(...properties.map(p => p.price))
-      : 0,
-    maxPrice: properties.length > 0
-      ? Math.max(...properties.map(p => p.price))
-      : 0,
-    cities: new Set(properties.map(p => p.location)).size,
+    total: analytics.summary.total,
+    avgPrice: analytics.summary.avg_price,
+    minPrice: analytics.summary.min_price,
+    maxPrice: analytics.summary.max_price,
+    cities: analytics.summary.cities,
   }
 
   const formatPrice = (price: number) => {
@@ -9,6 +9,9 @@ export interface PropertyItem {
   rooms?: number
   url: string
   scraped_at: string
+  address?: string
+  lat?: number
+  lon?: number
 }
 
 export interface CityInfo {
@@ -23,3 +26,44 @@ export interface LocationSearchResult {
   total: number
 }
 
+
+export interface NamedCount {
+  name: string
+  value: number
+}
+
+export interface Analytics {
+  summary: {
+    total: number
+    avg_price: number
+    min_price: number
+    max_price: number
+    cities: number
+  }
+  price_ranges: { range: string; count: number }[]
+  by_city: NamedCount[]
+  avg_price_by_city: { name: string; avg_price: number }[]
+  by_district: NamedCount[]
+}
+
+// Ответ /api/maps/geojson: точки объявлений и кластеры
+export interface MapPointProperties {
+  title?: string
+  price?: number | null
+  url?: string | null
+  cluster?: boolean
+  count?: number
+  min_price?: number | null
+  max_price?: number | null
+  avg_price?: number | null
+}
+
+export interface MapFeatureCollection {
+  type: 'FeatureCollection'
+  features: {
+    type: 'Feature'
+    geometry: { type: 'Point'; coordinates: [number, number] }
+    properties: MapPointProperties
+  }[]
+  bbox?: [number, number, number, number]
+}